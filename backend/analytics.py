@@ -0,0 +1,187 @@
+"""
+排练室使用情况统计
+分组统计在 SQL 中完成，只取回 (周几, 开始, 结束) 等分组后的少量行；
+按小时展开时间段、计算利用率和用户分布使用 NumPy 数组运算。
+结果按 (校区, 日期范围) 缓存 ANALYTICS_TTL 秒。
+管理后台概览（待激活用户、今日预约、未归还钥匙等计数）由几条聚合查询得到，缓存 SUMMARY_TTL 秒。
+"""
+
+from datetime import date
+
+import numpy as np
+from sqlalchemy import and_, case, func, or_
+
+from cache import SnapshotCache
+from models import db, Campus, EquipmentBorrow, Reservation, User
+from unavailable_rules import day_of_week_expression
+
+# 统计结果的缓存时间（秒）
+ANALYTICS_TTL = 300
+
+# 可预约的小时范围 [8, 22)
+FIRST_HOUR, LAST_HOUR = 8, 22
+HOURS = np.arange(FIRST_HOUR, LAST_HOUR)
+
+# 用户预约时长分布的分桶边界（小时）
+USAGE_BINS = [0, 2, 4, 8, 16, 32, 64, np.inf]
+
+# 返回的最活跃用户数
+TOP_USERS = 10
+
+# 管理后台概览的缓存时间（秒）
+SUMMARY_TTL = 30
+
+analytics_cache = SnapshotCache(ttl=ANALYTICS_TTL)
+summary_cache = SnapshotCache(ttl=SUMMARY_TTL)
+
+
+def weekday_occurrences(start, end):
+    """日期范围内每个星期几出现的天数，长度为 7 的数组"""
+    days = (end - start).days + 1
+    if days <= 0:
+        return np.zeros(7, dtype=np.int64)
+    first = (start.weekday() + 1) % 7
+    return np.bincount((first + np.arange(days)) % 7, minlength=7)
+
+
+def expand_hours(start_hours, end_hours):
+    """把每个时间段展开为可预约小时上的 0/1 矩阵，形状 (时间段数, len(HOURS))"""
+    return (HOURS >= start_hours[:, None]) & (HOURS < end_hours[:, None])
+
+
+def build_analytics(campus_id, start, end):
+    """统计指定校区（为空时为全部校区）和日期范围内的使用情况"""
+    weekday = day_of_week_expression(Reservation.date)
+    filters = [
+        Reservation.date >= start,
+        Reservation.date <= end,
+        Reservation.status == 'active'
+    ]
+    if campus_id:
+        filters.append(Reservation.campus_id == campus_id)
+
+    # 1. 按 (周几, 开始, 结束, 是否已过去) 分组，同时统计未领钥匙的数量，一次查询得到热力图和未到率所需数据
+    is_past = case((Reservation.date < date.today(), 1), else_=0)
+    no_show = func.sum(case((Reservation.key_picked_up == True, 0), else_=1))
+    groups = db.session.query(
+        weekday, Reservation.start_hour, Reservation.end_hour, is_past, func.count(), no_show
+    ).filter(*filters).group_by(weekday, Reservation.start_hour, Reservation.end_hour, is_past).all()
+
+    rows = np.array(groups, dtype=np.int64).reshape(-1, 6)
+    weekdays, starts, ends, past, counts, no_shows = rows.T
+
+    # 热力图：时间段展开为小时矩阵，按周几累加
+    booked = expand_hours(starts, ends) * counts[:, None]
+    heatmap = np.zeros((7, len(HOURS)), dtype=np.int64)
+    np.add.at(heatmap, weekdays, booked)
+
+    occurrences = weekday_occurrences(start, end)
+    utilization = np.divide(heatmap, occurrences[:, None],
+                            out=np.zeros(heatmap.shape), where=occurrences[:, None] > 0)
+
+    # 2. 未到率：已过去的日期中从未登记取钥匙的预约占比
+    past = past == 1
+    past_by_weekday = np.bincount(weekdays[past], weights=counts[past], minlength=7)
+    no_show_by_weekday = np.bincount(weekdays[past], weights=no_shows[past], minlength=7)
+    past_total = int(past_by_weekday.sum())
+
+    # 3. 用户分布：按用户分组求和后用 NumPy 计算分位数和分桶
+    user_rows = db.session.query(
+        Reservation.user_id,
+        func.sum(Reservation.end_hour - Reservation.start_hour),
+        func.count()
+    ).filter(*filters).group_by(Reservation.user_id).all()
+    user_ids = np.array([r[0] for r in user_rows], dtype=np.int64)
+    user_hours = np.array([r[1] for r in user_rows], dtype=np.float64)
+    user_counts = np.array([r[2] for r in user_rows], dtype=np.int64)
+
+    top = np.argsort(-user_hours, kind='stable')[:TOP_USERS]
+    names = dict(
+        db.session.query(User.id, User.name).filter(User.id.in_(user_ids[top].tolist())).all()
+    ) if len(top) else {}
+    histogram, _ = np.histogram(user_hours, bins=USAGE_BINS)
+
+    return {
+        'campus_id': campus_id,
+        'start_date': start.isoformat(),
+        'end_date': end.isoformat(),
+        'hours': HOURS.tolist(),
+        'heatmap': {
+            # 行：0=周日, ..., 6=周六；列：hours
+            'booked_hours': heatmap.tolist(),
+            'utilization': np.round(utilization, 4).tolist(),
+        },
+        'totals': {
+            'reservations': int(counts.sum()),
+            'booked_hours': int(heatmap.sum()),
+            'users': len(user_rows),
+        },
+        'no_show': {
+            'past_reservations': past_total,
+            'no_shows': int(no_show_by_weekday.sum()),
+            'rate': round(float(no_show_by_weekday.sum() / past_total), 4) if past_total else None,
+            'rate_by_weekday': [
+                round(float(n / p), 4) if p else None
+                for n, p in zip(no_show_by_weekday, past_by_weekday)
+            ],
+        },
+        'user_distribution': {
+            'mean_hours': round(float(user_hours.mean()), 2) if len(user_hours) else None,
+            'percentiles': {
+                str(p): float(v) for p, v in zip((50, 75, 90, 99), np.percentile(user_hours, [50, 75, 90, 99]))
+            } if len(user_hours) else {},
+            'histogram': [
+                {'min_hours': USAGE_BINS[i], 'max_hours': None if np.isinf(USAGE_BINS[i + 1]) else USAGE_BINS[i + 1],
+                 'users': int(n)}
+                for i, n in enumerate(histogram)
+            ],
+            'top_users': [
+                {'user_id': int(user_ids[i]), 'user_name': names.get(int(user_ids[i])),
+                 'hours': int(user_hours[i]), 'reservations': int(user_counts[i])}
+                for i in top
+            ],
+        },
+    }
+
+
+def build_admin_summary():
+    """管理后台概览：用户、今日预约、未归还钥匙和未归还设备的计数"""
+    today = date.today()
+
+    # 1. 用户：一次查询统计待激活和已启用的普通用户
+    pending, active = db.session.query(
+        func.sum(case((and_(User.is_admin == False, User.is_active == False), 1), else_=0)),
+        func.sum(case((and_(User.is_admin == False, User.is_active == True), 1), else_=0))
+    ).one()
+
+    # 2. 各校区今日预约数和已取未还的钥匙数（外连接，没有预约的校区计为 0）
+    key_outstanding = and_(Reservation.key_picked_up == True, Reservation.key_returned == False)
+    campus_rows = db.session.query(
+        Campus.id, Campus.name,
+        func.sum(case((Reservation.date == today, 1), else_=0)),
+        func.sum(case((key_outstanding, 1), else_=0))
+    ).outerjoin(Reservation, and_(
+        Reservation.campus_id == Campus.id,
+        Reservation.status == 'active',
+        or_(Reservation.date == today, key_outstanding)
+    )).group_by(Campus.id, Campus.name).order_by(Campus.id).all()
+
+    # 3. 未归还的设备
+    open_borrows = db.session.query(func.count(EquipmentBorrow.id)).filter(
+        EquipmentBorrow.status == 'borrowed'
+    ).scalar()
+
+    campuses = [
+        {'campus_id': campus_id, 'campus_name': name,
+         'today_reservations': int(today_count or 0), 'outstanding_keys': int(keys or 0)}
+        for campus_id, name, today_count, keys in campus_rows
+    ]
+    return {
+        'date': today.isoformat(),
+        'pending_activations': int(pending or 0),
+        'active_users': int(active or 0),
+        'today_reservations': sum(c['today_reservations'] for c in campuses),
+        'outstanding_keys': sum(c['outstanding_keys'] for c in campuses),
+        'open_borrows': open_borrows,
+        'campuses': campuses,
+    }
@@ -5,6 +5,8 @@ from datetime import timedelta
 import os
 
 from models import db, init_db
+from database import init_database
+from auth_claims import is_token_revoked
 from routes.auth import auth_bp
 from routes.reservation import reservation_bp
 from routes.admin import admin_bp
@@ -15,28 +17,31 @@ app = Flask(__name__)
 
 # Configuration
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///rehearsal.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET_KEY', 'jwt-secret-key-change-in-production')
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=24)
 
 # Email verification feature flag
 app.config['EMAIL_VERIFICATION_ENABLED'] = os.environ.get('EMAIL_VERIFICATION_ENABLED', 'false').lower() == 'true'
+# Reservation reminder / cancellation notice emails
+app.config['RESERVATION_NOTIFICATIONS_ENABLED'] = os.environ.get('RESERVATION_NOTIFICATIONS_ENABLED', 'false').lower() == 'true'
 
 # Initialize extensions
 CORS(app, resources={r"/api/*": {"origins": "*"}})
 jwt = JWTManager(app)
-db.init_app(app)
+jwt.token_in_blocklist_loader(is_token_revoked)
+init_database(app)
 
 # Initialize email service if enabled
-if app.config['EMAIL_VERIFICATION_ENABLED']:
+if app.config['EMAIL_VERIFICATION_ENABLED'] or app.config['RESERVATION_NOTIFICATIONS_ENABLED']:
     try:
         from email_service import init_mail
         init_mail(app)
-        print("Email verification enabled")
+        print(f"Email verification {'enabled' if app.config['EMAIL_VERIFICATION_ENABLED'] else 'disabled'}")
+        print(f"Reservation notifications {'enabled' if app.config['RESERVATION_NOTIFICATIONS_ENABLED'] else 'disabled'}")
     except Exception as e:
         print(f"Warning: Failed to initialize email service: {e}")
         app.config['EMAIL_VERIFICATION_ENABLED'] = False
+        app.config['RESERVATION_NOTIFICATIONS_ENABLED'] = False
 else:
     print("Email verification disabled")
 
@@ -0,0 +1,168 @@
+"""
+基于令牌声明的权限校验
+登录时把 is_admin、is_active 和用户的授权版本号 auth_version（ver）写入访问令牌，
+接口直接读取令牌中的声明判断权限，无需每次查询用户表。
+禁用/启用用户或修改角色时递增 auth_version，旧令牌的 ver 与当前版本不符即视为已撤销。
+当前版本号在进程内缓存：本进程的修改立即生效，其他进程最迟 AUTH_VERSION_TTL 秒后生效。
+
+当前用户的加载也集中在这里：current_user() 每个请求最多查询一次并缓存在 g 上；
+只读取资料的接口使用 current_user_profile()，从按用户 ID 的 LRU 快照中读取，
+快照在授权版本号变化、资料修改（invalidate）或超过 USER_PROFILE_TTL 秒后失效。
+"""
+
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from flask import g
+from flask_jwt_extended import create_access_token, get_jwt, get_jwt_identity
+
+from models import db, User
+
+# 版本号缓存时间（秒），用于兜底多进程部署下其他进程的修改
+AUTH_VERSION_TTL = 60
+
+# 用户资料快照的缓存时间（秒）和数量上限
+USER_PROFILE_TTL = 10
+USER_PROFILE_CACHE_SIZE = 1024
+
+AuthClaims = namedtuple('AuthClaims', ['is_admin', 'is_active'])
+ProfileSnapshot = namedtuple('ProfileSnapshot', ['profile', 'version', 'loaded_at'])
+
+
+class AuthVersionMap:
+    """用户 ID -> 当前授权版本号"""
+
+    def __init__(self, ttl=AUTH_VERSION_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._versions = {}  # user_id -> (version, loaded_at)
+
+    def get(self, user_id):
+        """当前版本号，用户不存在时返回 None"""
+        now = time.monotonic()
+        with self._lock:
+            cached = self._versions.get(user_id)
+            if cached and now - cached[1] < self.ttl:
+                return cached[0]
+
+        row = db.session.query(User.auth_version).filter(User.id == user_id).first()
+        version = None if row is None else (row[0] or 0)
+        with self._lock:
+            self._versions[user_id] = (version, now)
+        return version
+
+    def invalidate(self, user_ids=None):
+        """丢弃缓存的版本号（不传 user_ids 时全部丢弃），在修改提交后调用"""
+        with self._lock:
+            if user_ids is None:
+                self._versions.clear()
+            else:
+                for user_id in user_ids:
+                    self._versions.pop(user_id, None)
+
+
+auth_versions = AuthVersionMap()
+
+
+class UserProfileCache:
+    """用户 ID -> 资料快照（User.to_dict() 的结果），按最近使用淘汰"""
+
+    def __init__(self, ttl=USER_PROFILE_TTL, max_size=USER_PROFILE_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._snapshots = OrderedDict()  # user_id -> ProfileSnapshot
+
+    def get(self, user_id):
+        """返回用户资料，用户不存在时返回 None"""
+        now = time.monotonic()
+        # 版本号在加载前读取，加载期间发生的变更会使快照在下次访问时失效
+        version = auth_versions.get(user_id)
+        if version is None:
+            return None
+
+        with self._lock:
+            snapshot = self._snapshots.get(user_id)
+            if snapshot and snapshot.version == version and now - snapshot.loaded_at < self.ttl:
+                self._snapshots.move_to_end(user_id)
+                return snapshot.profile
+
+        user = current_user() if _is_current_user(user_id) else db.session.get(User, user_id)
+        if user is None:
+            return None
+        profile = user.to_dict()
+        with self._lock:
+            self._snapshots[user_id] = ProfileSnapshot(profile, version, now)
+            self._snapshots.move_to_end(user_id)
+            while len(self._snapshots) > self.max_size:
+                self._snapshots.popitem(last=False)
+        return profile
+
+    def invalidate(self, user_ids=None):
+        """丢弃快照（不传 user_ids 时全部丢弃），在资料修改提交后调用"""
+        with self._lock:
+            if user_ids is None:
+                self._snapshots.clear()
+            else:
+                for user_id in user_ids:
+                    self._snapshots.pop(user_id, None)
+
+
+user_profiles = UserProfileCache()
+
+
+def current_user_id():
+    return int(get_jwt_identity())
+
+
+def _is_current_user(user_id):
+    return 'current_user' in g and g.current_user is not None and g.current_user.id == user_id
+
+
+def current_user():
+    """当前请求的用户（ORM 对象，可修改），每个请求只查询一次；用户不存在时返回 None"""
+    if 'current_user' not in g:
+        g.current_user = db.session.get(User, current_user_id())
+    return g.current_user
+
+
+def current_user_profile():
+    """当前用户的资料（只读），优先从快照读取；用户不存在时返回 None"""
+    if 'current_user_profile' not in g:
+        g.current_user_profile = user_profiles.get(current_user_id())
+    return g.current_user_profile
+
+
+def create_user_token(user):
+    """创建带权限声明的访问令牌"""
+    return create_access_token(identity=str(user.id), additional_claims={
+        'is_admin': bool(user.is_admin),
+        'is_active': bool(user.is_active),
+        'ver': user.auth_version or 0
+    })
+
+
+def bump_auth_version(user):
+    """用户的权限或启用状态已变更，使其已签发的令牌失效（随当前事务提交）"""
+    user.auth_version = (user.auth_version or 0) + 1
+
+
+def is_token_revoked(jwt_header, jwt_payload):
+    """token_in_blocklist_loader：令牌的版本号与用户当前版本不符时视为已撤销"""
+    if 'ver' not in jwt_payload:
+        # 本功能上线前签发的令牌没有声明，由 current_claims() 回退查询数据库
+        return False
+    return auth_versions.get(int(jwt_payload['sub'])) != jwt_payload['ver']
+
+
+def current_claims():
+    """当前请求的权限声明"""
+    claims = get_jwt()
+    if 'ver' in claims:
+        return AuthClaims(claims['is_admin'], claims['is_active'])
+
+    user = current_user()
+    if not user:
+        return AuthClaims(False, False)
+    return AuthClaims(bool(user.is_admin), bool(user.is_active))
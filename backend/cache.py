@@ -0,0 +1,116 @@
+"""
+进程内版本化快照缓存
+读接口的序列化结果按 (作用域, 键) 缓存；写操作提交后调用 bump() 使该作用域的版本号递增，
+旧快照随即失效。快照同时设有较短的存活时间，用于兜底多进程部署下其他进程的写入。
+每个快照保存序列化后的 JSON 及其内容哈希（强 ETag），客户端携带 If-None-Match 命中时直接返回 304。
+"""
+
+import hashlib
+import threading
+import time
+from collections import namedtuple
+
+from flask import current_app, request
+
+from models import Campus
+
+# 快照最长存活时间（秒）
+DEFAULT_TTL = 10
+# 快照数上限：超过时先清理已过期的快照，仍超过则按构建时间淘汰最旧的快照
+# （键随筛选条件变化的接口会不断产生新快照）
+MAX_SNAPSHOTS = 1024
+
+Snapshot = namedtuple('Snapshot', ['payload', 'body', 'etag', 'version', 'built_at'])
+
+
+def campus_scope(campus_id):
+    """校区相关数据（预约、钥匙、不可预约时间）的缓存作用域"""
+    return ('campus', int(campus_id))
+
+
+class SnapshotCache:
+    """按作用域版本号失效的快照缓存"""
+
+    def __init__(self, ttl=DEFAULT_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._versions = {}   # scope -> version
+        self._snapshots = {}  # (scope, key) -> Snapshot，按构建先后排列
+
+    def version(self, scope):
+        with self._lock:
+            return self._versions.get(scope, 0)
+
+    def bump(self, scope):
+        """作用域内数据已变更：递增版本号并丢弃该作用域的所有快照"""
+        with self._lock:
+            self._versions[scope] = self._versions.get(scope, 0) + 1
+            for cache_key in [k for k in self._snapshots if k[0] == scope]:
+                del self._snapshots[cache_key]
+
+    def get_snapshot(self, scope, key, builder):
+        """返回缓存的快照，不存在、版本不符或已过期时调用 builder() 重建"""
+        now = time.monotonic()
+        with self._lock:
+            version = self._versions.get(scope, 0)
+            snapshot = self._snapshots.get((scope, key))
+            if snapshot and snapshot.version == version and now - snapshot.built_at < self.ttl:
+                return snapshot
+
+        # 版本号在构建前读取，构建期间发生的写入会使该快照在下次访问时失效
+        payload = builder()
+        body = current_app.json.dumps(payload)
+        etag = hashlib.sha1(body.encode('utf-8')).hexdigest()
+        snapshot = Snapshot(payload, body, etag, version, now)
+        with self._lock:
+            # 先删除再插入，字典顺序即构建先后
+            self._snapshots.pop((scope, key), None)
+            self._snapshots[(scope, key)] = snapshot
+            if len(self._snapshots) > MAX_SNAPSHOTS:
+                self._prune(now)
+        return snapshot
+
+    def _prune(self, now):
+        """清理已过期的快照，仍超过上限时淘汰最旧的快照（调用方持有锁）"""
+        for cache_key in [k for k, v in self._snapshots.items() if now - v.built_at >= self.ttl]:
+            del self._snapshots[cache_key]
+        while len(self._snapshots) > MAX_SNAPSHOTS:
+            del self._snapshots[next(iter(self._snapshots))]
+
+    def get(self, scope, key, builder):
+        """返回缓存的数据（未序列化）"""
+        return self.get_snapshot(scope, key, builder).payload
+
+    def clear(self):
+        with self._lock:
+            self._snapshots.clear()
+
+
+snapshot_cache = SnapshotCache()
+
+
+def build_campuses():
+    return [campus.to_dict() for campus in Campus.query.all()]
+
+
+def campus_exists(campus_id):
+    """按缓存的校区列表判断校区是否存在，公开接口据此拒绝未知校区，避免为任意 campus_id 缓存快照"""
+    return any(campus['id'] == campus_id for campus in snapshot_cache.get('campuses', None, build_campuses))
+
+
+def cached_json_response(scope, key, builder, cache=None):
+    """
+    返回带强 ETag 的 JSON 响应
+    If-None-Match 命中时返回 304，不执行查询和序列化；cache 默认为全局 snapshot_cache
+    """
+    snapshot = (cache or snapshot_cache).get_snapshot(scope, key, builder)
+
+    if request.if_none_match.contains(snapshot.etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = current_app.response_class(snapshot.body + '\n', mimetype='application/json')
+
+    response.set_etag(snapshot.etag)
+    # 允许缓存但每次使用前必须向服务器验证
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
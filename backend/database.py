@@ -0,0 +1,97 @@
+"""
+数据库引擎配置
+从环境变量读取连接地址和连接池参数；SQLite 连接建立时通过 PRAGMA 开启 WAL 等选项。
+设置 DATABASE_URL 为 postgresql://... 即可切换到 PostgreSQL，无需修改代码。
+"""
+
+import os
+from flask import g, has_request_context
+from sqlalchemy import event
+
+from models import db
+
+DEFAULT_DATABASE_URL = 'sqlite:///rehearsal.db'
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value not in (None, '') else default
+
+
+def configure_database(app):
+    """写入数据库相关配置（需在 db.init_app 之前调用）"""
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', DEFAULT_DATABASE_URL)
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+    # SQLite PRAGMA 选项
+    app.config['SQLITE_JOURNAL_MODE'] = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+    app.config['SQLITE_SYNCHRONOUS'] = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+    app.config['SQLITE_BUSY_TIMEOUT_MS'] = _env_int('SQLITE_BUSY_TIMEOUT_MS', 5000)
+    app.config['SQLITE_MMAP_SIZE'] = _env_int('SQLITE_MMAP_SIZE', 64 * 1024 * 1024)
+
+    # 开启后每个响应带 X-Query-Count 头，记录该请求执行的 SQL 语句数
+    app.config['SQL_QUERY_COUNT_HEADER'] = os.environ.get('SQL_QUERY_COUNT_HEADER', 'false').lower() == 'true'
+
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    engine_options = {'pool_pre_ping': True}
+
+    # 内存数据库使用单连接池，不支持连接池大小参数
+    if ':memory:' not in uri and uri not in ('sqlite://', 'sqlite:///'):
+        engine_options.update({
+            'pool_size': _env_int('DB_POOL_SIZE', 10),
+            'max_overflow': _env_int('DB_MAX_OVERFLOW', 20),
+            'pool_timeout': _env_int('DB_POOL_TIMEOUT', 30),
+            'pool_recycle': _env_int('DB_POOL_RECYCLE', 1800),
+        })
+
+    if uri.startswith('sqlite'):
+        # 驱动层等待时间与 busy_timeout 保持一致
+        engine_options['connect_args'] = {'timeout': app.config['SQLITE_BUSY_TIMEOUT_MS'] / 1000}
+
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options
+
+
+def init_database(app):
+    """初始化数据库扩展，并为 SQLite 注册连接 PRAGMA"""
+    configure_database(app)
+    db.init_app(app)
+
+    with app.app_context():
+        engine = db.engine
+        if app.config['SQL_QUERY_COUNT_HEADER']:
+            init_query_counter(app, engine)
+        if engine.dialect.name != 'sqlite':
+            return
+
+        # journal_mode=WAL 持久化在数据库文件中，读请求不再被写事务阻塞
+        pragmas = [
+            f"PRAGMA journal_mode={app.config['SQLITE_JOURNAL_MODE']}",
+            f"PRAGMA synchronous={app.config['SQLITE_SYNCHRONOUS']}",
+            f"PRAGMA busy_timeout={app.config['SQLITE_BUSY_TIMEOUT_MS']}",
+            f"PRAGMA mmap_size={app.config['SQLITE_MMAP_SIZE']}",
+        ]
+
+        @event.listens_for(engine, 'connect')
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for pragma in pragmas:
+                cursor.execute(pragma)
+            cursor.close()
+
+
+def init_query_counter(app, engine):
+    """统计每个请求执行的 SQL 语句数，通过 X-Query-Count 响应头返回"""
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def count_query(conn, cursor, statement, parameters, context, executemany):
+        if has_request_context():
+            g.query_count = g.get('query_count', 0) + 1
+
+    @app.before_request
+    def reset_query_count():
+        g.query_count = 0
+
+    @app.after_request
+    def add_query_count_header(response):
+        response.headers['X-Query-Count'] = str(g.get('query_count', 0))
+        return response
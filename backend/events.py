@@ -0,0 +1,186 @@
+"""
+校区变更事件推送（Server-Sent Events）
+预约和钥匙相关的写操作提交后调用 publish()，订阅该校区的连接收到精简的变更事件，在本地修补周视图，
+无需反复请求 /api/reservation/weekly。
+  - 每个校区保留最近 RING_SIZE 条事件，断线重连时按 Last-Event-ID 补发缺失的事件
+  - 每个订阅者有独立的有界队列，消费过慢时不阻塞写请求，而是通知客户端重新加载（reset 事件）
+  - 事件 ID 为 "进程标识-校区内序号"，进程重启或事件已被挤出缓冲区时同样返回 reset
+事件只在当前进程内分发，多进程部署时客户端仍依赖 ETag 条件请求兜底。
+"""
+
+import json
+import queue
+import threading
+import uuid
+from collections import deque, namedtuple
+
+# 每个校区保留的最近事件数
+RING_SIZE = 256
+# 每个订阅者的待发送事件上限
+SUBSCRIBER_QUEUE_SIZE = 64
+# 每个进程允许的订阅连接数（每个连接占用一个工作线程）
+MAX_SUBSCRIBERS = 200
+# 心跳间隔（秒），同时用于及时发现已断开的连接
+HEARTBEAT_INTERVAL = 15
+# 建议客户端的重连间隔（毫秒）
+RETRY_MS = 3000
+
+Event = namedtuple('Event', ['seq', 'id', 'type', 'data'])
+
+
+def format_event(event_type, data, event_id=None):
+    """按 SSE 格式编码一条事件"""
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event_type}')
+    lines.append('data: ' + json.dumps(data, ensure_ascii=False, separators=(',', ':')))
+    return '\n'.join(lines) + '\n\n'
+
+
+class Subscriber:
+    """单个订阅连接"""
+
+    def __init__(self, campus_id, maxsize=SUBSCRIBER_QUEUE_SIZE):
+        self.campus_id = campus_id
+        self.queue = queue.Queue(maxsize)
+        self.overflowed = False
+
+    def offer(self, event):
+        """投递事件，队列已满时丢弃并标记，由连接通知客户端重新加载"""
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.overflowed = True
+
+
+class EventBroker:
+    """按校区分发事件"""
+
+    def __init__(self, ring_size=RING_SIZE, max_subscribers=MAX_SUBSCRIBERS):
+        self.ring_size = ring_size
+        self.max_subscribers = max_subscribers
+        self.boot_id = uuid.uuid4().hex[:8]
+        self._lock = threading.Lock()
+        self._seqs = {}         # campus_id -> 最新序号
+        self._rings = {}        # campus_id -> deque[Event]
+        self._subscribers = {}  # campus_id -> set[Subscriber]
+        self._count = 0
+
+    def publish(self, campus_id, event_type, data):
+        """记录事件并投递给该校区的所有订阅者"""
+        campus_id = int(campus_id)
+        with self._lock:
+            seq = self._seqs.get(campus_id, 0) + 1
+            self._seqs[campus_id] = seq
+            event = Event(seq, f'{self.boot_id}-{seq}', event_type, data)
+            ring = self._rings.get(campus_id)
+            if ring is None:
+                ring = self._rings[campus_id] = deque(maxlen=self.ring_size)
+            ring.append(event)
+            # 在锁内投递（不阻塞），保证与 subscribe() 的补发不重复、不遗漏
+            for subscriber in self._subscribers.get(campus_id, ()):
+                subscriber.offer(event)
+        return event
+
+    def _backlog(self, campus_id, last_event_id):
+        """需要补发的事件；无法补全时返回 None（调用方持有锁）"""
+        if not last_event_id:
+            return []
+        boot_id, _, seq = last_event_id.partition('-')
+        if boot_id != self.boot_id or not seq.isdigit():
+            return None
+
+        last_seq = int(seq)
+        current = self._seqs.get(campus_id, 0)
+        if last_seq > current:
+            return None
+        ring = self._rings.get(campus_id, ())
+        if last_seq < current and (not ring or ring[0].seq > last_seq + 1):
+            return None
+        return [event for event in ring if event.seq > last_seq]
+
+    def subscribe(self, campus_id, last_event_id=None):
+        """
+        注册订阅，返回 (订阅者, 需补发的事件)，连接数已满时返回 None
+        需补发的事件为 None 表示无法从 last_event_id 续传，客户端应重新加载
+        """
+        campus_id = int(campus_id)
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                return None
+            subscriber = Subscriber(campus_id)
+            self._subscribers.setdefault(campus_id, set()).add(subscriber)
+            self._count += 1
+            return subscriber, self._backlog(campus_id, last_event_id)
+
+    def unsubscribe(self, subscriber):
+        """取消订阅，可重复调用"""
+        with self._lock:
+            subscribers = self._subscribers.get(subscriber.campus_id)
+            if subscribers and subscriber in subscribers:
+                subscribers.discard(subscriber)
+                self._count -= 1
+                if not subscribers:
+                    del self._subscribers[subscriber.campus_id]
+
+    def stream(self, subscriber, backlog):
+        """SSE 响应体生成器，开始迭代后连接关闭时自动取消订阅（未开始迭代时由调用方负责）"""
+        try:
+            yield f'retry: {RETRY_MS}\n\n'
+            if backlog is None:
+                yield format_event('reset', {})
+            else:
+                for event in backlog:
+                    yield format_event(event.type, event.data, event.id)
+
+            while True:
+                if subscriber.overflowed:
+                    # 已丢弃部分事件：清空队列，让客户端重新加载后继续接收
+                    while not subscriber.queue.empty():
+                        subscriber.queue.get_nowait()
+                    subscriber.overflowed = False
+                    yield format_event('reset', {})
+
+                try:
+                    event = subscriber.queue.get(timeout=HEARTBEAT_INTERVAL)
+                except queue.Empty:
+                    yield ': keep-alive\n\n'
+                    continue
+                yield format_event(event.type, event.data, event.id)
+        finally:
+            self.unsubscribe(subscriber)
+
+
+event_broker = EventBroker()
+
+
+def reservation_event(reservation):
+    """created 事件：周视图需要的完整预约信息"""
+    return reservation.to_dict()
+
+
+def cancellation_event(reservation):
+    """cancelled 事件：只需定位被取消的预约"""
+    return {
+        'id': reservation.id,
+        'date': reservation.date.isoformat(),
+        'start_hour': reservation.start_hour,
+        'end_hour': reservation.end_hour
+    }
+
+
+def key_event(reservation):
+    """key_picked_up / key_returned 事件：钥匙状态字段"""
+    return {
+        'id': reservation.id,
+        'key_picked_up': reservation.key_picked_up,
+        'key_pickup_time': reservation.key_pickup_time.isoformat() if reservation.key_pickup_time else None,
+        'key_returned': reservation.key_returned,
+        'key_return_time': reservation.key_return_time.isoformat() if reservation.key_return_time else None
+    }
+
+
+def overdue_event(reservation_ids):
+    """key_overdue 事件：新标记为逾期未还钥匙的预约"""
+    return {'ids': reservation_ids}
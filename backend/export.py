@@ -0,0 +1,134 @@
+"""
+历史数据流式导出
+只查询导出需要的列（连接用户、校区表，不构造 ORM 对象），以 yield_per 分批从服务端游标读取，
+边读边写出 CSV 或 NDJSON。导出一整年的记录也只执行一次查询，内存占用与行数无关。
+"""
+
+import csv
+import io
+import json
+from datetime import date, datetime
+
+from flask import Response, stream_with_context
+from sqlalchemy import select
+
+from models import db, User, Campus, Reservation, EquipmentBorrow
+
+# 每批从游标读取的行数，同时也是每次写出响应的行数
+EXPORT_BATCH_SIZE = 1000
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+# (列名, 表达式)
+RESERVATION_COLUMNS = [
+    ('id', Reservation.id),
+    ('user_id', Reservation.user_id),
+    ('user_name', User.name),
+    ('student_id', User.student_id),
+    ('campus_id', Reservation.campus_id),
+    ('campus_name', Campus.name),
+    ('date', Reservation.date),
+    ('start_hour', Reservation.start_hour),
+    ('end_hour', Reservation.end_hour),
+    ('status', Reservation.status),
+    ('key_picked_up', Reservation.key_picked_up),
+    ('key_pickup_time', Reservation.key_pickup_time),
+    ('key_returned', Reservation.key_returned),
+    ('key_return_time', Reservation.key_return_time),
+    ('created_at', Reservation.created_at),
+]
+
+BORROW_COLUMNS = [
+    ('id', EquipmentBorrow.id),
+    ('user_id', EquipmentBorrow.user_id),
+    ('user_name', User.name),
+    ('student_id', User.student_id),
+    ('equipment_name', EquipmentBorrow.equipment_name),
+    ('equipment_type', EquipmentBorrow.equipment_type),
+    ('borrow_time', EquipmentBorrow.borrow_time),
+    ('return_time', EquipmentBorrow.return_time),
+    ('status', EquipmentBorrow.status),
+    ('notes', EquipmentBorrow.notes),
+]
+
+USER_COLUMNS = [
+    ('id', User.id),
+    ('student_id', User.student_id),
+    ('name', User.name),
+    ('email', User.email),
+    ('phone', User.phone),
+    ('enrollment_year', User.enrollment_year),
+    ('is_admin', User.is_admin),
+    ('is_active', User.is_active),
+    ('email_verified', User.email_verified),
+    ('preferred_campus_id', User.preferred_campus_id),
+    ('created_at', User.created_at),
+]
+
+
+def reservation_export_statement():
+    return select(*[column.label(name) for name, column in RESERVATION_COLUMNS]) \
+        .join(User, Reservation.user_id == User.id) \
+        .join(Campus, Reservation.campus_id == Campus.id)
+
+
+def borrow_export_statement():
+    return select(*[column.label(name) for name, column in BORROW_COLUMNS]) \
+        .join(User, EquipmentBorrow.user_id == User.id)
+
+
+def user_export_statement():
+    return select(*[column.label(name) for name, column in USER_COLUMNS])
+
+
+def _to_json_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _csv_chunks(header, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # 带 BOM，Excel 打开时正确识别中文
+    buffer.write('\ufeff')
+    writer.writerow(header)
+    for batch in rows:
+        writer.writerows([_to_json_value(v) for v in row] for row in batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # 没有数据时只输出表头
+    if buffer.getvalue():
+        yield buffer.getvalue()
+
+
+def _ndjson_chunks(header, rows):
+    for batch in rows:
+        yield ''.join(
+            json.dumps(dict(zip(header, map(_to_json_value, row))), ensure_ascii=False) + '\n'
+            for row in batch
+        )
+
+
+def stream_export(statement, export_format, filename):
+    """
+    以流式响应导出查询结果
+    响应在 stream_with_context 中生成，查询在第一次写出时才执行
+    """
+    def generate():
+        result = db.session.execute(statement.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        header = list(result.keys())
+        batches = result.partitions()
+        if export_format == 'csv':
+            yield from _csv_chunks(header, batches)
+        else:
+            yield from _ndjson_chunks(header, batches)
+
+    response = Response(stream_with_context(generate()), mimetype=EXPORT_FORMATS[export_format])
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}.{export_format}'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
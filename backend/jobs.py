@@ -0,0 +1,157 @@
+"""
+分批执行的后台任务
+年度重置、批量激活等批量修改用户的操作按用户 ID 顺序每次处理 JOB_CHUNK_SIZE 个，
+每批一个短事务（先修改用户，再记录进度），批次之间释放 SQLite 写锁，不阻塞预约。
+进度（cursor、processed）记录在 jobs 表中：执行进程中断后，任务停留在 running 状态，
+超过 JOB_STALE_SECONDS 未更新即视为中断，由定时任务或管理员从 cursor 处继续执行。
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import and_, or_, update
+
+from models import db, User, Job
+from auth_claims import auth_versions
+
+# 每批处理的用户数
+JOB_CHUNK_SIZE = 500
+# 批次之间的间隔（秒），让等待写锁的预约请求先执行
+JOB_CHUNK_PAUSE = 0.05
+# running 状态超过该时间未更新视为执行进程已中断
+JOB_STALE_SECONDS = 60
+
+logger = logging.getLogger(__name__)
+
+# filters(params)：需要处理的用户条件（修改后即不再满足，重复执行不会重复计数）；values：修改的字段
+JobType = namedtuple('JobType', ['filters', 'values'])
+
+JOB_TYPES = {
+    # 禁用所有普通用户
+    'annual_reset': JobType(
+        filters=lambda params: [User.is_admin == False, User.is_active == True],
+        values=lambda: {'is_active': False, 'auth_version': User.auth_version + 1}
+    ),
+    # 激活指定用户
+    'batch_activate': JobType(
+        filters=lambda params: [User.id.in_(params['user_ids']), User.is_active == False],
+        values=lambda: {'is_active': True, 'auth_version': User.auth_version + 1}
+    ),
+}
+
+
+def create_job(job_type, params=None, created_by=None):
+    """创建任务并统计需处理的用户数（调用方负责启动）"""
+    params = params or {}
+    total = User.query.filter(*JOB_TYPES[job_type].filters(params)).count()
+    job = Job(job_type=job_type, params=json.dumps(params), total=total, created_by=created_by)
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+def is_job_running(job):
+    """任务是否正由某个进程执行（running 且未超时）"""
+    return job.status == 'running' and \
+        job.updated_at >= datetime.utcnow() - timedelta(seconds=JOB_STALE_SECONDS)
+
+
+def claim_job(job_id):
+    """
+    把任务标记为 running 并由当前进程执行
+    只有 pending、failed 或已中断的 running 任务可以认领，避免多个进程同时执行同一任务
+    """
+    now = datetime.utcnow()
+    stale = now - timedelta(seconds=JOB_STALE_SECONDS)
+    result = db.session.execute(
+        update(Job).where(
+            Job.id == job_id,
+            or_(Job.status.in_(('pending', 'failed')), and_(Job.status == 'running', Job.updated_at < stale))
+        ).values(status='running', error=None, updated_at=now, started_at=db.func.coalesce(Job.started_at, now))
+    )
+    db.session.commit()
+    return result.rowcount == 1
+
+
+def run_chunk(job_id):
+    """处理一批用户，返回任务是否已完成"""
+    job = db.session.get(Job, job_id)
+    job_type = JOB_TYPES[job.job_type]
+    filters = job_type.filters(json.loads(job.params or '{}'))
+
+    user_ids = [user_id for (user_id,) in db.session.query(User.id).filter(
+        User.id > job.cursor, *filters
+    ).order_by(User.id).limit(JOB_CHUNK_SIZE)]
+    # 结束读事务，写事务以 UPDATE 开始，避免 WAL 下读快照过期导致无法升级为写锁
+    db.session.rollback()
+
+    now = datetime.utcnow()
+    if not user_ids:
+        db.session.execute(update(Job).where(Job.id == job_id).values(
+            status='completed', updated_at=now, finished_at=now
+        ))
+        db.session.commit()
+        return True
+
+    # 重复检查条件：中断后重新执行同一批时，已修改的用户不会再次计数
+    result = db.session.execute(
+        update(User).where(User.id.in_(user_ids), *filters).values(**job_type.values()),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.execute(update(Job).where(Job.id == job_id).values(
+        cursor=user_ids[-1], processed=Job.processed + result.rowcount, updated_at=now
+    ))
+    db.session.commit()
+    auth_versions.invalidate(user_ids)
+    return False
+
+
+def run_job(job_id):
+    """在当前线程中执行任务直至完成（需在应用上下文中调用），返回任务是否已完成"""
+    if not claim_job(job_id):
+        return False
+
+    try:
+        while not run_chunk(job_id):
+            time.sleep(JOB_CHUNK_PAUSE)
+        return True
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"任务 {job_id} 执行失败: {str(e)}")
+        db.session.execute(update(Job).where(Job.id == job_id).values(
+            status='failed', error=str(e), updated_at=datetime.utcnow()
+        ))
+        db.session.commit()
+        return False
+
+
+def start_job(job_id):
+    """在后台线程中执行任务"""
+    app = current_app._get_current_object()
+
+    def target():
+        with app.app_context():
+            run_job(job_id)
+
+    thread = threading.Thread(target=target, name=f'job-{job_id}', daemon=True)
+    thread.start()
+    return thread
+
+
+def resume_interrupted_jobs():
+    """继续执行未启动或执行进程已中断的任务，返回继续执行的任务 ID"""
+    stale = datetime.utcnow() - timedelta(seconds=JOB_STALE_SECONDS)
+    job_ids = [job_id for (job_id,) in db.session.query(Job.id).filter(or_(
+        Job.status == 'pending',
+        and_(Job.status == 'running', Job.updated_at < stale)
+    )).order_by(Job.id)]
+    db.session.rollback()
+
+    for job_id in job_ids:
+        run_job(job_id)
+    return job_ids
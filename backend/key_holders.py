@@ -0,0 +1,117 @@
+"""
+钥匙持有情况
+  - campus_key_holders 每个校区一行，记录当前持有钥匙的预约：取钥匙时写入，归还或取消预约时清除，
+    钥匙公示按主键读取，无需扫描预约表
+  - 已取未还钥匙的预约由部分索引 idx_reservation_key_outstanding 覆盖；定时任务每 OVERDUE_CHECK_MINUTES 分钟
+    把结束超过 KEY_OVERDUE_MINUTES 分钟仍未归还的预约标记为逾期（key_overdue_at）
+"""
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_, update
+from sqlalchemy.orm import joinedload
+
+from cache import snapshot_cache, campus_scope
+from events import event_broker, overdue_event
+from models import db, Reservation, CampusKeyHolder
+
+# 预约结束多少分钟后仍未归还视为逾期
+KEY_OVERDUE_MINUTES = 30
+# 逾期检查间隔（分钟）
+OVERDUE_CHECK_MINUTES = 5
+# 钥匙公示最多显示的逾期记录数
+OVERDUE_LIST_LIMIT = 20
+
+
+def outstanding_key_conditions():
+    """已取未还钥匙的有效预约，条件与部分索引的 WHERE 一致以便使用该索引"""
+    return [
+        Reservation.key_picked_up == True,
+        Reservation.key_returned == False,
+        Reservation.status == 'active'
+    ]
+
+
+def set_key_holder(campus_id, reservation_id, picked_up_at):
+    """记录校区的当前钥匙持有人（随当前事务提交）"""
+    values = {'campus_id': campus_id, 'reservation_id': reservation_id,
+              'picked_up_at': picked_up_at, 'updated_at': datetime.utcnow()}
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        db.session.merge(CampusKeyHolder(**values))
+        return
+
+    stmt = dialect_insert(CampusKeyHolder).values(values)
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=['campus_id'],
+        set_={key: stmt.excluded[key] for key in ('reservation_id', 'picked_up_at', 'updated_at')}
+    ))
+
+
+def clear_key_holder(reservation_id):
+    """该预约已归还钥匙或被取消：若它是当前持有人则清除（随当前事务提交）"""
+    db.session.execute(update(CampusKeyHolder).where(
+        CampusKeyHolder.reservation_id == reservation_id
+    ).values(reservation_id=None, picked_up_at=None, updated_at=datetime.utcnow()),
+        execution_options={'synchronize_session': False})
+
+
+def _overdue_condition(now):
+    """结束时间（预约日期 + end_hour，本地时间）早于 now - KEY_OVERDUE_MINUTES"""
+    cutoff = now - timedelta(minutes=KEY_OVERDUE_MINUTES)
+    return or_(
+        Reservation.date < cutoff.date(),
+        and_(Reservation.date == cutoff.date(), Reservation.end_hour <= cutoff.hour)
+    )
+
+
+def flag_overdue_keys(now=None):
+    """
+    把超时未归还钥匙的预约标记为逾期并提交，通知受影响校区的订阅者
+
+    Returns:
+        {campus_id: [预约ID, ...]}
+    """
+    now = now or datetime.now()
+    rows = db.session.execute(
+        update(Reservation).where(
+            *outstanding_key_conditions(),
+            Reservation.key_overdue_at.is_(None),
+            _overdue_condition(now)
+        ).values(key_overdue_at=datetime.utcnow()).returning(Reservation.id, Reservation.campus_id),
+        execution_options={'synchronize_session': False}
+    ).all()
+    db.session.commit()
+
+    flagged = {}
+    for reservation_id, campus_id in rows:
+        flagged.setdefault(campus_id, []).append(reservation_id)
+    for campus_id, reservation_ids in flagged.items():
+        snapshot_cache.bump(campus_scope(campus_id))
+        event_broker.publish(campus_id, 'key_overdue', overdue_event(reservation_ids))
+    return flagged
+
+
+def build_key_status(campus_id):
+    """钥匙公示：当前持有人（按主键读取）和逾期未还的预约"""
+    holder = CampusKeyHolder.query.options(
+        joinedload(CampusKeyHolder.reservation).joinedload(Reservation.user),
+        joinedload(CampusKeyHolder.reservation).joinedload(Reservation.campus)
+    ).filter_by(campus_id=campus_id).first()
+
+    overdue = Reservation.query.options(
+        joinedload(Reservation.user), joinedload(Reservation.campus)
+    ).filter(
+        Reservation.campus_id == campus_id,
+        *outstanding_key_conditions(),
+        Reservation.key_overdue_at.isnot(None)
+    ).order_by(Reservation.date, Reservation.end_hour).limit(OVERDUE_LIST_LIMIT).all()
+
+    return {
+        'holder': holder.reservation.to_dict() if holder and holder.reservation else None,
+        'overdue': [reservation.to_dict() for reservation in overdue]
+    }
@@ -0,0 +1,104 @@
+"""
+登录限流
+  - 密码校验（scrypt/pbkdf2）在有界线程池中执行：同时计算的哈希数不超过 PASSWORD_HASH_WORKERS，
+    排队数超过 PASSWORD_HASH_QUEUE 时立即拒绝（429），登录高峰不会占满所有工作线程
+  - 令牌桶限流：按邮箱和 IP 分别计数，超出后返回 429 及 Retry-After
+限流状态只保存在当前进程内，多进程部署时每个进程分别计数。
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _env_number(name, default, cast=int):
+    value = os.environ.get(name)
+    return cast(value) if value not in (None, '') else default
+
+
+# 同时计算密码哈希的线程数
+PASSWORD_HASH_WORKERS = _env_number('PASSWORD_HASH_WORKERS', os.cpu_count() or 2)
+# 等待计算的最大请求数，超出时立即拒绝
+PASSWORD_HASH_QUEUE = _env_number('PASSWORD_HASH_QUEUE', 32)
+
+# 每个邮箱：最多连续尝试 5 次，之后每 12 秒恢复 1 次
+LOGIN_EMAIL_BURST = _env_number('LOGIN_EMAIL_BURST', 5)
+LOGIN_EMAIL_RATE = _env_number('LOGIN_EMAIL_RATE', 1 / 12, float)
+# 每个 IP：校园网出口 IP 可能被大量用户共用，限额较宽
+LOGIN_IP_BURST = _env_number('LOGIN_IP_BURST', 30)
+LOGIN_IP_RATE = _env_number('LOGIN_IP_RATE', 1.0, float)
+
+# 令牌桶数量超过该值时清理已恢复满额的桶
+MAX_BUCKETS = 10000
+
+
+class PasswordHashBusy(Exception):
+    """密码校验排队已满"""
+
+
+class PasswordHashPool:
+    """有界的密码哈希线程池"""
+
+    def __init__(self, workers=PASSWORD_HASH_WORKERS, queue_limit=PASSWORD_HASH_QUEUE):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        self._slots = threading.BoundedSemaphore(workers + queue_limit)
+
+    def run(self, fn, *args):
+        """在线程池中执行 fn(*args) 并等待结果，排队已满时抛出 PasswordHashBusy"""
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHashBusy()
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future.result()
+
+
+class TokenBucket:
+    """按键计数的令牌桶"""
+
+    def __init__(self, burst, rate):
+        self.burst = burst
+        self.rate = rate  # 每秒恢复的令牌数
+        self._lock = threading.Lock()
+        self._buckets = {}  # key -> (tokens, updated_at)
+
+    def take(self, key):
+        """消耗一个令牌，返回 0；令牌不足时返回需要等待的秒数"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now)
+                return (1 - tokens) / self.rate
+
+            self._buckets[key] = (tokens - 1, now)
+            if len(self._buckets) > MAX_BUCKETS:
+                self._prune(now)
+            return 0
+
+    def _prune(self, now):
+        full_after = self.burst / self.rate
+        for key in [k for k, (_, updated_at) in self._buckets.items() if now - updated_at >= full_after]:
+            del self._buckets[key]
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+password_pool = PasswordHashPool()
+email_limiter = TokenBucket(LOGIN_EMAIL_BURST, LOGIN_EMAIL_RATE)
+ip_limiter = TokenBucket(LOGIN_IP_BURST, LOGIN_IP_RATE)
+
+
+def login_retry_after(email, ip):
+    """登录尝试计数：允许时返回 0，否则返回需要等待的秒数"""
+    wait = ip_limiter.take(ip)
+    if wait:
+        return wait
+    return email_limiter.take(email.strip().lower())
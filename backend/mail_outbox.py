@@ -0,0 +1,226 @@
+"""
+邮件发件箱
+请求处理中只调用 queue_email() 写入 email_outbox 表（随业务数据一起提交），不连接 SMTP 服务器；
+后台线程池取出到期的邮件发送：
+  - 每个线程在有待发邮件时复用同一个 SMTP 连接，空闲或发送 MAIL_MESSAGES_PER_CONNECTION 封后断开
+  - 发送失败按指数退避重试，超过 MAIL_MAX_ATTEMPTS 次标记为 failed
+  - 发送前用条件 UPDATE 把邮件标记为 sending，多个线程/进程不会重复发送；
+    线程中断后停留在 sending 的邮件超过 MAIL_SENDING_TIMEOUT 秒重新发送
+请求提交后调用 outbox_workers.notify() 立即唤醒发送线程，否则线程每 MAIL_POLL_INTERVAL 秒检查一次。
+含一次性链接（令牌明文）的邮件以 ONE_TIME_LINK_KEY_PREFIXES 中的前缀作为 notification_key，
+发送成功或放弃发送后清除正文，发件箱中不保留令牌明文。
+"""
+
+import logging
+import os
+import random
+import threading
+from datetime import datetime, timedelta
+
+from flask_mail import Message
+from sqlalchemy import and_, or_, update
+
+from models import db, EmailOutbox
+
+# 发送线程数
+MAIL_WORKERS = int(os.environ.get('MAIL_WORKERS', 2))
+# 每个线程每次取出的邮件数
+MAIL_BATCH_SIZE = 20
+# 每个 SMTP 连接最多发送的邮件数，之后重新连接（多数 SMTP 服务器限制单个会话的邮件数）
+MAIL_MESSAGES_PER_CONNECTION = 100
+# 没有待发邮件时的检查间隔（秒）
+MAIL_POLL_INTERVAL = 5
+# 最多尝试发送的次数
+MAIL_MAX_ATTEMPTS = 6
+# 重试间隔：MAIL_RETRY_BASE * 2^(已尝试次数-1) 秒，最长 MAIL_RETRY_MAX 秒
+MAIL_RETRY_BASE = 30
+MAIL_RETRY_MAX = 3600
+# sending 状态超过该时间视为发送线程已中断（秒）
+MAIL_SENDING_TIMEOUT = 300
+# 含一次性链接的邮件的 notification_key 前缀
+ONE_TIME_LINK_KEY_PREFIXES = ('verification:', 'password_reset:')
+# 清除后的正文
+REDACTED_BODY = '[邮件含一次性链接，已在发送后清除]'
+
+logger = logging.getLogger(__name__)
+
+
+def queue_email(recipient, subject, body, html=None, send_at=None, notification_key=None):
+    """把邮件加入发件箱（随当前事务提交），send_at（UTC）为空时立即发送"""
+    email = EmailOutbox(
+        recipient=recipient,
+        subject=subject,
+        body=body,
+        html=html,
+        next_attempt_at=send_at or datetime.utcnow(),
+        notification_key=notification_key
+    )
+    db.session.add(email)
+    return email
+
+
+def retry_delay(attempts):
+    """第 attempts 次发送失败后的等待时间（带 ±20% 抖动，避免大量邮件同时重试）"""
+    delay = min(MAIL_RETRY_BASE * 2 ** (attempts - 1), MAIL_RETRY_MAX)
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def _due_condition(now):
+    return or_(
+        and_(EmailOutbox.status == 'pending', EmailOutbox.next_attempt_at <= now),
+        and_(EmailOutbox.status == 'sending',
+             EmailOutbox.locked_at < now - timedelta(seconds=MAIL_SENDING_TIMEOUT))
+    )
+
+
+def claim_batch(limit=MAIL_BATCH_SIZE):
+    """取出一批到期的邮件并标记为 sending，返回 EmailOutbox 列表"""
+    now = datetime.utcnow()
+    email_ids = [email_id for (email_id,) in db.session.query(EmailOutbox.id).filter(
+        _due_condition(now)
+    ).order_by(EmailOutbox.next_attempt_at, EmailOutbox.id).limit(limit)]
+    # 结束读事务，写事务以 UPDATE 开始
+    db.session.rollback()
+    if not email_ids:
+        return []
+
+    claimed = []
+    for email_id in email_ids:
+        # 条件 UPDATE：其他线程已取出的邮件不再满足条件
+        result = db.session.execute(update(EmailOutbox).where(
+            EmailOutbox.id == email_id, _due_condition(now)
+        ).values(status='sending', locked_at=now))
+        if result.rowcount == 1:
+            claimed.append(email_id)
+    db.session.commit()
+
+    if not claimed:
+        return []
+    return EmailOutbox.query.filter(EmailOutbox.id.in_(claimed)).order_by(EmailOutbox.id).all()
+
+
+def redact_one_time_link(email):
+    """清除含一次性链接的邮件正文（调用方提交）"""
+    if email.notification_key and email.notification_key.startswith(ONE_TIME_LINK_KEY_PREFIXES):
+        email.body = REDACTED_BODY
+        email.html = None
+
+
+def mark_sent(email):
+    email.status = 'sent'
+    email.attempts += 1
+    email.sent_at = datetime.utcnow()
+    email.last_error = None
+    redact_one_time_link(email)
+    db.session.commit()
+
+
+def mark_failed(email, error):
+    """记录发送失败，未超过最大次数时安排重试"""
+    email.attempts += 1
+    email.last_error = str(error)[:1000]
+    if email.attempts >= MAIL_MAX_ATTEMPTS:
+        email.status = 'failed'
+        redact_one_time_link(email)
+        logger.error(f"邮件 {email.id} 发送失败，已放弃（{email.attempts} 次）: {error}")
+    else:
+        email.status = 'pending'
+        email.next_attempt_at = datetime.utcnow() + retry_delay(email.attempts)
+        logger.warning(f"邮件 {email.id} 发送失败，稍后重试（第 {email.attempts} 次）: {error}")
+    db.session.commit()
+
+
+def to_message(email):
+    return Message(subject=email.subject, recipients=[email.recipient], body=email.body, html=email.html)
+
+
+class OutboxWorkerPool:
+    """发件箱发送线程池"""
+
+    def __init__(self):
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+
+    def notify(self):
+        """有新邮件：唤醒发送线程（未启动时无效果）"""
+        self._wakeup.set()
+
+    def start(self, app, workers=MAIL_WORKERS):
+        if self._threads:
+            return
+        self._stopping.clear()
+        for i in range(workers):
+            thread = threading.Thread(target=self._run, args=(app,), name=f'mail-outbox-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _run(self, app):
+        from email_service import mail
+
+        with app.app_context():
+            connection = None
+            sent_on_connection = 0
+            # 启动后先等待一个检查间隔（或新邮件通知），应用在此期间完成数据库初始化
+            self._wakeup.wait(MAIL_POLL_INTERVAL)
+            while not self._stopping.is_set():
+                # 先清除唤醒标记再查询，查询之后加入的邮件会再次唤醒
+                self._wakeup.clear()
+                try:
+                    batch = claim_batch()
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error(f"读取发件箱失败: {str(e)}")
+                    batch = []
+
+                if not batch:
+                    connection = self._disconnect(connection)
+                    db.session.remove()
+                    self._wakeup.wait(MAIL_POLL_INTERVAL)
+                    continue
+
+                for email in batch:
+                    try:
+                        if connection is None:
+                            connection = mail.connect().__enter__()
+                            sent_on_connection = 0
+                        connection.send(to_message(email))
+                        sent_on_connection += 1
+                        if sent_on_connection >= MAIL_MESSAGES_PER_CONNECTION:
+                            connection = self._disconnect(connection)
+                    except Exception as e:
+                        # 连接可能已不可用，下一封邮件重新连接
+                        connection = self._disconnect(connection)
+                        try:
+                            mark_failed(email, e)
+                        except Exception as db_error:
+                            db.session.rollback()
+                            logger.error(f"记录邮件 {email.id} 发送失败时出错: {str(db_error)}")
+                        continue
+                    try:
+                        mark_sent(email)
+                    except Exception as e:
+                        # 邮件已发出但状态未保存：超时后会再次发送
+                        db.session.rollback()
+                        logger.error(f"记录邮件 {email.id} 已发送时出错: {str(e)}")
+
+            self._disconnect(connection)
+
+    @staticmethod
+    def _disconnect(connection):
+        if connection is not None:
+            try:
+                connection.__exit__(None, None, None)
+            except Exception:
+                pass
+        return None
+
+
+outbox_workers = OutboxWorkerPool()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+添加 auth_version 字段到 User 表（访问令牌中的权限声明随该版本号失效）
+"""
+
+import sys
+import os
+
+# 添加父目录到路径以便导入模块
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import app
+from models import db
+
+def migrate():
+    """执行数据库迁移"""
+    with app.app_context():
+        try:
+            with db.engine.connect() as conn:
+                # 检查列是否已存在
+                result = conn.execute(db.text("PRAGMA table_info(users)"))
+                columns = [row[1] for row in result]
+
+                if 'auth_version' not in columns:
+                    print("添加 auth_version 列到 users 表...")
+                    conn.execute(db.text(
+                        "ALTER TABLE users ADD COLUMN auth_version INTEGER NOT NULL DEFAULT 0"
+                    ))
+                    conn.commit()
+                    print("✓ auth_version 列添加成功")
+                else:
+                    print("✓ auth_version 列已存在，跳过")
+
+        except Exception as e:
+            print(f"✗ 迁移失败: {str(e)}")
+            return False
+
+    return True
+
+if __name__ == '__main__':
+    print("="*60)
+    print("开始数据库迁移...")
+    print("="*60)
+
+    if migrate():
+        print("\n" + "="*60)
+        print("迁移完成！")
+        print("已登录用户的旧令牌仍然有效（回退查询数据库校验权限），重新登录后使用新令牌")
+        print("="*60)
+    else:
+        print("\n" + "="*60)
+        print("迁移失败！")
+        print("="*60)
+        sys.exit(1)
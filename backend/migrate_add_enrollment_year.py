@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+添加 enrollment_year 字段（及索引）到 User 表，按学号回填入学年份，并创建用户搜索全文索引
+"""
+
+import sys
+import os
+
+# 添加父目录到路径以便导入模块
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import app
+from models import db, User, enrollment_year_from_student_id
+from user_search import ensure_user_search_index
+
+# 每批回填的用户数
+BATCH_SIZE = 1000
+
+def migrate():
+    """执行数据库迁移"""
+    with app.app_context():
+        try:
+            with db.engine.connect() as conn:
+                # 检查列是否已存在
+                result = conn.execute(db.text("PRAGMA table_info(users)"))
+                columns = [row[1] for row in result]
+                
+                if 'enrollment_year' not in columns:
+                    print("添加 enrollment_year 列到 users 表...")
+                    conn.execute(db.text("ALTER TABLE users ADD COLUMN enrollment_year INTEGER"))
+                    conn.commit()
+                    print("✓ enrollment_year 列添加成功")
+                else:
+                    print("✓ enrollment_year 列已存在，跳过")
+                
+                conn.execute(db.text(
+                    "CREATE INDEX IF NOT EXISTS ix_users_enrollment_year ON users (enrollment_year)"
+                ))
+                conn.commit()
+                print("✓ enrollment_year 索引已就绪")
+            
+            # 按学号回填入学年份
+            updated = 0
+            last_id = 0
+            while True:
+                rows = db.session.query(User.id, User.student_id, User.enrollment_year).filter(
+                    User.id > last_id
+                ).order_by(User.id).limit(BATCH_SIZE).all()
+                if not rows:
+                    break
+                changes = [
+                    {'id': user_id, 'enrollment_year': enrollment_year_from_student_id(student_id)}
+                    for user_id, student_id, enrollment_year in rows
+                    if enrollment_year != enrollment_year_from_student_id(student_id)
+                ]
+                if changes:
+                    db.session.execute(db.update(User), changes)
+                    db.session.commit()
+                updated += len(changes)
+                last_id = rows[-1][0]
+            print(f"✓ 已回填 {updated} 个用户的入学年份")
+            
+            if ensure_user_search_index():
+                print("✓ users_fts 全文索引已就绪")
+            else:
+                print("! 当前数据库不支持 FTS5 trigram，用户搜索将使用 LIKE 查询")
+                    
+        except Exception as e:
+            db.session.rollback()
+            print(f"✗ 迁移失败: {str(e)}")
+            return False
+    
+    return True
+
+if __name__ == '__main__':
+    print("="*60)
+    print("开始数据库迁移...")
+    print("="*60)
+    
+    if migrate():
+        print("\n" + "="*60)
+        print("迁移完成！")
+        print("="*60)
+    else:
+        print("\n" + "="*60)
+        print("迁移失败！")
+        print("="*60)
+        sys.exit(1)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+钥匙持有情况：添加 reservations.key_overdue_at 列和已取未还钥匙的部分索引，
+创建 campus_key_holders 表并按现有记录回填每个校区的当前持有人
+"""
+
+import sys
+import os
+
+# 添加父目录到路径以便导入模块
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import func
+from app import app
+from models import db, Reservation, CampusKeyHolder, Campus
+from key_holders import outstanding_key_conditions, set_key_holder
+
+INDEX_NAME = 'idx_reservation_key_outstanding'
+
+def migrate():
+    """执行数据库迁移"""
+    with app.app_context():
+        try:
+            with db.engine.connect() as conn:
+                result = conn.execute(db.text("PRAGMA table_info(reservations)"))
+                columns = [row[1] for row in result]
+
+                if 'key_overdue_at' not in columns:
+                    print("添加 key_overdue_at 列到 reservations 表...")
+                    conn.execute(db.text("ALTER TABLE reservations ADD COLUMN key_overdue_at DATETIME"))
+                    conn.commit()
+                    print("✓ key_overdue_at 列添加成功")
+                else:
+                    print("✓ key_overdue_at 列已存在，跳过")
+
+            index = next(i for i in Reservation.__table__.indexes if i.name == INDEX_NAME)
+            index.create(db.engine, checkfirst=True)
+            print(f"✓ {INDEX_NAME} 索引已就绪")
+
+            CampusKeyHolder.__table__.create(db.engine, checkfirst=True)
+            print("✓ campus_key_holders 表已就绪")
+
+            # 每个校区最近一次取钥匙且尚未归还的预约为当前持有人
+            filled = 0
+            for (campus_id,) in db.session.query(Campus.id).all():
+                if db.session.get(CampusKeyHolder, campus_id):
+                    continue
+                latest = db.session.query(Reservation.id, Reservation.key_pickup_time).filter(
+                    Reservation.campus_id == campus_id,
+                    *outstanding_key_conditions()
+                ).order_by(func.coalesce(Reservation.key_pickup_time, Reservation.created_at).desc()).first()
+                if latest:
+                    set_key_holder(campus_id, latest.id, latest.key_pickup_time)
+                    filled += 1
+            db.session.commit()
+            print(f"✓ 已回填 {filled} 个校区的当前钥匙持有人")
+
+        except Exception as e:
+            db.session.rollback()
+            print(f"✗ 迁移失败: {str(e)}")
+            return False
+
+    return True
+
+if __name__ == '__main__':
+    print("="*60)
+    print("开始数据库迁移...")
+    print("="*60)
+
+    if migrate():
+        print("\n" + "="*60)
+        print("迁移完成！")
+        print("已超时未归还的钥匙将在下一次逾期检查时标记")
+        print("="*60)
+    else:
+        print("\n" + "="*60)
+        print("迁移失败！")
+        print("="*60)
+        sys.exit(1)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+添加 notification_key 字段到 EmailOutbox 表（预约提醒去重及撤回）
+"""
+
+import sys
+import os
+
+# 添加父目录到路径以便导入模块
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import app
+from models import db
+
+def migrate():
+    """执行数据库迁移"""
+    with app.app_context():
+        try:
+            with db.engine.connect() as conn:
+                # 检查表是否存在（尚未创建时由 init_db 按新结构创建）
+                result = conn.execute(db.text(
+                    "SELECT name FROM sqlite_master WHERE type='table' AND name='email_outbox'"
+                ))
+                if result.first() is None:
+                    print("✓ email_outbox 表不存在，启动时将按新结构创建，跳过")
+                    return True
+
+                # 检查列是否已存在
+                result = conn.execute(db.text("PRAGMA table_info(email_outbox)"))
+                columns = [row[1] for row in result]
+
+                if 'notification_key' not in columns:
+                    print("添加 notification_key 列到 email_outbox 表...")
+                    conn.execute(db.text(
+                        "ALTER TABLE email_outbox ADD COLUMN notification_key VARCHAR(100)"
+                    ))
+                    print("✓ notification_key 列添加成功")
+                else:
+                    print("✓ notification_key 列已存在，跳过")
+
+                # SQLite 不支持 ADD COLUMN 时直接加唯一约束，改用唯一索引
+                conn.execute(db.text(
+                    "CREATE UNIQUE INDEX IF NOT EXISTS uq_email_outbox_notification_key "
+                    "ON email_outbox (notification_key)"
+                ))
+                conn.commit()
+                print("✓ notification_key 唯一索引已就绪")
+
+        except Exception as e:
+            print(f"✗ 迁移失败: {str(e)}")
+            return False
+
+    return True
+
+if __name__ == '__main__':
+    print("="*60)
+    print("开始数据库迁移...")
+    print("="*60)
+
+    if migrate():
+        print("\n" + "="*60)
+        print("迁移完成！")
+        print("设置 RESERVATION_NOTIFICATIONS_ENABLED=true 开启预约提醒和取消通知")
+        print("="*60)
+    else:
+        print("\n" + "="*60)
+        print("迁移失败！")
+        print("="*60)
+        sys.exit(1)
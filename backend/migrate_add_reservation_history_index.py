@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+为 reservations 表添加 (created_at, id) 复合索引，用于历史预约记录的键集分页
+"""
+
+import sys
+import os
+
+# 添加父目录到路径以便导入模块
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import app
+from models import db, Reservation
+
+INDEX_NAME = 'idx_reservation_created_id'
+
+def migrate():
+    """执行数据库迁移"""
+    with app.app_context():
+        try:
+            index = next(i for i in Reservation.__table__.indexes if i.name == INDEX_NAME)
+            index.create(db.engine, checkfirst=True)
+            print(f"✓ {INDEX_NAME} 索引已就绪")
+        except Exception as e:
+            print(f"✗ 迁移失败: {str(e)}")
+            return False
+
+    return True
+
+if __name__ == '__main__':
+    print("="*60)
+    print("开始数据库迁移...")
+    print("="*60)
+
+    if migrate():
+        print("\n" + "="*60)
+        print("迁移完成！")
+        print("="*60)
+    else:
+        print("\n" + "="*60)
+        print("迁移失败！")
+        print("="*60)
+        sys.exit(1)
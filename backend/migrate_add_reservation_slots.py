@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+创建 reservation_slots 表并为现有有效预约回填时段记录
+"""
+
+import sys
+import os
+
+# 添加父目录到路径以便导入模块
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import app
+from models import db, Reservation, ReservationSlot
+
+def migrate():
+    """执行数据库迁移"""
+    with app.app_context():
+        try:
+            # 创建缺失的表
+            ReservationSlot.__table__.create(db.engine, checkfirst=True)
+            print("✓ reservation_slots 表已就绪")
+
+            claimed = {
+                (slot.campus_id, slot.date, slot.hour): slot.reservation_id
+                for slot in ReservationSlot.query.all()
+            }
+            reservations = Reservation.query.filter_by(status='active').order_by(Reservation.id).all()
+
+            added = 0
+            conflicts = []
+            for reservation in reservations:
+                for hour in range(reservation.start_hour, reservation.end_hour):
+                    key = (reservation.campus_id, reservation.date, hour)
+                    if key in claimed:
+                        if claimed[key] != reservation.id:
+                            conflicts.append((reservation.id, claimed[key], key))
+                        continue
+                    db.session.add(ReservationSlot(
+                        reservation_id=reservation.id,
+                        campus_id=reservation.campus_id,
+                        date=reservation.date,
+                        hour=hour
+                    ))
+                    claimed[key] = reservation.id
+                    added += 1
+
+            db.session.commit()
+            print(f"✓ 已回填 {added} 条时段记录")
+
+            # 已存在的重复预约无法占用同一时段，需要人工处理
+            for reservation_id, holder_id, (campus_id, date, hour) in conflicts:
+                print(f"! 预约 #{reservation_id} 与预约 #{holder_id} 重叠："
+                      f"校区 {campus_id} {date.isoformat()} {hour}:00")
+
+        except Exception as e:
+            db.session.rollback()
+            print(f"✗ 迁移失败: {str(e)}")
+            return False
+
+    return True
+
+if __name__ == '__main__':
+    print("="*60)
+    print("开始数据库迁移...")
+    print("="*60)
+
+    if migrate():
+        print("\n" + "="*60)
+        print("迁移完成！")
+        print("="*60)
+    else:
+        print("\n" + "="*60)
+        print("迁移失败！")
+        print("="*60)
+        sys.exit(1)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+创建 verification_tokens 表，把 users 表中未使用的明文验证令牌转换为摘要后迁入，并清空原字段；
+添加 users.registered_via_verification 字段，已有账户均为 0，不会被未验证注册的清理任务删除
+"""
+
+import sys
+import os
+
+# 添加父目录到路径以便导入模块
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from datetime import datetime
+from app import app
+from models import db, VerificationToken
+from verification import hash_token, VERIFICATION_TOKEN_TTL
+
+LEGACY_COLUMNS = ['verification_token', 'verification_token_expires']
+
+def migrate():
+    """执行数据库迁移"""
+    with app.app_context():
+        try:
+            # 创建缺失的表
+            VerificationToken.__table__.create(db.engine, checkfirst=True)
+            print("✓ verification_tokens 表已就绪")
+
+            result = db.session.execute(db.text("PRAGMA table_info(users)"))
+            columns = [row[1] for row in result]
+
+            if 'registered_via_verification' not in columns:
+                db.session.execute(db.text(
+                    "ALTER TABLE users ADD COLUMN registered_via_verification BOOLEAN NOT NULL DEFAULT 0"
+                ))
+                db.session.commit()
+                print("✓ registered_via_verification 列添加成功（已有账户不会被清理）")
+            else:
+                print("✓ registered_via_verification 列已存在，跳过")
+
+            if 'verification_token' not in columns:
+                print("✓ users 表没有明文令牌字段，跳过")
+                return True
+
+            rows = db.session.execute(db.text(
+                "SELECT id, verification_token, verification_token_expires FROM users "
+                "WHERE verification_token IS NOT NULL"
+            )).all()
+            for user_id, token, expires in rows:
+                if isinstance(expires, str):
+                    expires = datetime.fromisoformat(expires)
+                db.session.add(VerificationToken(
+                    user_id=user_id,
+                    token_hash=hash_token(token),
+                    expires_at=expires or datetime.utcnow() + VERIFICATION_TOKEN_TTL
+                ))
+            db.session.execute(db.text(
+                "UPDATE users SET verification_token = NULL, verification_token_expires = NULL"
+            ))
+            db.session.commit()
+            print(f"✓ 已迁移 {len(rows)} 个验证令牌，users 表中的明文已清空")
+
+            # SQLite 3.35+ 支持 DROP COLUMN，但带唯一约束的列无法删除，只能保留空列
+            with db.engine.connect() as conn:
+                for column in LEGACY_COLUMNS:
+                    try:
+                        conn.execute(db.text(f"ALTER TABLE users DROP COLUMN {column}"))
+                        conn.commit()
+                        print(f"✓ 已删除 users.{column} 列")
+                    except Exception:
+                        conn.rollback()
+                        print(f"! users.{column} 列无法删除，已清空并保留（程序不再使用）")
+
+        except Exception as e:
+            db.session.rollback()
+            print(f"✗ 迁移失败: {str(e)}")
+            return False
+
+    return True
+
+if __name__ == '__main__':
+    print("="*60)
+    print("开始数据库迁移...")
+    print("="*60)
+
+    if migrate():
+        print("\n" + "="*60)
+        print("迁移完成！")
+        print("已发出的验证链接仍然有效（按摘要查找）")
+        print("="*60)
+    else:
+        print("\n" + "="*60)
+        print("迁移失败！")
+        print("="*60)
+        sys.exit(1)
@@ -1,9 +1,23 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import joinedload, validates
 from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
+import os
+import re
 
 db = SQLAlchemy()
 
+# 密码哈希算法及参数（Werkzeug 格式），修改后用户下次登录时自动按新参数重新哈希
+PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+
+# 学号开头的字母前缀（如研究生 SY、BY）之后的两位数字为入学年份后两位
+STUDENT_ID_YEAR_PATTERN = re.compile(r'^[A-Za-z]*(\d{2})')
+
+def enrollment_year_from_student_id(student_id):
+    """从学号推导入学年份，无法识别时返回 None"""
+    match = STUDENT_ID_YEAR_PATTERN.match(student_id or '')
+    return 2000 + int(match.group(1)) if match else None
+
 class User(db.Model):
     __tablename__ = 'users'
     
@@ -16,21 +30,31 @@ class User(db.Model):
     is_admin = db.Column(db.Boolean, default=False)
     is_active = db.Column(db.Boolean, default=True)
     email_verified = db.Column(db.Boolean, default=False)
-    verification_token = db.Column(db.String(100), unique=True, nullable=True)
-    verification_token_expires = db.Column(db.DateTime, nullable=True)
     preferred_campus_id = db.Column(db.Integer, db.ForeignKey('campuses.id'), nullable=True)
+    enrollment_year = db.Column(db.Integer, nullable=True, index=True)  # 由学号推导
+    auth_version = db.Column(db.Integer, nullable=False, default=0)  # 权限或启用状态变更时递增，使已签发的令牌失效
+    registered_via_verification = db.Column(db.Boolean, nullable=False, default=False)  # 开启邮箱验证时注册，长期未验证时可被清理
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     reservations = db.relationship('Reservation', backref='user', lazy=True)
     equipment_borrows = db.relationship('EquipmentBorrow', backref='user', lazy=True)
     equipment_registrations = db.relationship('Equipment', backref='owner', lazy=True)
     
+    @validates('student_id')
+    def _sync_enrollment_year(self, key, student_id):
+        self.enrollment_year = enrollment_year_from_student_id(student_id)
+        return student_id
+    
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = generate_password_hash(password, method=PASSWORD_HASH_METHOD)
     
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
     
+    def password_needs_rehash(self):
+        """密码哈希的算法或参数与当前配置不同"""
+        return self.password_hash.split('$', 1)[0] != PASSWORD_HASH_METHOD
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -42,6 +66,7 @@ class User(db.Model):
             'is_active': self.is_active,
             'email_verified': self.email_verified,
             'preferred_campus_id': self.preferred_campus_id,
+            'enrollment_year': self.enrollment_year,
             'created_at': self.created_at.isoformat()
         }
 
@@ -76,12 +101,29 @@ class Reservation(db.Model):
     key_pickup_time = db.Column(db.DateTime)
     key_returned = db.Column(db.Boolean, default=False)
     key_return_time = db.Column(db.DateTime)
+    key_overdue_at = db.Column(db.DateTime)  # 结束后超时未归还钥匙时由定时任务标记
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    slots = db.relationship('ReservationSlot', backref='reservation', lazy=True,
+                            cascade='all, delete-orphan')
+    
     __table_args__ = (
         db.Index('idx_reservation_date_campus', 'date', 'campus_id'),
+        # 管理员历史记录按 (created_at, id) 键集分页
+        db.Index('idx_reservation_created_id', 'created_at', 'id'),
+        # 已取未还钥匙的预约（部分索引，只包含少量行），供钥匙公示和逾期检查使用
+        db.Index('idx_reservation_key_outstanding', 'date', 'end_hour', 'campus_id',
+                 sqlite_where=db.text('key_picked_up = 1 AND key_returned = 0'),
+                 postgresql_where=db.text('key_picked_up AND NOT key_returned')),
     )
     
+    def claim_slots(self):
+        """为预约的每个小时占用一个时段记录，由唯一约束拒绝重叠预约"""
+        self.slots = [
+            ReservationSlot(campus_id=self.campus_id, date=self.date, hour=hour)
+            for hour in range(self.start_hour, self.end_hour)
+        ]
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -98,9 +140,49 @@ class Reservation(db.Model):
             'key_pickup_time': self.key_pickup_time.isoformat() if self.key_pickup_time else None,
             'key_returned': self.key_returned,
             'key_return_time': self.key_return_time.isoformat() if self.key_return_time else None,
+            'key_overdue': self.key_overdue_at is not None and not self.key_returned,
             'created_at': self.created_at.isoformat()
         }
 
+class CampusKeyHolder(db.Model):
+    """每个校区的当前钥匙持有人：最近一次登记取钥匙且尚未归还的预约，没有时 reservation_id 为空"""
+    __tablename__ = 'campus_key_holders'
+    
+    campus_id = db.Column(db.Integer, db.ForeignKey('campuses.id'), primary_key=True)
+    reservation_id = db.Column(db.Integer, db.ForeignKey('reservations.id'), nullable=True)
+    picked_up_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    reservation = db.relationship('Reservation')
+
+class ReservationSlot(db.Model):
+    """有效预约占用的小时时段，(校区, 日期, 小时) 唯一"""
+    __tablename__ = 'reservation_slots'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    reservation_id = db.Column(db.Integer, db.ForeignKey('reservations.id'), nullable=False, index=True)
+    campus_id = db.Column(db.Integer, db.ForeignKey('campuses.id'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    hour = db.Column(db.Integer, nullable=False)
+    
+    __table_args__ = (
+        db.UniqueConstraint('campus_id', 'date', 'hour', name='uq_reservation_slot'),
+    )
+
+class UserWeeklyHours(db.Model):
+    """用户每个预约周期（周日起算）已预约的小时数，随预约创建/取消原子更新"""
+    __tablename__ = 'user_weekly_hours'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    week_start = db.Column(db.Date, nullable=False)  # 预约窗口起始的周日
+    hours = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'week_start', name='uq_user_weekly_hours'),
+    )
+
 class UnavailableTime(db.Model):
     __tablename__ = 'unavailable_times'
     
@@ -205,10 +287,92 @@ class EquipmentBorrow(db.Model):
             'notes': self.notes
         }
 
+class VerificationToken(db.Model):
+    """邮箱验证令牌，只保存令牌的 SHA-256 摘要（明文只出现在验证邮件中），过期后由定时任务删除"""
+    __tablename__ = 'verification_tokens'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    token_hash = db.Column(db.String(64), unique=True, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    user = db.relationship('User')
+
+class EmailOutbox(db.Model):
+    """待发送的邮件，与触发它的业务数据在同一事务中写入，由后台线程发送"""
+    __tablename__ = 'email_outbox'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(100), nullable=False)
+    subject = db.Column(db.String(200), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    html = db.Column(db.Text)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, sending, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_at = db.Column(db.DateTime)  # 开始发送的时间，发送线程中断后据此重新发送
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+    # 通知去重键（如 reminder:<预约ID>），同一通知只写入一次，也用于撤回尚未发送的通知
+    notification_key = db.Column(db.String(100), unique=True, nullable=True)
+    
+    __table_args__ = (
+        db.Index('idx_email_outbox_status_next', 'status', 'next_attempt_at'),
+    )
+
+class Job(db.Model):
+    """分批执行的后台任务（如年度重置、批量激活用户），记录进度以便中断后继续"""
+    __tablename__ = 'jobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    job_type = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, running, completed, failed
+    params = db.Column(db.Text)  # JSON
+    cursor = db.Column(db.Integer, nullable=False, default=0)  # 已处理到的最大用户ID
+    total = db.Column(db.Integer, nullable=False, default=0)
+    processed = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text)
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)  # 定时任务创建时为空
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)  # 每批完成时更新，用于判断执行进程是否已中断
+    finished_at = db.Column(db.DateTime)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'job_type': self.job_type,
+            'status': self.status,
+            'total': self.total,
+            'processed': self.processed,
+            'error': self.error,
+            'created_by': self.created_by,
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+def serialize_list(query, *relations):
+    """
+    序列化列表查询结果
+    relations 为 to_dict() 访问的关联关系（如 Reservation.user），统一用 joinedload 随主查询一并加载，
+    避免逐行懒加载产生的 N+1 查询
+    """
+    if relations:
+        query = query.options(*[joinedload(relation) for relation in relations])
+    return [item.to_dict() for item in query.all()]
+
 def init_db():
     """Initialize database with default data"""
     db.create_all()
     
+    # SQLite 下创建用户搜索的全文索引
+    from user_search import ensure_user_search_index
+    ensure_user_search_index()
+    
     # Create campuses if they don't exist
     if Campus.query.count() == 0:
         campuses = [
@@ -0,0 +1,166 @@
+"""
+预约通知邮件
+  - 预约提醒：每天定时为次日的全部有效预约批量写入发件箱，发送时间为开始前 REMINDER_LEAD，
+    到期后由发件箱线程（复用 SMTP 连接，线程数即并发上限）发送
+  - 当天的预约在创建时随预约一并写入提醒；开始前已不足 REMINDER_LEAD 的立即发送，邮件中写明实际剩余时间
+  - 取消通知：管理员取消他人的预约时通知预约用户
+提醒以 notification_key（reminder:<预约ID>）去重，重复执行或与创建预约并发写入时不会重复；预约取消时撤回尚未发送的提醒。
+"""
+
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import insert
+
+from email_service import render_email, frontend_url
+from mail_outbox import queue_email, outbox_workers
+from models import db, Reservation, User, Campus, EmailOutbox
+
+# 提醒邮件在预约开始前多久发送
+REMINDER_LEAD = timedelta(hours=1)
+# 每批写入发件箱的提醒数
+REMINDER_BATCH_SIZE = 500
+
+
+def reminder_key(reservation_id):
+    return f'reminder:{reservation_id}'
+
+
+def local_to_utc(value):
+    """本地时间（预约的日期和小时）转换为发件箱使用的 UTC 时间"""
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def format_starts_in(delta):
+    """距开始的时间，如 "1 小时"、"25 分钟"（不足一分钟按一分钟计）"""
+    hours, minutes = divmod(max(1, -(-int(delta.total_seconds()) // 60)), 60)
+    if hours and minutes:
+        return f'{hours} 小时 {minutes} 分钟'
+    return f'{hours} 小时' if hours else f'{minutes} 分钟'
+
+
+def _reservation_context(date, start_hour, end_hour, user_name, campus_name):
+    return {
+        'user_name': user_name,
+        'campus_name': campus_name,
+        'date': date.isoformat(),
+        'start_hour': start_hour,
+        'end_hour': end_hour,
+        'link': frontend_url('/reservations')
+    }
+
+
+def _reminder_query():
+    """需要提醒的有效预约及收件人信息"""
+    return db.session.query(
+        Reservation.id, Reservation.date, Reservation.start_hour, Reservation.end_hour,
+        User.email, User.name, Campus.name
+    ).join(User, Reservation.user_id == User.id).join(Campus, Reservation.campus_id == Campus.id).filter(
+        Reservation.status == 'active',
+        User.is_active.is_(True)
+    )
+
+
+def _reminder_emails(rows, now, skip_keys=()):
+    """渲染尚未开始的预约的提醒：开始前 REMINDER_LEAD 发送，已过该时间的立即发送"""
+    emails = []
+    for reservation_id, date, start_hour, end_hour, email, user_name, campus_name in rows:
+        starts_at = datetime.combine(date, datetime.min.time()).replace(hour=start_hour)
+        if reminder_key(reservation_id) in skip_keys or starts_at <= now:
+            continue
+        send_at = max(starts_at - REMINDER_LEAD, now)
+        text_body, html_body = render_email(
+            'reservation_reminder',
+            starts_in=format_starts_in(starts_at - send_at),
+            **_reservation_context(date, start_hour, end_hour, user_name, campus_name)
+        )
+        emails.append({
+            'recipient': email,
+            'subject': f"音协预约 - 排练将于 {start_hour}:00 开始",
+            'body': text_body,
+            'html': html_body,
+            'next_attempt_at': local_to_utc(send_at),
+            'notification_key': reminder_key(reservation_id)
+        })
+    return emails
+
+
+def _insert_reminders(emails):
+    """写入提醒，同一预约的提醒已被并发写入时忽略，返回写入数"""
+    if not emails:
+        return 0
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        db.session.execute(insert(EmailOutbox), emails)
+        return len(emails)
+
+    stmt = dialect_insert(EmailOutbox).values(emails).on_conflict_do_nothing(
+        index_elements=['notification_key']
+    )
+    return db.session.execute(stmt).rowcount
+
+
+def queue_reservation_reminders(day, now=None):
+    """
+    为 day 当天尚未开始的有效预约写入提醒邮件并提交
+
+    Returns:
+        新写入的提醒数
+    """
+    now = now or datetime.now()
+    rows = _reminder_query().filter(
+        Reservation.date == day
+    ).order_by(Reservation.start_hour, Reservation.id).all()
+
+    queued = 0
+    for i in range(0, len(rows), REMINDER_BATCH_SIZE):
+        batch = rows[i:i + REMINDER_BATCH_SIZE]
+        existing = {key for (key,) in db.session.query(EmailOutbox.notification_key).filter(
+            EmailOutbox.notification_key.in_([reminder_key(row[0]) for row in batch])
+        )}
+        queued += _insert_reminders(_reminder_emails(batch, now, existing))
+
+    db.session.commit()
+    if queued:
+        # 开始前不足 REMINDER_LEAD 的预约立即发送
+        outbox_workers.notify()
+    return queued
+
+
+def queue_same_day_reminders(reservation_ids, now=None):
+    """
+    为当天新建的预约写入提醒（随当前事务提交，调用前需 flush 以取得预约 ID）
+    前一天 20:00 的定时任务不会覆盖这些预约，等到每小时的补充任务可能已错过提醒时间
+
+    Returns:
+        新写入的提醒数，大于 0 时调用方应在提交后唤醒发件箱线程
+    """
+    now = now or datetime.now()
+    rows = _reminder_query().filter(
+        Reservation.id.in_(reservation_ids),
+        Reservation.date == now.date()
+    ).all()
+    return _insert_reminders(_reminder_emails(rows, now))
+
+
+def withdraw_reminder(reservation_id):
+    """撤回尚未发送的提醒（随当前事务提交）"""
+    EmailOutbox.query.filter(
+        EmailOutbox.notification_key == reminder_key(reservation_id),
+        EmailOutbox.status == 'pending'
+    ).delete(synchronize_session=False)
+
+
+def queue_cancellation_notice(reservation):
+    """通知用户其预约已被取消（随当前事务提交）"""
+    user = reservation.user
+    text_body, html_body = render_email(
+        'reservation_cancelled',
+        accent_color='#f56c6c',
+        **_reservation_context(reservation.date, reservation.start_hour, reservation.end_hour,
+                               user.name, reservation.campus.name)
+    )
+    return queue_email(user.email, "音协预约 - 预约已被取消", text_body, html_body)
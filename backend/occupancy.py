@@ -0,0 +1,123 @@
+"""
+预约占用位图索引
+按 (校区, 日期) 在进程内缓存一个 24 位的小时位图，第 h 位为 1 表示 h:00-h+1:00 已被预约。
+冲突检查只需一次按位与；数据库中的冲突检查仍是事务内的最终判定。
+本进程在 FRESH_SECONDS 内加载或标记过的条目显示已占用时直接拒绝，无需访问数据库；
+更早的条目可能已被其他进程取消的预约改变，先按 reservation_slots 确认后再拒绝。
+"""
+
+import threading
+import time
+
+from models import db, Reservation, ReservationSlot
+
+# 位图条目的最长存活时间（秒），用于兜底多进程部署下其他进程的写入
+DEFAULT_TTL = 30
+# 条目加载或标记后多久内直接采信其占用位（秒），超过后命中需按数据库确认
+FRESH_SECONDS = 5
+
+
+def hour_mask(start_hour, end_hour):
+    """返回 [start_hour, end_hour) 对应的小时位图"""
+    return ((1 << end_hour) - 1) ^ ((1 << start_hour) - 1)
+
+
+class OccupancyIndex:
+    """按 (校区, 日期) 懒加载的占用位图"""
+
+    def __init__(self, ttl=DEFAULT_TTL, fresh_seconds=FRESH_SECONDS):
+        self.ttl = ttl
+        self.fresh_seconds = fresh_seconds
+        self._lock = threading.Lock()
+        self._bitmaps = {}  # (campus_id, date) -> (bitmap, loaded_at, 最近加载或标记的时间)
+        self._generations = {}  # (campus_id, date) -> 修改次数，加载期间有修改时丢弃加载结果
+
+    def _load(self, campus_id, date):
+        rows = Reservation.query.with_entities(
+            Reservation.start_hour, Reservation.end_hour
+        ).filter(
+            Reservation.campus_id == campus_id,
+            Reservation.date == date,
+            Reservation.status == 'active'
+        ).all()
+
+        bitmap = 0
+        for start_hour, end_hour in rows:
+            bitmap |= hour_mask(start_hour, end_hour)
+        return bitmap
+
+    def _lookup(self, campus_id, date):
+        """返回 (占用位图, 最近一次加载或标记的时间)，未加载或已过期时从数据库加载"""
+        key = (int(campus_id), date)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._bitmaps.get(key)
+            if entry and now - entry[1] < self.ttl:
+                return entry[0], entry[2]
+            generation = self._generations.get(key, 0)
+
+        bitmap = self._load(key[0], date)
+        with self._lock:
+            # 加载期间的 mark/release 未反映在读到的结果中，不缓存，下次访问重新加载
+            if self._generations.get(key, 0) == generation:
+                self._bitmaps[key] = (bitmap, now, now)
+        return bitmap, now
+
+    def get(self, campus_id, date):
+        """获取某校区某日的占用位图"""
+        return self._lookup(campus_id, date)[0]
+
+    def _confirm_taken(self, campus_id, date, start_hour, end_hour):
+        """按 reservation_slots 确认时间段内确有有效预约"""
+        return db.session.query(ReservationSlot.id).filter(
+            ReservationSlot.campus_id == campus_id,
+            ReservationSlot.date == date,
+            ReservationSlot.hour >= start_hour,
+            ReservationSlot.hour < end_hour
+        ).first() is not None
+
+    def is_taken(self, campus_id, date, start_hour, end_hour):
+        """时间段内是否已有预约；未占用或条目足够新时无需访问数据库"""
+        bitmap, fresh_at = self._lookup(campus_id, date)
+        if bitmap & hour_mask(start_hour, end_hour) == 0:
+            return False
+        if time.monotonic() - fresh_at < self.fresh_seconds:
+            return True
+        if self._confirm_taken(int(campus_id), date, start_hour, end_hour):
+            return True
+        # 位图已过期（如其他进程取消了预约），丢弃后重新加载
+        self.invalidate(campus_id, date)
+        return False
+
+    def mark(self, campus_id, date, start_hour, end_hour):
+        """预约创建后标记占用（仅更新已加载的条目）"""
+        key = (int(campus_id), date)
+        with self._lock:
+            self._bump(key)
+            entry = self._bitmaps.get(key)
+            if entry:
+                self._bitmaps[key] = (entry[0] | hour_mask(start_hour, end_hour), entry[1], time.monotonic())
+
+    def release(self, campus_id, date, start_hour, end_hour):
+        """预约取消后释放占用（仅更新已加载的条目）"""
+        key = (int(campus_id), date)
+        with self._lock:
+            self._bump(key)
+            entry = self._bitmaps.get(key)
+            if entry:
+                self._bitmaps[key] = (entry[0] & ~hour_mask(start_hour, end_hour), entry[1], entry[2])
+
+    def invalidate(self, campus_id, date):
+        """丢弃某校区某日的位图，下次访问时重新加载"""
+        key = (int(campus_id), date)
+        with self._lock:
+            self._bump(key)
+            self._bitmaps.pop(key, None)
+
+    def _bump(self, key):
+        """记录一次修改（调用方持有锁）"""
+        self._generations[key] = self._generations.get(key, 0) + 1
+
+
+occupancy_index = OccupancyIndex()
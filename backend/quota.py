@@ -0,0 +1,137 @@
+"""
+每周预约时长计数器
+预约窗口为 [周日, 下周日]（两端都含），user_weekly_hours 为每个 (用户, 窗口起始周日) 维护已预约小时数。
+配额检查只需读一行；扣减使用带条件的 UPDATE，两个并发请求无法同时突破上限。
+计数器缺失时按 Reservation 现算并补建，reconcile_weekly_hours() 用于核对和修正偏差。
+"""
+
+from datetime import timedelta
+from sqlalchemy import func, insert, update
+
+from models import db, Reservation, UserWeeklyHours
+
+
+def week_starts_for(date):
+    """包含该日期的预约窗口起始周日；周日同时属于以它开始和结束的两个窗口"""
+    start = date - timedelta(days=(date.weekday() + 1) % 7)
+    if start == date:
+        return [start, start - timedelta(days=7)]
+    return [start]
+
+
+def _actual_hours(user_ids, week_start):
+    """按 Reservation 统计各用户在窗口内的有效预约时长"""
+    rows = db.session.query(
+        Reservation.user_id, func.sum(Reservation.end_hour - Reservation.start_hour)
+    ).filter(
+        Reservation.user_id.in_(user_ids),
+        Reservation.date >= week_start,
+        Reservation.date <= week_start + timedelta(days=7),
+        Reservation.status == 'active'
+    ).group_by(Reservation.user_id).all()
+    return {user_id: hours or 0 for user_id, hours in rows}
+
+
+def _insert_missing(rows):
+    """插入计数器，并发请求已插入同一行时忽略"""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        db.session.execute(insert(UserWeeklyHours), rows)
+        return
+
+    stmt = dialect_insert(UserWeeklyHours).values(rows).on_conflict_do_nothing(
+        index_elements=['user_id', 'week_start']
+    )
+    db.session.execute(stmt)
+
+
+def get_weekly_hours(user_ids, week_start):
+    """返回 {user_id: 已用小时数}，缺失的计数器按现有预约补建"""
+    user_ids = set(user_ids)
+    counters = dict(
+        db.session.query(UserWeeklyHours.user_id, UserWeeklyHours.hours).filter(
+            UserWeeklyHours.user_id.in_(user_ids),
+            UserWeeklyHours.week_start == week_start
+        ).all()
+    ) if user_ids else {}
+
+    missing = user_ids - counters.keys()
+    if missing:
+        actual = _actual_hours(missing, week_start)
+        _insert_missing([
+            {'user_id': user_id, 'week_start': week_start, 'hours': actual.get(user_id, 0)}
+            for user_id in missing
+        ])
+        counters.update({user_id: actual.get(user_id, 0) for user_id in missing})
+
+    return counters
+
+
+def _increment(user_id, week_start, hours, limit=None):
+    stmt = update(UserWeeklyHours).where(
+        UserWeeklyHours.user_id == user_id,
+        UserWeeklyHours.week_start == week_start
+    ).values(hours=UserWeeklyHours.hours + hours)
+    if limit is not None:
+        stmt = stmt.where(UserWeeklyHours.hours + hours <= limit)
+    return db.session.execute(stmt, execution_options={'synchronize_session': False}).rowcount == 1
+
+
+def add_hours(user_id, window_start, reservation_date, hours, limit):
+    """
+    在当前事务中为新预约计入时长，须在新预约写入（flush）之前调用
+    当前预约窗口的计数器带上限条件更新，返回 False 表示超出配额（调用方需回滚）；
+    该日期所属的另一个窗口（日期为周日时）只做累加。
+    先直接执行 UPDATE，使其成为事务中的第一条语句（SQLite 下直接获取写锁），计数器缺失时才补建
+    """
+    for week_start in week_starts_for(reservation_date):
+        week_limit = limit if week_start == window_start else None
+        if _increment(user_id, week_start, hours, week_limit):
+            continue
+        get_weekly_hours([user_id], week_start)
+        if not _increment(user_id, week_start, hours, week_limit):
+            return False
+    return True
+
+
+def release_hours(user_id, reservation_date, hours):
+    """在当前事务中扣除被取消预约的时长（只更新已存在的计数器）"""
+    db.session.execute(
+        update(UserWeeklyHours).where(
+            UserWeeklyHours.user_id == user_id,
+            UserWeeklyHours.week_start.in_(week_starts_for(reservation_date))
+        ).values(hours=UserWeeklyHours.hours - hours),
+        execution_options={'synchronize_session': False}
+    )
+
+
+def reconcile_weekly_hours(fix=False):
+    """
+    按 Reservation 重新计算所有计数器，返回偏差列表
+    fix=True 时把计数器修正为实际值
+    """
+    drift = []
+    week_starts = [row[0] for row in db.session.query(UserWeeklyHours.week_start).distinct()]
+
+    for week_start in week_starts:
+        counters = UserWeeklyHours.query.filter_by(week_start=week_start).all()
+        actual = _actual_hours([c.user_id for c in counters], week_start)
+        for counter in counters:
+            expected = actual.get(counter.user_id, 0)
+            if counter.hours != expected:
+                drift.append({
+                    'user_id': counter.user_id,
+                    'week_start': week_start.isoformat(),
+                    'counter_hours': counter.hours,
+                    'actual_hours': expected
+                })
+                if fix:
+                    counter.hours = expected
+
+    if fix:
+        db.session.commit()
+    return drift
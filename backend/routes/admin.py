@@ -1,8 +1,23 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import db, User, UnavailableTime, KeyManager, Campus
-from datetime import datetime
+from models import db, User, UnavailableTime, KeyManager, Campus, Job, serialize_list
+from datetime import datetime, timedelta
+from sqlalchemy import and_, or_, tuple_
+import base64
+import binascii
+import csv
+import io
+import json
 from functools import wraps
+from cache import snapshot_cache, campus_scope, cached_json_response, campus_exists
+from unavailable_rules import rule_engine, day_of_week_expression
+from quota import reconcile_weekly_hours
+from auth_claims import current_claims, bump_auth_version, auth_versions
+from jobs import create_job, start_job, is_job_running
+from user_search import filter_users_by_search
+from analytics import analytics_cache, build_analytics, summary_cache, build_admin_summary
+from export import (EXPORT_FORMATS, stream_export, reservation_export_statement,
+                    borrow_export_statement, user_export_statement)
 
 admin_bp = Blueprint('admin', __name__)
 
@@ -11,10 +26,8 @@ def admin_required(fn):
     @wraps(fn)
     @jwt_required()
     def wrapper(*args, **kwargs):
-        user_id = int(get_jwt_identity())
-        user = User.query.get(user_id)
-        
-        if not user or not user.is_admin:
+        # 令牌中的声明在权限变更时随版本号失效，无需查询用户表
+        if not current_claims().is_admin:
             return jsonify({'error': 'Admin privileges required'}), 403
         
         return fn(*args, **kwargs)
@@ -31,13 +44,24 @@ def get_unavailable_times():
         query = query.filter_by(campus_id=campus_id)
     
     # 排序：先按日期（降序，None在后），再按周几，最后按开始时间
-    unavailable_times = query.order_by(
+    query = query.order_by(
         UnavailableTime.date.desc().nullslast(),
         UnavailableTime.day_of_week.asc().nullslast(),
         UnavailableTime.start_hour.asc()
-    ).all()
+    )
     
-    return jsonify([ut.to_dict() for ut in unavailable_times]), 200
+    return jsonify(serialize_list(query, UnavailableTime.campus)), 200
+
+# 不可预约原因的最大长度（与 UnavailableTime.reason 列一致）
+REASON_MAX_LENGTH = 200
+
+def validate_unavailable_reason(reason):
+    """原因须为不超过 REASON_MAX_LENGTH 个字符的字符串（可为空），返回错误信息"""
+    if reason is not None and not isinstance(reason, str):
+        return 'reason must be a string'
+    if reason and len(reason.strip()) > REASON_MAX_LENGTH:
+        return f'reason must be at most {REASON_MAX_LENGTH} characters'
+    return None
 
 @admin_bp.route('/unavailable-times', methods=['POST'])
 @admin_required
@@ -53,10 +77,14 @@ def create_unavailable_time():
     campus_id = data['campus_id']
     start_hour = data['start_hour']
     end_hour = data['end_hour']
-    reason = data.get('reason', '')
+    reason = data.get('reason') or ''
     date = data.get('date')
     day_of_week = data.get('day_of_week')
     
+    reason_error = validate_unavailable_reason(reason)
+    if reason_error:
+        return jsonify({'error': reason_error}), 400
+    
     # 验证校区
     campus = Campus.query.get(campus_id)
     if not campus:
@@ -91,6 +119,8 @@ def create_unavailable_time():
         
         db.session.add(unavailable_time)
         db.session.commit()
+        rule_engine.invalidate(campus_id)
+        snapshot_cache.bump(campus_scope(campus_id))
         
         return jsonify({
             'message': 'Unavailable time created successfully',
@@ -100,6 +130,166 @@ def create_unavailable_time():
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+# 单次导入的最大规则数
+IMPORT_LIMIT = 2000
+
+IMPORT_FIELDS = ['campus_id', 'date', 'day_of_week', 'start_hour', 'end_hour', 'reason']
+
+def parse_import_int(value):
+    """导入值转为整数，空值返回 None（CSV 中所有值均为字符串）"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError
+    return int(value)
+
+def parse_unavailable_rule(raw, known_campuses):
+    """校验一条导入的规则，返回 (字段字典, 错误信息)"""
+    if not isinstance(raw, dict):
+        return None, 'Rule must be an object'
+    
+    try:
+        campus_id = parse_import_int(raw.get('campus_id'))
+        start_hour = parse_import_int(raw.get('start_hour'))
+        end_hour = parse_import_int(raw.get('end_hour'))
+        day_of_week = parse_import_int(raw.get('day_of_week'))
+    except ValueError:
+        return None, 'campus_id, day_of_week, start_hour and end_hour must be integers'
+    
+    if campus_id is None or start_hour is None or end_hour is None:
+        return None, 'campus_id, start_hour and end_hour are required'
+    if campus_id not in known_campuses:
+        return None, 'Campus not found'
+    if start_hour >= end_hour or start_hour < 0 or end_hour > 24:
+        return None, 'Invalid time range'
+    if day_of_week is not None and not 0 <= day_of_week <= 6:
+        return None, 'day_of_week must be an integer between 0 (Sunday) and 6 (Saturday)'
+    
+    reason_error = validate_unavailable_reason(raw.get('reason'))
+    if reason_error:
+        return None, reason_error
+    
+    unavailable_date = None
+    if raw.get('date'):
+        try:
+            unavailable_date = datetime.strptime(str(raw['date']).strip(), '%Y-%m-%d').date()
+        except ValueError:
+            return None, 'Invalid date format. Use YYYY-MM-DD'
+    
+    return {
+        'campus_id': campus_id,
+        'date': unavailable_date,
+        'day_of_week': day_of_week,
+        'start_hour': start_hour,
+        'end_hour': end_hour,
+        'reason': (raw.get('reason') or '').strip()
+    }, None
+
+def read_import_rules():
+    """读取导入的规则：JSON {rules: [...]}，或 CSV（请求体或上传的 file 文件，首行为表头）"""
+    upload = request.files.get('file')
+    if upload or (request.mimetype or '').startswith('text/csv'):
+        text = upload.read().decode('utf-8-sig') if upload else request.get_data(as_text=True).lstrip('\ufeff')
+        rows = list(csv.DictReader(io.StringIO(text)))
+        return [{k.strip(): (v.strip() if isinstance(v, str) else v) for k, v in row.items() if k} for row in rows], \
+            request.args.get('dry_run', 'false').lower() == 'true'
+    
+    data = request.get_json(silent=True) or {}
+    dry_run = bool(data.get('dry_run')) or request.args.get('dry_run', 'false').lower() == 'true'
+    return data.get('rules'), dry_run
+
+@admin_bp.route('/unavailable-times/import', methods=['POST'])
+@admin_required
+def import_unavailable_times():
+    """
+    批量导入不可预约时间（如整学期课表）
+    全部规则一次校验，任一条无效则不导入；全部有效时在同一事务中插入，
+    并返回与新规则冲突的现有有效预约（今天及以后）。dry_run=true 时只返回报告，不写入
+    """
+    rules, dry_run = read_import_rules()
+    
+    if not isinstance(rules, list) or not rules:
+        return jsonify({'error': 'rules is required'}), 400
+    if len(rules) > IMPORT_LIMIT:
+        return jsonify({'error': f'At most {IMPORT_LIMIT} rules per import'}), 400
+    
+    known_campuses = {c.id for c in Campus.query.all()}
+    parsed = []
+    errors = []
+    for i, raw in enumerate(rules):
+        values, error = parse_unavailable_rule(raw, known_campuses)
+        if error:
+            errors.append({'index': i, 'error': error})
+        else:
+            parsed.append(values)
+    
+    if errors:
+        return jsonify({
+            'error': 'Import rejected. No rules were created.',
+            'errors': errors
+        }), 400
+    
+    try:
+        new_rules = [UnavailableTime(**values) for values in parsed]
+        db.session.add_all(new_rules)
+        db.session.flush()
+        index_by_id = {rule.id: i for i, rule in enumerate(new_rules)}
+        
+        # 一次区间连接查询找出与新规则冲突的预约：同校区、小时重叠，且日期、周几或全部日期匹配
+        from models import Reservation
+        conflicts = db.session.query(
+            Reservation.id, Reservation.campus_id, Reservation.date,
+            Reservation.start_hour, Reservation.end_hour,
+            User.name, User.student_id, UnavailableTime.id
+        ).join(
+            UnavailableTime, and_(
+                UnavailableTime.campus_id == Reservation.campus_id,
+                UnavailableTime.start_hour < Reservation.end_hour,
+                UnavailableTime.end_hour > Reservation.start_hour,
+                or_(
+                    and_(UnavailableTime.date.is_(None), UnavailableTime.day_of_week.is_(None)),
+                    UnavailableTime.date == Reservation.date,
+                    UnavailableTime.day_of_week == day_of_week_expression(Reservation.date)
+                )
+            )
+        ).join(User, Reservation.user_id == User.id).filter(
+            UnavailableTime.id.in_(list(index_by_id)),
+            Reservation.status == 'active',
+            Reservation.date >= datetime.now().date()
+        ).order_by(Reservation.date, Reservation.start_hour, Reservation.id).all()
+        
+        affected = {}
+        for reservation_id, campus_id, date, start_hour, end_hour, user_name, student_id, rule_id in conflicts:
+            entry = affected.setdefault(reservation_id, {
+                'reservation_id': reservation_id,
+                'campus_id': campus_id,
+                'date': date.isoformat(),
+                'start_hour': start_hour,
+                'end_hour': end_hour,
+                'user_name': user_name,
+                'student_id': student_id,
+                'rule_indexes': []
+            })
+            entry['rule_indexes'].append(index_by_id[rule_id])
+        
+        if dry_run:
+            db.session.rollback()
+        else:
+            db.session.commit()
+            for campus_id in {values['campus_id'] for values in parsed}:
+                rule_engine.invalidate(campus_id)
+                snapshot_cache.bump(campus_scope(campus_id))
+        
+        return jsonify({
+            'message': f'{len(new_rules)} rules validated' if dry_run else f'{len(new_rules)} rules imported successfully',
+            'dry_run': dry_run,
+            'created': 0 if dry_run else len(new_rules),
+            'affected_reservations': list(affected.values())
+        }), 200 if dry_run else 201
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
 @admin_bp.route('/unavailable-times/<int:id>', methods=['DELETE'])
 @admin_required
 def delete_unavailable_time(id):
@@ -109,9 +299,13 @@ def delete_unavailable_time(id):
     if not unavailable_time:
         return jsonify({'error': 'Unavailable time not found'}), 404
     
+    campus_id = unavailable_time.campus_id
+    
     try:
         db.session.delete(unavailable_time)
         db.session.commit()
+        rule_engine.invalidate(campus_id)
+        snapshot_cache.bump(campus_scope(campus_id))
         
         return jsonify({'message': 'Unavailable time deleted successfully'}), 200
     except Exception as e:
@@ -122,14 +316,16 @@ def delete_unavailable_time(id):
 def get_key_managers():
     """获取所有钥匙管理员"""
     campus_id = request.args.get('campus_id', type=int)
+    if campus_id and not campus_exists(campus_id):
+        return jsonify({'error': 'Campus not found'}), 404
     
-    query = KeyManager.query.filter_by(is_active=True)
-    if campus_id:
-        query = query.filter_by(campus_id=campus_id)
-    
-    key_managers = query.all()
+    def build_key_managers():
+        query = KeyManager.query.filter_by(is_active=True)
+        if campus_id:
+            query = query.filter_by(campus_id=campus_id)
+        return serialize_list(query, KeyManager.campus)
     
-    return jsonify([km.to_dict() for km in key_managers]), 200
+    return cached_json_response('key_managers', campus_id, build_key_managers)
 
 @admin_bp.route('/key-managers', methods=['POST'])
 @admin_required
@@ -160,6 +356,7 @@ def create_key_manager():
         
         db.session.add(key_manager)
         db.session.commit()
+        snapshot_cache.bump('key_managers')
         
         return jsonify({
             'message': 'Key manager created successfully',
@@ -189,6 +386,7 @@ def update_key_manager(id):
     
     try:
         db.session.commit()
+        snapshot_cache.bump('key_managers')
         
         return jsonify({
             'message': 'Key manager updated successfully',
@@ -210,6 +408,7 @@ def delete_key_manager(id):
     try:
         db.session.delete(key_manager)
         db.session.commit()
+        snapshot_cache.bump('key_managers')
         
         return jsonify({'message': 'Key manager deleted successfully'}), 200
     except Exception as e:
@@ -223,7 +422,7 @@ def get_all_users():
     # 获取筛选参数
     is_active = request.args.get('is_active')  # 'true' 或 'false'
     year = request.args.get('year', type=int)  # 入学年份
-    search = request.args.get('search', '')  # 搜索名称
+    search = request.args.get('search', '').strip()  # 搜索姓名或学号
     
     query = User.query
     
@@ -234,15 +433,13 @@ def get_all_users():
         elif is_active.lower() == 'false':
             query = query.filter_by(is_active=False)
     
-    # 按入学年份筛选（根据学号前两位）
+    # 按入学年份筛选（注册时由学号推导，带索引）
     if year:
-        # 学号格式通常为 BYYYXXXXXXXX，其中YY是年份后两位
-        year_suffix = str(year % 100).zfill(2)  # 例如 2024 -> "24"
-        query = query.filter(User.student_id.like(f'%{year_suffix}%'))
+        query = query.filter(User.enrollment_year == year)
     
-    # 按名称搜索
+    # 按姓名或学号搜索（SQLite 下使用全文索引）
     if search:
-        query = query.filter(User.name.like(f'%{search}%'))
+        query = filter_users_by_search(query, search)
     
     users = query.order_by(User.created_at.desc()).all()
     return jsonify([u.to_dict() for u in users]), 200
@@ -263,7 +460,9 @@ def toggle_user_active(user_id):
     
     try:
         user.is_active = not user.is_active
+        bump_auth_version(user)
         db.session.commit()
+        auth_versions.invalidate([user.id])
         
         return jsonify({
             'message': f'User {"activated" if user.is_active else "deactivated"} successfully',
@@ -276,16 +475,17 @@ def toggle_user_active(user_id):
 @admin_bp.route('/users/annual-reset', methods=['POST'])
 @admin_required
 def annual_reset_users():
-    """每年1月1日重置所有普通用户为禁用状态"""
+    """每年1月1日重置所有普通用户为禁用状态（后台分批执行，返回任务）"""
     try:
         # 只禁用非管理员用户
-        result = User.query.filter_by(is_admin=False).update({'is_active': False})
-        db.session.commit()
+        job = create_job('annual_reset', created_by=int(get_jwt_identity()))
+        start_job(job.id)
         
         return jsonify({
-            'message': f'Successfully deactivated {result} non-admin users',
-            'count': result
-        }), 200
+            'message': f'Deactivating {job.total} non-admin users',
+            'count': job.total,
+            'job': job.to_dict()
+        }), 202
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -293,34 +493,108 @@ def annual_reset_users():
 @admin_bp.route('/users/batch-activate', methods=['POST'])
 @admin_required
 def batch_activate_users():
-    """批量激活用户"""
+    """批量激活用户（后台分批执行，返回任务）"""
     data = request.get_json()
     user_ids = data.get('user_ids', [])
     
     if not user_ids:
         return jsonify({'error': 'user_ids is required'}), 400
+    if not isinstance(user_ids, list) or not all(isinstance(i, int) and not isinstance(i, bool) for i in user_ids):
+        return jsonify({'error': 'user_ids must be a list of integers'}), 400
     
     try:
-        result = User.query.filter(User.id.in_(user_ids)).update({'is_active': True}, synchronize_session=False)
-        db.session.commit()
+        job = create_job('batch_activate', {'user_ids': sorted(set(user_ids))}, created_by=int(get_jwt_identity()))
+        start_job(job.id)
         
         return jsonify({
-            'message': f'Successfully activated {result} users',
-            'count': result
+            'message': f'Activating {job.total} users',
+            'count': job.total,
+            'job': job.to_dict()
+        }), 202
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/jobs', methods=['GET'])
+@admin_required
+def get_jobs():
+    """最近的后台任务"""
+    limit = min(request.args.get('limit', 20, type=int), 100)
+    jobs = Job.query.order_by(Job.id.desc()).limit(limit).all()
+    return jsonify([job.to_dict() for job in jobs]), 200
+
+@admin_bp.route('/jobs/<int:job_id>', methods=['GET'])
+@admin_required
+def get_job(job_id):
+    """后台任务进度"""
+    job = db.session.get(Job, job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict()), 200
+
+@admin_bp.route('/jobs/<int:job_id>/resume', methods=['POST'])
+@admin_required
+def resume_job(job_id):
+    """从上次的进度继续执行失败或已中断的任务"""
+    job = db.session.get(Job, job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    if job.status == 'completed':
+        return jsonify({'error': 'Job already completed'}), 400
+    if is_job_running(job):
+        return jsonify({'error': 'Job is already running'}), 409
+    
+    start_job(job.id)
+    return jsonify({'message': 'Job resumed', 'job': job.to_dict()}), 202
+
+@admin_bp.route('/weekly-hours/reconcile', methods=['POST'])
+@admin_required
+def reconcile_weekly_hours_route():
+    """核对每周预约时长计数器，fix=true 时修正偏差"""
+    data = request.get_json(silent=True) or {}
+    fix = bool(data.get('fix', False))
+    
+    try:
+        drift = reconcile_weekly_hours(fix=fix)
+        return jsonify({
+            'drift': drift,
+            'count': len(drift),
+            'fixed': fix
         }), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+# 历史预约记录每页最大条数
+HISTORY_PAGE_SIZE_LIMIT = 100
+
+def encode_cursor(created_at, reservation_id):
+    """把 (created_at, id) 编码为不透明的分页游标"""
+    raw = json.dumps([created_at, reservation_id])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    """解析分页游标，返回 (created_at, id)，格式无效时抛出 ValueError"""
+    try:
+        created_at, reservation_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return datetime.fromisoformat(created_at), int(reservation_id)
+    except (TypeError, ValueError, UnicodeError, binascii.Error):
+        raise ValueError('Invalid cursor')
+
 @admin_bp.route('/reservations', methods=['GET'])
 @admin_required
 def get_reservation_history():
-    """获取历史预约记录（支持筛选和分页）"""
+    """
+    获取历史预约记录（支持筛选和游标分页）
+    按 (created_at, id) 倒序，cursor 为上一页返回的 next_cursor；
+    with_total=true 时附带总数（短时缓存）
+    """
     from models import Reservation
     
     # 获取分页参数
-    page = request.args.get('page', 1, type=int)
-    page_size = request.args.get('page_size', 20, type=int)
+    cursor = request.args.get('cursor')
+    page_size = min(max(request.args.get('page_size', 20, type=int), 1), HISTORY_PAGE_SIZE_LIMIT)
+    with_total = request.args.get('with_total', 'false').lower() == 'true'
     
     # 获取筛选参数
     user_name = request.args.get('user_name', '')
@@ -354,19 +628,144 @@ def get_reservation_history():
         except ValueError:
             return jsonify({'error': 'Invalid end_date format. Use YYYY-MM-DD'}), 400
     
-    # 按创建时间倒序排列
-    query = query.order_by(Reservation.created_at.desc())
+    total = None
+    if with_total:
+        # 总数只随筛选条件变化，短时缓存，翻页时不再重复统计
+        filter_key = (user_name, campus_id, start_date, end_date)
+        total = snapshot_cache.get('reservation_history_total', filter_key, query.count)
     
-    # 分页
-    total = query.count()
-    reservations = query.offset((page - 1) * page_size).limit(page_size).all()
+    # 从游标位置继续，利用 (created_at, id) 索引直接定位，与页码深度无关
+    if cursor:
+        try:
+            cursor_created_at, cursor_id = decode_cursor(cursor)
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        query = query.filter(
+            tuple_(Reservation.created_at, Reservation.id) < (cursor_created_at, cursor_id)
+        )
     
-    # 构建返回数据，使用to_dict()方法已经包含了用户和校区名称
-    reservation_list = [r.to_dict() for r in reservations]
+    # 按创建时间倒序排列，多取一条判断是否还有下一页
+    page_query = query.order_by(
+        Reservation.created_at.desc(), Reservation.id.desc()
+    ).limit(page_size + 1)
+    
+    # 构建返回数据，预加载to_dict()需要的用户和校区
+    reservation_list = serialize_list(page_query, Reservation.user, Reservation.campus)
+    has_more = len(reservation_list) > page_size
+    reservation_list = reservation_list[:page_size]
+    last = reservation_list[-1] if reservation_list else None
     
     return jsonify({
         'data': reservation_list,
+        'next_cursor': encode_cursor(last['created_at'], last['id']) if has_more else None,
         'total': total,
-        'page': page,
         'page_size': page_size
     }), 200
+
+def parse_export_args():
+    """解析导出接口的格式和日期范围参数，返回 (格式, 开始日期, 结束日期, 错误信息)"""
+    export_format = request.args.get('format', 'csv').lower()
+    if export_format not in EXPORT_FORMATS:
+        return None, None, None, f'Invalid format. Use one of: {", ".join(EXPORT_FORMATS)}'
+    
+    dates = []
+    for name in ('start_date', 'end_date'):
+        value = request.args.get(name)
+        try:
+            dates.append(datetime.strptime(value, '%Y-%m-%d').date() if value else None)
+        except ValueError:
+            return None, None, None, f'Invalid {name} format. Use YYYY-MM-DD'
+    
+    return export_format, dates[0], dates[1], None
+
+@admin_bp.route('/export/reservations', methods=['GET'])
+@admin_required
+def export_reservations():
+    """流式导出预约记录（format=csv|ndjson，可按校区和日期范围筛选）"""
+    from models import Reservation
+    
+    export_format, start, end, error = parse_export_args()
+    if error:
+        return jsonify({'error': error}), 400
+    
+    statement = reservation_export_statement()
+    campus_id = request.args.get('campus_id', type=int)
+    if campus_id:
+        statement = statement.where(Reservation.campus_id == campus_id)
+    if start:
+        statement = statement.where(Reservation.date >= start)
+    if end:
+        statement = statement.where(Reservation.date <= end)
+    
+    return stream_export(statement.order_by(Reservation.id), export_format, 'reservations')
+
+@admin_bp.route('/export/borrows', methods=['GET'])
+@admin_required
+def export_borrows():
+    """流式导出设备借用记录（format=csv|ndjson，可按借用日期范围筛选）"""
+    from models import EquipmentBorrow
+    
+    export_format, start, end, error = parse_export_args()
+    if error:
+        return jsonify({'error': error}), 400
+    
+    statement = borrow_export_statement()
+    if start:
+        statement = statement.where(EquipmentBorrow.borrow_time >= datetime.combine(start, datetime.min.time()))
+    if end:
+        statement = statement.where(EquipmentBorrow.borrow_time < datetime.combine(end + timedelta(days=1), datetime.min.time()))
+    
+    return stream_export(statement.order_by(EquipmentBorrow.id), export_format, 'borrows')
+
+@admin_bp.route('/export/users', methods=['GET'])
+@admin_required
+def export_users():
+    """流式导出用户（format=csv|ndjson，可按激活状态和入学年份筛选）"""
+    export_format, _, _, error = parse_export_args()
+    if error:
+        return jsonify({'error': error}), 400
+    
+    statement = user_export_statement()
+    is_active = request.args.get('is_active')
+    if is_active is not None and is_active.lower() in ('true', 'false'):
+        statement = statement.where(User.is_active == (is_active.lower() == 'true'))
+    year = request.args.get('year', type=int)
+    if year:
+        statement = statement.where(User.enrollment_year == year)
+    
+    return stream_export(statement.order_by(User.id), export_format, 'users')
+
+# 统计接口默认的日期范围（天）
+ANALYTICS_DEFAULT_DAYS = 90
+
+@admin_bp.route('/analytics', methods=['GET'])
+@admin_required
+def get_analytics():
+    """
+    排练室使用统计：周几×小时热力图、未到率（未登记取钥匙）、用户预约时长分布
+    可按校区筛选，默认统计最近 90 天；结果按 (校区, 日期范围) 缓存
+    """
+    campus_id = request.args.get('campus_id', type=int)
+    
+    try:
+        end = datetime.strptime(request.args['end_date'], '%Y-%m-%d').date() \
+            if request.args.get('end_date') else datetime.now().date()
+        start = datetime.strptime(request.args['start_date'], '%Y-%m-%d').date() \
+            if request.args.get('start_date') else end - timedelta(days=ANALYTICS_DEFAULT_DAYS - 1)
+    except ValueError:
+        return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
+    
+    if start > end:
+        return jsonify({'error': 'start_date must not be after end_date'}), 400
+    
+    return cached_json_response(
+        'analytics', (campus_id, start, end),
+        lambda: build_analytics(campus_id, start, end),
+        cache=analytics_cache
+    )
+
+@admin_bp.route('/summary', methods=['GET'])
+@admin_required
+def get_summary():
+    """管理后台概览计数（待激活用户、启用用户、各校区今日预约、未归还钥匙、未归还设备），短时缓存"""
+    return cached_json_response('admin_summary', None, build_admin_summary, cache=summary_cache)
@@ -1,8 +1,14 @@
 from flask import Blueprint, request, jsonify, current_app
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
-from models import db, User
-from datetime import datetime, timedelta
-import secrets
+from flask_jwt_extended import jwt_required
+from models import db, User, PASSWORD_HASH_METHOD
+from auth_claims import (create_user_token, bump_auth_version, auth_versions, user_profiles,
+                         current_user, current_user_profile)
+from mail_outbox import outbox_workers
+from login_guard import password_pool, PasswordHashBusy, login_retry_after
+from verification import issue_verification_token, find_verification_token, revoke_verification_tokens
+from werkzeug.security import generate_password_hash
+from datetime import datetime
+import math
 import re
 
 auth_bp = Blueprint('auth', __name__)
@@ -57,26 +63,22 @@ def register():
     )
     user.set_password(password)
     
-    # 如果启用了邮箱验证，生成验证令牌并发送邮件
+    # 如果启用了邮箱验证，生成验证令牌并把验证邮件加入发件箱（与用户一起提交，由后台线程发送）
     email_verification_enabled = current_app.config.get('EMAIL_VERIFICATION_ENABLED', False)
-    email_sent = False
-    
-    if email_verification_enabled:
-        try:
-            from email_service import send_verification_email
-            
-            # 生成验证令牌
-            verification_token = secrets.token_urlsafe(32)
-            user.verification_token = verification_token
-            user.verification_token_expires = datetime.utcnow() + timedelta(minutes=30)
-            
-            # 发送验证邮件
-            email_sent = send_verification_email(email, name, verification_token)
-        except Exception as e:
-            current_app.logger.error(f"Failed to send verification email: {str(e)}")
+    # 只有开启邮箱验证时注册的账户在长期未验证时会被清理
+    user.registered_via_verification = email_verification_enabled
     
     try:
         db.session.add(user)
+        
+        if email_verification_enabled:
+            from email_service import queue_verification_email
+            
+            # 生成验证令牌（数据库只保存摘要）
+            verification_token = issue_verification_token(user)
+            
+            queue_verification_email(email, name, verification_token)
+        
         db.session.commit()
         
         response_data = {
@@ -85,12 +87,9 @@ def register():
         }
         
         if email_verification_enabled:
-            if email_sent:
-                response_data['message'] = 'Registration successful. Please check your email to verify your account.'
-                response_data['email_sent'] = True
-            else:
-                response_data['message'] = 'Registration successful but failed to send verification email. Your account needs to be activated by an administrator.'
-                response_data['email_sent'] = False
+            outbox_workers.notify()
+            response_data['message'] = 'Registration successful. Please check your email to verify your account.'
+            response_data['email_sent'] = True
         else:
             response_data['message'] = 'Registration successful. Your account needs to be activated by an administrator.'
         
@@ -110,18 +109,44 @@ def login():
     if not email or not password:
         return jsonify({'error': 'Email and password are required'}), 400
     
+    # 按邮箱和 IP 限制尝试次数
+    retry_after = login_retry_after(email, request.remote_addr or '')
+    if retry_after:
+        response = jsonify({'error': 'Too many login attempts. Please try again later.'})
+        response.headers['Retry-After'] = str(math.ceil(retry_after))
+        return response, 429
+    
     # 查找用户
     user = User.query.filter_by(email=email).first()
     
-    if not user or not user.check_password(password):
+    # 密码校验在有界线程池中执行，排队已满时直接拒绝
+    try:
+        valid = user is not None and password_pool.run(user.check_password, password)
+    except PasswordHashBusy:
+        response = jsonify({'error': 'Server is busy. Please try again later.'})
+        response.headers['Retry-After'] = '1'
+        return response, 429
+    
+    if not valid:
         return jsonify({'error': 'Invalid email or password'}), 401
     
     # 检查用户是否被禁用
     if not user.is_active:
         return jsonify({'error': 'Account is disabled'}), 403
     
+    # 哈希参数已调整：用本次登录的明文按新参数重新哈希
+    if user.password_needs_rehash():
+        try:
+            user.password_hash = password_pool.run(generate_password_hash, password, PASSWORD_HASH_METHOD)
+            db.session.commit()
+        except PasswordHashBusy:
+            pass
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"Failed to rehash password: {str(e)}")
+    
     # 创建访问令牌
-    access_token = create_access_token(identity=str(user.id))
+    access_token = create_user_token(user)
     
     return jsonify({
         'access_token': access_token,
@@ -132,20 +157,18 @@ def login():
 @jwt_required()
 def get_current_user():
     """获取当前登录用户信息"""
-    user_id = int(get_jwt_identity())
-    user = User.query.get(user_id)
+    profile = current_user_profile()
     
-    if not user:
+    if not profile:
         return jsonify({'error': 'User not found'}), 404
     
-    return jsonify(user.to_dict()), 200
+    return jsonify(profile), 200
 
 @auth_bp.route('/update-profile', methods=['PUT'])
 @jwt_required()
 def update_profile():
     """更新用户信息"""
-    user_id = int(get_jwt_identity())
-    user = User.query.get(user_id)
+    user = current_user()
     
     if not user:
         return jsonify({'error': 'User not found'}), 404
@@ -164,6 +187,7 @@ def update_profile():
     
     try:
         db.session.commit()
+        user_profiles.invalidate([user.id])
         return jsonify({
             'message': 'Profile updated successfully',
             'user': user.to_dict()
@@ -184,25 +208,28 @@ def verify_email():
     if not token:
         return jsonify({'error': 'Verification token is required'}), 400
     
-    # 查找用户
-    user = User.query.filter_by(verification_token=token).first()
+    # 按令牌摘要查找
+    record = find_verification_token(token)
     
-    if not user:
+    if not record:
         return jsonify({'error': 'Invalid verification token'}), 400
     
     # 检查令牌是否过期
-    if user.verification_token_expires and user.verification_token_expires < datetime.utcnow():
+    if record.expires_at < datetime.utcnow():
         return jsonify({'error': 'Verification token has expired'}), 400
     
     # 验证邮箱
+    user = record.user
     user.email_verified = True
-    user.verification_token = None
-    user.verification_token_expires = None
+    revoke_verification_tokens(user.id)
     # 邮箱验证后自动激活账户
     user.is_active = True
+    bump_auth_version(user)
     
     try:
         db.session.commit()
+        auth_versions.invalidate([user.id])
+        user_profiles.invalidate([user.id])
         return jsonify({
             'message': 'Email verified successfully. Your account is now active.',
             'user': user.to_dict()
@@ -232,26 +259,19 @@ def resend_verification():
         return jsonify({'error': 'Email already verified'}), 400
     
     try:
-        from email_service import send_verification_email
+        from email_service import queue_verification_email
         
-        # 生成新的验证令牌
-        verification_token = secrets.token_urlsafe(32)
-        user.verification_token = verification_token
-        user.verification_token_expires = datetime.utcnow() + timedelta(minutes=30)
+        # 生成新的验证令牌，旧令牌失效
+        verification_token = issue_verification_token(user)
         
+        # 验证邮件加入发件箱，由后台线程发送
+        queue_verification_email(email, user.name, verification_token)
         db.session.commit()
+        outbox_workers.notify()
         
-        # 发送验证邮件
-        email_sent = send_verification_email(email, user.name, verification_token)
-        
-        if email_sent:
-            return jsonify({
-                'message': 'Verification email sent successfully'
-            }), 200
-        else:
-            return jsonify({
-                'error': 'Failed to send verification email'
-            }), 500
+        return jsonify({
+            'message': 'Verification email sent successfully'
+        }), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -260,13 +280,12 @@ def resend_verification():
 @jwt_required()
 def check_verification_status():
     """检查当前用户的邮箱验证状态"""
-    user_id = int(get_jwt_identity())
-    user = User.query.get(user_id)
+    profile = current_user_profile()
     
-    if not user:
+    if not profile:
         return jsonify({'error': 'User not found'}), 404
     
     return jsonify({
-        'email_verified': user.email_verified,
+        'email_verified': profile['email_verified'],
         'email_verification_enabled': current_app.config.get('EMAIL_VERIFICATION_ENABLED', False)
     }), 200
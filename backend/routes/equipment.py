@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import db, Equipment, EquipmentBorrow, User, Campus
+from models import db, Equipment, EquipmentBorrow, User, Campus, serialize_list
+from auth_claims import current_claims
 from datetime import datetime
 
 equipment_bp = Blueprint('equipment', __name__)
@@ -78,11 +79,11 @@ def get_equipment_borrows():
     """获取设备借用记录"""
     status = request.args.get('status', 'borrowed')
     
-    borrows = EquipmentBorrow.query.filter_by(status=status).order_by(
+    query = EquipmentBorrow.query.filter_by(status=status).order_by(
         EquipmentBorrow.borrow_time.desc()
-    ).limit(100).all()
+    ).limit(100)
     
-    return jsonify([b.to_dict() for b in borrows]), 200
+    return jsonify(serialize_list(query, EquipmentBorrow.user)), 200
 
 @equipment_bp.route('/my-borrows', methods=['GET'])
 @jwt_required()
@@ -90,11 +91,11 @@ def get_my_borrows():
     """获取我的借用记录"""
     user_id = int(get_jwt_identity())
     
-    borrows = EquipmentBorrow.query.filter_by(user_id=user_id).order_by(
+    query = EquipmentBorrow.query.filter_by(user_id=user_id).order_by(
         EquipmentBorrow.borrow_time.desc()
-    ).all()
+    )
     
-    return jsonify([b.to_dict() for b in borrows]), 200
+    return jsonify(serialize_list(query, EquipmentBorrow.user)), 200
 
 # 设备登记相关
 
@@ -173,9 +174,9 @@ def get_equipment_list():
     if equipment_type:
         query = query.filter_by(equipment_type=equipment_type)
     
-    equipment_list = query.order_by(Equipment.placed_at.desc()).all()
+    query = query.order_by(Equipment.placed_at.desc())
     
-    return jsonify([e.to_dict() for e in equipment_list]), 200
+    return jsonify(serialize_list(query, Equipment.owner, Equipment.campus)), 200
 
 @equipment_bp.route('/my-equipment', methods=['GET'])
 @jwt_required()
@@ -183,11 +184,11 @@ def get_my_equipment():
     """获取我的设备"""
     user_id = int(get_jwt_identity())
     
-    equipment_list = Equipment.query.filter_by(user_id=user_id).order_by(
+    query = Equipment.query.filter_by(user_id=user_id).order_by(
         Equipment.placed_at.desc()
-    ).all()
+    )
     
-    return jsonify([e.to_dict() for e in equipment_list]), 200
+    return jsonify(serialize_list(query, Equipment.owner, Equipment.campus)), 200
 
 @equipment_bp.route('/<int:equipment_id>', methods=['PUT'])
 @jwt_required()
@@ -236,7 +237,6 @@ def update_equipment(equipment_id):
 def delete_equipment(equipment_id):
     """删除设备"""
     user_id = int(get_jwt_identity())
-    user = User.query.get(user_id)
     
     equipment = Equipment.query.get(equipment_id)
     
@@ -244,7 +244,7 @@ def delete_equipment(equipment_id):
         return jsonify({'error': 'Equipment not found'}), 404
     
     # 只有设备所有者或管理员可以删除
-    if equipment.user_id != user_id and not user.is_admin:
+    if equipment.user_id != user_id and not current_claims().is_admin:
         return jsonify({'error': 'Unauthorized'}), 403
     
     try:
@@ -1,17 +1,38 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import db, Reservation, KeyManager
+from models import db, Reservation, KeyManager, serialize_list
 from datetime import datetime
+from sqlalchemy import update
+from cache import snapshot_cache, campus_scope, cached_json_response, campus_exists
+from events import event_broker, key_event
+from key_holders import set_key_holder, clear_key_holder, build_key_status
 
 key_bp = Blueprint('key', __name__)
 
-@key_bp.route('/pickup/<int:reservation_id>', methods=['POST'])
-@jwt_required()
-def pickup_key(reservation_id):
-    """登记取钥匙"""
-    user_id = int(get_jwt_identity())
-    
-    reservation = Reservation.query.get(reservation_id)
+def transition_key(reservation_id, user_id, conditions, values):
+    """
+    用一条条件 UPDATE 变更钥匙状态，重复提交或并发请求中只有一个能满足条件
+
+    Returns:
+        变更后的钥匙状态（id、campus_id 和钥匙字段），条件不满足时返回 None
+    """
+    return db.session.execute(
+        update(Reservation).where(
+            Reservation.id == reservation_id,
+            Reservation.user_id == user_id,
+            Reservation.status == 'active',
+            *conditions
+        ).values(**values).returning(
+            Reservation.id, Reservation.campus_id,
+            Reservation.key_picked_up, Reservation.key_pickup_time,
+            Reservation.key_returned, Reservation.key_return_time
+        ),
+        execution_options={'synchronize_session': False}
+    ).first()
+
+def transition_error(reservation_id, user_id, action):
+    """状态变更失败时才读取预约，判断失败原因（action 为 pickup 或 return）"""
+    reservation = db.session.get(Reservation, reservation_id)
     
     if not reservation:
         return jsonify({'error': 'Reservation not found'}), 404
@@ -24,18 +45,38 @@ def pickup_key(reservation_id):
     if reservation.status != 'active':
         return jsonify({'error': 'Reservation is not active'}), 400
     
-    # 检查是否已经登记
-    if reservation.key_picked_up:
+    if action == 'pickup':
         return jsonify({'error': 'Key already picked up'}), 400
     
+    # 检查是否已领取钥匙
+    if not reservation.key_picked_up:
+        return jsonify({'error': 'Key has not been picked up yet'}), 400
+    
+    return jsonify({'error': 'Key already returned'}), 400
+
+@key_bp.route('/pickup/<int:reservation_id>', methods=['POST'])
+@jwt_required()
+def pickup_key(reservation_id):
+    """登记取钥匙"""
+    user_id = int(get_jwt_identity())
+    
     try:
-        reservation.key_picked_up = True
-        reservation.key_pickup_time = datetime.utcnow()
+        keys = transition_key(
+            reservation_id, user_id,
+            [Reservation.key_picked_up.isnot(True)],
+            {'key_picked_up': True, 'key_pickup_time': datetime.utcnow()}
+        )
+        if keys is None:
+            db.session.rollback()
+            return transition_error(reservation_id, user_id, 'pickup')
+        set_key_holder(keys.campus_id, keys.id, keys.key_pickup_time)
         db.session.commit()
+        snapshot_cache.bump(campus_scope(keys.campus_id))
+        event_broker.publish(keys.campus_id, 'key_picked_up', key_event(keys))
         
         return jsonify({
             'message': 'Key pickup registered successfully',
-            'reservation': reservation.to_dict()
+            'reservation': key_event(keys)
         }), 200
     except Exception as e:
         db.session.rollback()
@@ -47,35 +88,23 @@ def return_key(reservation_id):
     """登记归还钥匙"""
     user_id = int(get_jwt_identity())
     
-    reservation = Reservation.query.get(reservation_id)
-    
-    if not reservation:
-        return jsonify({'error': 'Reservation not found'}), 404
-    
-    # 只有预约用户可以登记
-    if reservation.user_id != user_id:
-        return jsonify({'error': 'Unauthorized'}), 403
-    
-    # 检查预约是否有效
-    if reservation.status != 'active':
-        return jsonify({'error': 'Reservation is not active'}), 400
-    
-    # 检查是否已领取钥匙
-    if not reservation.key_picked_up:
-        return jsonify({'error': 'Key has not been picked up yet'}), 400
-    
-    # 检查是否已经归还
-    if reservation.key_returned:
-        return jsonify({'error': 'Key already returned'}), 400
-    
     try:
-        reservation.key_returned = True
-        reservation.key_return_time = datetime.utcnow()
+        keys = transition_key(
+            reservation_id, user_id,
+            [Reservation.key_picked_up.is_(True), Reservation.key_returned.isnot(True)],
+            {'key_returned': True, 'key_return_time': datetime.utcnow()}
+        )
+        if keys is None:
+            db.session.rollback()
+            return transition_error(reservation_id, user_id, 'return')
+        clear_key_holder(keys.id)
         db.session.commit()
+        snapshot_cache.bump(campus_scope(keys.campus_id))
+        event_broker.publish(keys.campus_id, 'key_returned', key_event(keys))
         
         return jsonify({
             'message': 'Key return registered successfully',
-            'reservation': reservation.to_dict()
+            'reservation': key_event(keys)
         }), 200
     except Exception as e:
         db.session.rollback()
@@ -83,27 +112,22 @@ def return_key(reservation_id):
 
 @key_bp.route('/pickups', methods=['GET'])
 def get_key_pickups():
-    """获取钥匙领取情况"""
+    """获取钥匙领取情况：当前持有人和逾期未还的预约"""
     campus_id = request.args.get('campus_id', type=int)
     
     if not campus_id:
         return jsonify({'error': 'campus_id is required'}), 400
+    if not campus_exists(campus_id):
+        return jsonify({'error': 'Campus not found'}), 404
     
-    # 获取已领取钥匙的预约
-    reservations = Reservation.query.filter(
-        Reservation.campus_id == campus_id,
-        Reservation.key_picked_up == True,
-        Reservation.status == 'active'
-    ).order_by(Reservation.key_pickup_time.desc()).limit(50).all()
-    
-    return jsonify([r.to_dict() for r in reservations]), 200
+    return cached_json_response(campus_scope(campus_id), 'pickups', lambda: build_key_status(campus_id))
 
 @key_bp.route('/managers/<int:campus_id>', methods=['GET'])
 def get_current_key_managers(campus_id):
     """获取当前钥匙管理员"""
-    managers = KeyManager.query.filter_by(
+    query = KeyManager.query.filter_by(
         campus_id=campus_id,
         is_active=True
-    ).all()
+    )
     
-    return jsonify([m.to_dict() for m in managers]), 200
+    return jsonify(serialize_list(query, KeyManager.campus)), 200
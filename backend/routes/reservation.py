@@ -1,8 +1,19 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import db, Reservation, Campus, User, UnavailableTime
+from models import db, Reservation, ReservationSlot, Campus, User, serialize_list
 from datetime import datetime, timedelta, date
+import time
 from sqlalchemy import and_, or_
+from sqlalchemy.exc import IntegrityError, OperationalError
+from occupancy import occupancy_index, hour_mask
+from unavailable_rules import rule_engine
+from cache import snapshot_cache, campus_scope, cached_json_response, build_campuses, campus_exists
+from quota import get_weekly_hours, add_hours, release_hours
+from events import event_broker, reservation_event, cancellation_event
+from auth_claims import current_claims
+from notifications import withdraw_reminder, queue_cancellation_notice, queue_same_day_reminders
+from key_holders import clear_key_holder
+from mail_outbox import outbox_workers
 
 reservation_bp = Blueprint('reservation', __name__)
 
@@ -13,6 +24,20 @@ TIME_SLOTS = {
     'evening': (19, 22)
 }
 
+# 每人每周可预约时长（小时）
+WEEKLY_HOUR_LIMIT = 6
+
+# 单次批量预约的最大条数
+BATCH_LIMIT = 100
+
+# 写入遇到数据库锁冲突时的重试次数和退避时间（秒）
+WRITE_RETRIES = 3
+WRITE_RETRY_BACKOFF = 0.05
+
+def is_database_locked(error):
+    """是否为 SQLite 写锁冲突"""
+    return 'database is locked' in str(error.orig)
+
 def validate_time_slot(start_hour, end_hour):
     """验证时间段是否有效"""
     if start_hour >= end_hour:
@@ -26,6 +51,31 @@ def validate_time_slot(start_hour, end_hour):
             return True
     return False
 
+def get_booking_window(now=None):
+    """计算预约窗口：返回 (上周日, 本周日)，周日22:00后窗口顺延一周"""
+    now = now or datetime.now()
+    current_hour = now.hour
+    day_of_week = now.weekday()  # 0=周一, 6=周日
+    today = now.date()
+    
+    # 计算上周日
+    days_to_last_sunday = day_of_week + 1 if day_of_week < 6 else 0
+    last_sunday = today - timedelta(days=days_to_last_sunday)
+    
+    # 如果当前是周日且时间>=22:00，上周日就是今天
+    if day_of_week == 6 and current_hour >= 22:
+        last_sunday = today
+    
+    # 计算本周日
+    days_to_this_sunday = 6 - day_of_week if day_of_week < 6 else 0
+    this_sunday = today + timedelta(days=days_to_this_sunday)
+    
+    # 如果当前是周日且时间>=22:00，本周日就是下周日
+    if day_of_week == 6 and current_hour >= 22:
+        this_sunday = today + timedelta(days=7)
+    
+    return last_sunday, this_sunday
+
 def check_time_conflict(campus_id, date, start_hour, end_hour, exclude_id=None):
     """检查时间冲突（带数据库锁）"""
     query = Reservation.query.filter(
@@ -40,32 +90,14 @@ def check_time_conflict(campus_id, date, start_hour, end_hour, exclude_id=None):
     if exclude_id:
         query = query.filter(Reservation.id != exclude_id)
     
-    # 使用悲观锁防止并发问题
+    # 使用悲观锁防止并发问题（SQLite 会忽略 FOR UPDATE，由 reservation_slots 唯一约束兜底）
     return query.with_for_update().first() is not None
 
 def check_unavailable_time(campus_id, date, start_hour, end_hour):
     """检查是否在不可预约时间段内，返回(是否不可用, 原因)"""
-    # 获取星期几 (0=周一, 6=周日) -> 转换为 (0=周日, 1=周一, ..., 6=周六)
-    day_of_week = (date.weekday() + 1) % 7
-    
-    # 检查三种类型的不可预约时间：
-    # 1. 特定日期
-    # 2. 固定周几
-    # 3. 所有日期
-    unavailable = UnavailableTime.query.filter(
-        UnavailableTime.campus_id == campus_id,
-        or_(
-            UnavailableTime.date == date,  # 特定日期
-            UnavailableTime.day_of_week == day_of_week,  # 固定周几
-            and_(UnavailableTime.date.is_(None), UnavailableTime.day_of_week.is_(None))  # 所有日期
-        ),
-        or_(
-            and_(UnavailableTime.start_hour < end_hour, UnavailableTime.end_hour > start_hour)
-        )
-    ).first()
-    
-    if unavailable:
-        reason = unavailable.reason if unavailable.reason else '该时间段不可预约'
+    # 特定日期、固定周几、所有日期三类规则已编译为位图，直接查表
+    reason = rule_engine.for_campus(campus_id).blocking_reason(date, start_hour, end_hour)
+    if reason:
         return True, reason
     
     return False, None
@@ -73,8 +105,7 @@ def check_unavailable_time(campus_id, date, start_hour, end_hour):
 @reservation_bp.route('/campuses', methods=['GET'])
 def get_campuses():
     """获取所有校区"""
-    campuses = Campus.query.all()
-    return jsonify([c.to_dict() for c in campuses]), 200
+    return cached_json_response('campuses', None, build_campuses)
 
 @reservation_bp.route('/create', methods=['POST'])
 @jwt_required()
@@ -83,9 +114,8 @@ def create_reservation():
     user_id = int(get_jwt_identity())
     data = request.get_json()
     
-    # 检查用户是否被禁用
-    user = User.query.get(user_id)
-    if not user or not user.is_active:
+    # 检查用户是否被禁用（禁用用户时令牌随即失效，声明即为当前状态）
+    if not current_claims().is_active:
         return jsonify({'error': 'Account is disabled. Please contact administrator.'}), 403
     
     # 验证必填字段
@@ -111,26 +141,7 @@ def create_reservation():
         return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
     
     # 计算预约窗口：上周日22:00至本周日22:00
-    now = datetime.now()
-    current_hour = now.hour
-    day_of_week = now.weekday()  # 0=周一, 6=周日
-    today = now.date()
-    
-    # 计算上周日
-    days_to_last_sunday = day_of_week + 1 if day_of_week < 6 else 0
-    last_sunday = today - timedelta(days=days_to_last_sunday)
-    
-    # 如果当前是周日且时间>=22:00，上周日就是今天
-    if day_of_week == 6 and current_hour >= 22:
-        last_sunday = today
-    
-    # 计算本周日
-    days_to_this_sunday = 6 - day_of_week if day_of_week < 6 else 0
-    this_sunday = today + timedelta(days=days_to_this_sunday)
-    
-    # 如果当前是周日且时间>=22:00，本周日就是下周日
-    if day_of_week == 6 and current_hour >= 22:
-        this_sunday = today + timedelta(days=7)
+    last_sunday, this_sunday = get_booking_window()
     
     # 检查预约日期是否在窗口内（上周日22:00之后，本周日22:00之前）
     # 简化为日期检查：必须在上周日（含）到本周日（含）之间
@@ -143,59 +154,292 @@ def create_reservation():
     if not validate_time_slot(start_hour, end_hour):
         return jsonify({'error': 'Invalid time slot'}), 400
     
-    # 检查本周预约时长限制（6小时）
-    # 使用与窗口相同的逻辑：上周日到本周日
-    weekly_reservations = Reservation.query.filter(
-        Reservation.user_id == user_id,
-        Reservation.date >= last_sunday,
-        Reservation.date <= this_sunday,
-        Reservation.status == 'active'
-    ).all()
+    # 先用内存占用位图快速拒绝已被预约的时间段（位图较旧时按 reservation_slots 确认一次）
+    if occupancy_index.is_taken(campus_id, reservation_date, start_hour, end_hour):
+        return jsonify({'error': 'Time slot already reserved'}), 409
     
-    total_hours = sum(r.end_hour - r.start_hour for r in weekly_reservations)
+    # 检查本周预约时长限制（6小时），读取计数器；计数器缺失时补建后立即提交
+    total_hours = get_weekly_hours([user_id], last_sunday)[user_id]
+    db.session.commit()
     new_hours = end_hour - start_hour
-    
-    if total_hours + new_hours > 6:
+
+    if total_hours + new_hours > WEEKLY_HOUR_LIMIT:
         return jsonify({
-            'error': f'Weekly reservation limit exceeded. You have used {total_hours} hours this week. Limit is 6 hours.'
+            'error': f'Weekly reservation limit exceeded. You have used {total_hours} hours this week. Limit is {WEEKLY_HOUR_LIMIT} hours.'
         }), 400
+
+    # 使用事务和锁处理并发，SQLite 写锁冲突（database is locked）时短暂退避后重试
+    for attempt in range(WRITE_RETRIES):
+        try:
+            # 开始事务
+            db.session.begin_nested()
+            
+            # 检查不可预约时间段
+            is_unavailable, unavailable_reason = check_unavailable_time(campus_id, reservation_date, start_hour, end_hour)
+            if is_unavailable:
+                db.session.rollback()
+                return jsonify({'error': f'该时间段不可预约：{unavailable_reason}'}), 400
+            
+            # 计入本周时长，带上限条件更新，并发请求无法同时突破配额
+            # 作为事务的第一条写语句，先于冲突检查执行
+            if not add_hours(user_id, last_sunday, reservation_date, new_hours, WEEKLY_HOUR_LIMIT):
+                db.session.rollback()
+                return jsonify({
+                    'error': f'Weekly reservation limit exceeded. Limit is {WEEKLY_HOUR_LIMIT} hours.'
+                }), 400
+
+            # 检查时间冲突（带锁）
+            if check_time_conflict(campus_id, reservation_date, start_hour, end_hour):
+                db.session.rollback()
+                # 位图未反映到该冲突（如其他进程写入），丢弃后重新加载
+                occupancy_index.invalidate(campus_id, reservation_date)
+                return jsonify({'error': 'Time slot already reserved'}), 409
+
+            # 创建预约
+            reservation = Reservation(
+                user_id=user_id,
+                campus_id=campus_id,
+                date=reservation_date,
+                start_hour=start_hour,
+                end_hour=end_hour
+            )
+            # 占用时段记录，并发插入重叠预约时由数据库唯一约束拒绝
+            reservation.claim_slots()
+            
+            db.session.add(reservation)
+            
+            # 当天的预约随预约一并写入提醒
+            reminders = 0
+            if reservation_date == date.today() and current_app.config.get('RESERVATION_NOTIFICATIONS_ENABLED', False):
+                db.session.flush()
+                reminders = queue_same_day_reminders([reservation.id])
+            db.session.commit()
+            
+            if reminders:
+                outbox_workers.notify()
+            occupancy_index.mark(campus_id, reservation_date, start_hour, end_hour)
+            snapshot_cache.bump(campus_scope(campus_id))
+            event_broker.publish(campus_id, 'created', reservation_event(reservation))
+            
+            return jsonify({
+                'message': 'Reservation created successfully',
+                'reservation': reservation.to_dict()
+            }), 201
+            
+        except IntegrityError:
+            db.session.rollback()
+            occupancy_index.invalidate(campus_id, reservation_date)
+            return jsonify({'error': 'Time slot already reserved'}), 409
+        except OperationalError as e:
+            db.session.rollback()
+            if is_database_locked(e) and attempt < WRITE_RETRIES - 1:
+                time.sleep(WRITE_RETRY_BACKOFF * (attempt + 1))
+                continue
+            return jsonify({'error': f'Reservation failed: {str(e)}'}), 500
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'error': f'Reservation failed: {str(e)}'}), 500
+
+@reservation_bp.route('/batch', methods=['POST'])
+@jwt_required()
+def create_reservations_batch():
+    """批量创建预约：全部校验通过才一次性写入，否则一条都不创建"""
+    user_id = int(get_jwt_identity())
+    data = request.get_json() or {}
+    items = data.get('reservations')
     
-    # 使用事务和锁处理并发
-    try:
-        # 开始事务
-        db.session.begin_nested()
+    claims = current_claims()
+    if not claims.is_active:
+        return jsonify({'error': 'Account is disabled. Please contact administrator.'}), 403
+    
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'reservations is required'}), 400
+    if len(items) > BATCH_LIMIT:
+        return jsonify({'error': f'At most {BATCH_LIMIT} reservations per batch'}), 400
+    
+    last_sunday, this_sunday = get_booking_window()
+    results = [{'index': i, 'error': None} for i in range(len(items))]
+    entries = []  # (index, target_user_id, campus_id, date, start_hour, end_hour)
+    
+    # 第一遍：字段、日期窗口和时间段校验（不访问数据库）
+    required_fields = ['campus_id', 'date', 'start_hour', 'end_hour']
+    for i, item in enumerate(items):
+        missing = [field for field in required_fields if not isinstance(item, dict) or field not in item]
+        if missing:
+            results[i]['error'] = f'{missing[0]} is required'
+            continue
+        
+        # 管理员可以为其他用户预约（如为整个乐队安排一周排练）
+        try:
+            target_user_id = int(item.get('user_id', user_id))
+        except (TypeError, ValueError):
+            results[i]['error'] = 'User not found'
+            continue
+        if target_user_id != user_id and not claims.is_admin:
+            results[i]['error'] = 'Only administrators can reserve for other users'
+            continue
+        
+        try:
+            reservation_date = datetime.strptime(item['date'], '%Y-%m-%d').date()
+        except (TypeError, ValueError):
+            results[i]['error'] = 'Invalid date format. Use YYYY-MM-DD'
+            continue
+        
+        if reservation_date < last_sunday or reservation_date > this_sunday:
+            results[i]['error'] = f'Reservation date must be between {last_sunday.isoformat()} and {this_sunday.isoformat()}'
+            continue
+        
+        start_hour, end_hour = item['start_hour'], item['end_hour']
+        if not isinstance(start_hour, int) or not isinstance(end_hour, int) \
+                or not validate_time_slot(start_hour, end_hour):
+            results[i]['error'] = 'Invalid time slot'
+            continue
+        
+        try:
+            campus_id = int(item['campus_id'])
+        except (TypeError, ValueError):
+            results[i]['error'] = 'Campus not found'
+            continue
+        
+        entries.append((i, target_user_id, campus_id, reservation_date, start_hour, end_hour))
+    
+    campus_ids = {entry[2] for entry in entries}
+    user_ids = {entry[1] for entry in entries}
+    dates = {entry[3] for entry in entries}
+    
+    # 预加载本批次涉及的校区、用户、占用情况和本周已用时长（每类一次查询），不可预约规则使用编译后的位图
+    known_campuses = {c.id for c in Campus.query.filter(Campus.id.in_(campus_ids))} if campus_ids else set()
+    active_users = {
+        u.id for u in User.query.filter(User.id.in_(user_ids), User.is_active == True)
+    } if user_ids else set()
+    
+    occupancy = {}
+    if entries:
+        rows = Reservation.query.with_entities(
+            Reservation.campus_id, Reservation.date, Reservation.start_hour, Reservation.end_hour
+        ).filter(
+            Reservation.campus_id.in_(campus_ids),
+            Reservation.date.in_(dates),
+            Reservation.status == 'active'
+        ).all()
+        for campus_id, reservation_date, start_hour, end_hour in rows:
+            key = (campus_id, reservation_date)
+            occupancy[key] = occupancy.get(key, 0) | hour_mask(start_hour, end_hour)
+    
+    used_hours = get_weekly_hours(user_ids, last_sunday)
+    db.session.commit()
+    
+    # 第二遍：按提交顺序在内存中校验，通过的条目立即计入占用和时长，供后续条目判断
+    for i, target_user_id, campus_id, reservation_date, start_hour, end_hour in entries:
+        if campus_id not in known_campuses:
+            results[i]['error'] = 'Campus not found'
+            continue
+        if target_user_id not in active_users:
+            results[i]['error'] = 'Account is disabled. Please contact administrator.'
+            continue
         
-        # 检查不可预约时间段
         is_unavailable, unavailable_reason = check_unavailable_time(campus_id, reservation_date, start_hour, end_hour)
         if is_unavailable:
-            db.session.rollback()
-            return jsonify({'error': f'该时间段不可预约：{unavailable_reason}'}), 400
-        
-        # 检查时间冲突（带锁）
-        if check_time_conflict(campus_id, reservation_date, start_hour, end_hour):
-            db.session.rollback()
-            return jsonify({'error': 'Time slot already reserved'}), 409
+            results[i]['error'] = f'该时间段不可预约：{unavailable_reason}'
+            continue
         
-        # 创建预约
-        reservation = Reservation(
-            user_id=user_id,
-            campus_id=campus_id,
-            date=reservation_date,
-            start_hour=start_hour,
-            end_hour=end_hour
-        )
+        key = (campus_id, reservation_date)
+        mask = hour_mask(start_hour, end_hour)
+        if occupancy.get(key, 0) & mask:
+            results[i]['error'] = 'Time slot already reserved'
+            continue
         
-        db.session.add(reservation)
-        db.session.commit()
+        total_hours = used_hours.get(target_user_id, 0) or 0
+        if total_hours + end_hour - start_hour > WEEKLY_HOUR_LIMIT:
+            results[i]['error'] = f'Weekly reservation limit exceeded. {total_hours} hours already used this week. Limit is {WEEKLY_HOUR_LIMIT} hours.'
+            continue
         
+        occupancy[key] = occupancy.get(key, 0) | mask
+        used_hours[target_user_id] = total_hours + end_hour - start_hour
+    
+    if any(result['error'] for result in results):
         return jsonify({
-            'message': 'Reservation created successfully',
-            'reservation': reservation.to_dict()
-        }), 201
-        
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({'error': f'Reservation failed: {str(e)}'}), 500
+            'error': 'Batch rejected. No reservations were created.',
+            'results': results
+        }), 400
+    
+    for attempt in range(WRITE_RETRIES):
+        try:
+            # 先计入时长（须在预约写入之前），校验后有其他请求计入了时长时整批回滚
+            for i, target_user_id, campus_id, reservation_date, start_hour, end_hour in entries:
+                if not add_hours(target_user_id, last_sunday, reservation_date,
+                                 end_hour - start_hour, WEEKLY_HOUR_LIMIT):
+                    db.session.rollback()
+                    return jsonify({
+                        'error': f'Weekly reservation limit exceeded. Limit is {WEEKLY_HOUR_LIMIT} hours. No reservations were created.'
+                    }), 400
+            
+            reservations = []
+            for i, target_user_id, campus_id, reservation_date, start_hour, end_hour in entries:
+                reservation = Reservation(
+                    user_id=target_user_id,
+                    campus_id=campus_id,
+                    date=reservation_date,
+                    start_hour=start_hour,
+                    end_hour=end_hour
+                )
+                reservation.claim_slots()
+                db.session.add(reservation)
+                reservations.append(reservation)
+            
+            # 提交前取得新预约的 ID（提交后实例过期，逐个访问会各自触发查询）
+            db.session.flush()
+            reservation_ids = [reservation.id for reservation in reservations]
+            
+            # 当天的预约随预约一并写入提醒
+            reminders = 0
+            if current_app.config.get('RESERVATION_NOTIFICATIONS_ENABLED', False):
+                same_day_ids = [reservation_id for entry, reservation_id in zip(entries, reservation_ids)
+                                if entry[3] == date.today()]
+                if same_day_ids:
+                    reminders = queue_same_day_reminders(same_day_ids)
+            db.session.commit()
+            break
+        except IntegrityError:
+            # 校验后有其他请求抢先占用了时段
+            db.session.rollback()
+            for key in {(entry[2], entry[3]) for entry in entries}:
+                occupancy_index.invalidate(*key)
+            return jsonify({'error': 'Time slot already reserved. No reservations were created.'}), 409
+        except OperationalError as e:
+            db.session.rollback()
+            if is_database_locked(e) and attempt < WRITE_RETRIES - 1:
+                time.sleep(WRITE_RETRY_BACKOFF * (attempt + 1))
+                continue
+            return jsonify({'error': f'Reservation failed: {str(e)}'}), 500
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'error': f'Reservation failed: {str(e)}'}), 500
+    
+    if reminders:
+        outbox_workers.notify()
+    
+    # 新预约连同用户和校区一次查询取回并序列化
+    created = {
+        reservation['id']: reservation
+        for reservation in serialize_list(
+            Reservation.query.filter(Reservation.id.in_(reservation_ids)),
+            Reservation.user, Reservation.campus
+        )
+    }
+    for (i, target_user_id, campus_id, reservation_date, start_hour, end_hour), reservation_id \
+            in zip(entries, reservation_ids):
+        occupancy_index.mark(campus_id, reservation_date, start_hour, end_hour)
+        results[i]['reservation'] = created[reservation_id]
+    for campus_id in campus_ids:
+        snapshot_cache.bump(campus_scope(campus_id))
+    for entry, reservation_id in zip(entries, reservation_ids):
+        event_broker.publish(entry[2], 'created', created[reservation_id])
+    
+    return jsonify({
+        'message': f'{len(reservations)} reservations created successfully',
+        'results': results
+    }), 201
 
 @reservation_bp.route('/my-reservations', methods=['GET'])
 @jwt_required()
@@ -203,12 +447,12 @@ def get_my_reservations():
     """获取当前用户的预约"""
     user_id = int(get_jwt_identity())
     
-    reservations = Reservation.query.filter_by(
+    query = Reservation.query.filter_by(
         user_id=user_id,
         status='active'
-    ).order_by(Reservation.date.desc(), Reservation.start_hour.desc()).all()
+    ).order_by(Reservation.date.desc(), Reservation.start_hour.desc())
     
-    return jsonify([r.to_dict() for r in reservations]), 200
+    return jsonify(serialize_list(query, Reservation.user, Reservation.campus)), 200
 
 @reservation_bp.route('/weekly', methods=['GET'])
 def get_weekly_reservations():
@@ -217,6 +461,8 @@ def get_weekly_reservations():
     
     if not campus_id:
         return jsonify({'error': 'campus_id is required'}), 400
+    if not campus_exists(campus_id):
+        return jsonify({'error': 'Campus not found'}), 404
     
     # 获取当前时间
     now = datetime.now()
@@ -236,25 +482,33 @@ def get_weekly_reservations():
     
     end_of_week = start_of_week + timedelta(days=6)
     
-    reservations = Reservation.query.filter(
-        Reservation.campus_id == campus_id,
-        Reservation.date >= start_of_week,
-        Reservation.date <= end_of_week,
-        Reservation.status == 'active'
-    ).order_by(Reservation.date, Reservation.start_hour).all()
-    
-    return jsonify({
-        'start_date': start_of_week.isoformat(),
-        'end_date': end_of_week.isoformat(),
-        'reservations': [r.to_dict() for r in reservations]
-    }), 200
+    def build_weekly():
+        query = Reservation.query.filter(
+            Reservation.campus_id == campus_id,
+            Reservation.date >= start_of_week,
+            Reservation.date <= end_of_week,
+            Reservation.status == 'active'
+        ).order_by(Reservation.date, Reservation.start_hour)
+        
+        rules = rule_engine.for_campus(campus_id)
+        week_dates = [start_of_week + timedelta(days=i) for i in range(7)]
+        
+        return {
+            'start_date': start_of_week.isoformat(),
+            'end_date': end_of_week.isoformat(),
+            'reservations': serialize_list(query, Reservation.user, Reservation.campus),
+            # 本周每天被不可预约规则封锁的时间段
+            'blocked_hours': {d.isoformat(): rules.blocked_hours(d) for d in week_dates}
+        }
+    
+    # 按校区版本号缓存序列化结果，预约/钥匙/不可预约时间变更时失效
+    return cached_json_response(campus_scope(campus_id), ('weekly', start_of_week), build_weekly)
 
 @reservation_bp.route('/<int:reservation_id>', methods=['DELETE'])
 @jwt_required()
 def cancel_reservation(reservation_id):
     """取消预约"""
     user_id = int(get_jwt_identity())
-    user = User.query.get(user_id)
     
     reservation = Reservation.query.get(reservation_id)
     
@@ -262,18 +516,67 @@ def cancel_reservation(reservation_id):
         return jsonify({'error': 'Reservation not found'}), 404
     
     # 只有预约用户或管理员可以取消
-    if reservation.user_id != user_id and not user.is_admin:
+    if reservation.user_id != user_id and not current_claims().is_admin:
         return jsonify({'error': 'Unauthorized'}), 403
     
     try:
+        was_active = reservation.status == 'active'
+        # 管理员取消他人的预约时通知预约用户
+        notify_owner = (was_active and reservation.user_id != user_id and
+                        current_app.config.get('RESERVATION_NOTIFICATIONS_ENABLED', False))
         reservation.status = 'cancelled'
+        # 释放占用的时段
+        ReservationSlot.query.filter_by(reservation_id=reservation.id).delete()
+        if was_active:
+            release_hours(reservation.user_id, reservation.date,
+                          reservation.end_hour - reservation.start_hour)
+            withdraw_reminder(reservation.id)
+            if reservation.key_picked_up:
+                clear_key_holder(reservation.id)
+        if notify_owner:
+            queue_cancellation_notice(reservation)
         db.session.commit()
         
+        if notify_owner:
+            outbox_workers.notify()
+        
+        if was_active:
+            occupancy_index.release(reservation.campus_id, reservation.date,
+                                    reservation.start_hour, reservation.end_hour)
+            snapshot_cache.bump(campus_scope(reservation.campus_id))
+            event_broker.publish(reservation.campus_id, 'cancelled', cancellation_event(reservation))
+        
         return jsonify({'message': 'Reservation cancelled successfully'}), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@reservation_bp.route('/stream', methods=['GET'])
+def stream_reservation_events():
+    """
+    订阅校区的预约变更事件（SSE）
+    事件类型：created、cancelled、key_picked_up、key_returned、key_overdue；reset 表示客户端需重新加载周视图
+    断线重连时浏览器自动携带 Last-Event-ID，也可通过 last_event_id 参数指定
+    """
+    campus_id = request.args.get('campus_id', type=int)
+    
+    if not campus_id:
+        return jsonify({'error': 'campus_id is required'}), 400
+    
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    subscription = event_broker.subscribe(campus_id, last_event_id)
+    if subscription is None:
+        return jsonify({'error': 'Too many subscribers. Please try again later.'}), 503
+    
+    subscriber, backlog = subscription
+    response = Response(event_broker.stream(subscriber, backlog), mimetype='text/event-stream')
+    # 响应体未开始迭代就被关闭（HEAD 请求、发送首字节前断开）时生成器的 finally 不会执行，在关闭响应时取消订阅
+    response.call_on_close(lambda: event_broker.unsubscribe(subscriber))
+    response.headers['Cache-Control'] = 'no-cache'
+    # 禁止反向代理（如 nginx）缓冲事件流
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @reservation_bp.route('/date/<date_str>', methods=['GET'])
 def get_reservations_by_date(date_str):
     """获取指定日期的预约"""
@@ -282,15 +585,20 @@ def get_reservations_by_date(date_str):
     if not campus_id:
         return jsonify({'error': 'campus_id is required'}), 400
     
+    if not campus_exists(campus_id):
+        return jsonify({'error': 'Campus not found'}), 404
+    
     try:
         query_date = datetime.strptime(date_str, '%Y-%m-%d').date()
     except ValueError:
         return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
     
-    reservations = Reservation.query.filter(
-        Reservation.campus_id == campus_id,
-        Reservation.date == query_date,
-        Reservation.status == 'active'
-    ).order_by(Reservation.start_hour).all()
+    def build_date():
+        query = Reservation.query.filter(
+            Reservation.campus_id == campus_id,
+            Reservation.date == query_date,
+            Reservation.status == 'active'
+        ).order_by(Reservation.start_hour)
+        return serialize_list(query, Reservation.user, Reservation.campus)
     
-    return jsonify([r.to_dict() for r in reservations]), 200
+    return cached_json_response(campus_scope(campus_id), ('date', query_date), build_date)
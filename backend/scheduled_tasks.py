@@ -7,8 +7,14 @@
 
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
-from datetime import datetime
-from models import db, User
+from apscheduler.triggers.interval import IntervalTrigger
+from datetime import datetime, date, timedelta
+from models import db, Job
+from quota import reconcile_weekly_hours
+from jobs import create_job, run_job, resume_interrupted_jobs, JOB_STALE_SECONDS
+from notifications import queue_reservation_reminders
+from verification import sweep_expired_tokens, purge_verification_mail, purge_stale_registrations
+from key_holders import flag_overdue_keys, KEY_OVERDUE_MINUTES, OVERDUE_CHECK_MINUTES
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -17,22 +23,96 @@ logger = logging.getLogger(__name__)
 def annual_user_reset():
     """
     每年1月1日凌晨重置所有普通用户为禁用状态
-    管理员账号不受影响
+    管理员账号不受影响；分批执行，中断后由 resume_jobs 继续
     """
     try:
         logger.info("开始执行年度用户重置任务...")
         
         # 只禁用非管理员用户
-        result = User.query.filter_by(is_admin=False).update({'is_active': False})
-        db.session.commit()
+        job = create_job('annual_reset')
+        run_job(job.id)
+        job = db.session.get(Job, job.id)
         
-        logger.info(f"年度重置完成：已禁用 {result} 个普通用户账号")
-        return result
+        logger.info(f"年度重置{'完成' if job.status == 'completed' else '未完成'}：已禁用 {job.processed} 个普通用户账号")
+        return job.processed
     except Exception as e:
         db.session.rollback()
         logger.error(f"年度用户重置失败: {str(e)}")
         return 0
 
+def resume_jobs():
+    """
+    继续执行执行进程已中断的后台任务
+    """
+    try:
+        job_ids = resume_interrupted_jobs()
+        if job_ids:
+            logger.info(f"已继续执行中断的任务: {job_ids}")
+        return job_ids
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"继续执行中断的任务失败: {str(e)}")
+        return []
+
+def reservation_reminders(day=None):
+    """
+    为指定日期（默认次日）的全部有效预约写入提醒邮件，开始前 1 小时发送
+    """
+    day = day or date.today() + timedelta(days=1)
+    try:
+        queued = queue_reservation_reminders(day)
+        logger.info(f"已为 {day.isoformat()} 的预约写入 {queued} 封提醒邮件")
+        return queued
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"写入预约提醒失败: {str(e)}")
+        return 0
+
+def verification_sweep():
+    """
+    分批删除过期的邮箱验证令牌、链接已失效的验证邮件和长期未验证的注册
+    """
+    try:
+        tokens = sweep_expired_tokens()
+        mails = purge_verification_mail()
+        users = purge_stale_registrations()
+        logger.info(f"验证令牌清理完成：删除 {tokens} 个过期令牌、{mails} 封验证邮件、{users} 个未验证的注册")
+        return tokens, users
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"验证令牌清理失败: {str(e)}")
+        return 0, 0
+
+def overdue_key_check():
+    """
+    标记预约结束后超时未归还的钥匙
+    """
+    try:
+        flagged = flag_overdue_keys()
+        if flagged:
+            logger.warning(f"超过 {KEY_OVERDUE_MINUTES} 分钟未归还钥匙的预约: {flagged}")
+        return flagged
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"逾期钥匙检查失败: {str(e)}")
+        return {}
+
+def weekly_hours_reconcile():
+    """
+    每天核对每周预约时长计数器与实际预约，修正并记录偏差
+    """
+    try:
+        drift = reconcile_weekly_hours(fix=True)
+        if drift:
+            logger.warning(f"预约时长计数器存在 {len(drift)} 处偏差，已修正: {drift}")
+        else:
+            logger.info("预约时长计数器核对完成，无偏差")
+        return drift
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"预约时长计数器核对失败: {str(e)}")
+        return []
+
 def init_scheduler(app):
     """
     初始化定时任务调度器
@@ -52,6 +132,68 @@ def init_scheduler(app):
     # )
     # logger.info("- 年度用户重置：每年1月1日 00:00")
     
+    # 每天凌晨4点核对预约时长计数器
+    scheduler.add_job(
+        func=lambda: weekly_hours_reconcile_with_context(app),
+        trigger=CronTrigger(hour=4, minute=0),
+        id='weekly_hours_reconcile',
+        name='Weekly Hours Reconcile',
+        replace_existing=True
+    )
+    logger.info("- 预约时长计数器核对：每天 04:00")
+    
+    # 定期标记超时未归还的钥匙
+    scheduler.add_job(
+        func=lambda: overdue_key_check_with_context(app),
+        trigger=IntervalTrigger(minutes=OVERDUE_CHECK_MINUTES),
+        id='overdue_key_check',
+        name='Overdue Key Check',
+        replace_existing=True
+    )
+    logger.info(f"- 逾期钥匙检查：每 {OVERDUE_CHECK_MINUTES} 分钟")
+    
+    if app.config.get('EMAIL_VERIFICATION_ENABLED'):
+        # 每天凌晨3点清理过期的验证令牌和长期未验证的注册
+        scheduler.add_job(
+            func=lambda: verification_sweep_with_context(app),
+            trigger=CronTrigger(hour=3, minute=0),
+            id='verification_sweep',
+            name='Verification Sweep',
+            replace_existing=True
+        )
+        logger.info("- 验证令牌清理：每天 03:00")
+    
+    if app.config.get('RESERVATION_NOTIFICATIONS_ENABLED'):
+        # 每天20点为次日的全部预约写入提醒
+        scheduler.add_job(
+            func=lambda: reservation_reminders_with_context(app),
+            trigger=CronTrigger(hour=20, minute=0),
+            id='reservation_reminders',
+            name='Reservation Reminders',
+            replace_existing=True
+        )
+        logger.info("- 次日预约提醒：每天 20:00")
+        
+        # 当天新建的预约在创建时写入提醒；每小时补充前一天 20:00 之后预约的当天时段等遗漏的提醒（已写入的提醒不会重复）
+        scheduler.add_job(
+            func=lambda: reservation_reminders_with_context(app, date.today()),
+            trigger=CronTrigger(minute=30),
+            id='reservation_reminders_today',
+            name='Reservation Reminders (Today)',
+            replace_existing=True
+        )
+        logger.info("- 当天新预约提醒：每小时 30 分")
+    
+    # 定期检查执行进程已中断的后台任务，从记录的进度处继续
+    scheduler.add_job(
+        func=lambda: resume_jobs_with_context(app),
+        trigger=IntervalTrigger(seconds=JOB_STALE_SECONDS),
+        id='resume_jobs',
+        name='Resume Interrupted Jobs',
+        replace_existing=True
+    )
+    logger.info(f"- 中断任务检查：每 {JOB_STALE_SECONDS} 秒")
+    
     scheduler.start()
     logger.info("定时任务调度器已启动")
     
@@ -62,6 +204,31 @@ def annual_user_reset_with_context(app):
     with app.app_context():
         return annual_user_reset()
 
+def resume_jobs_with_context(app):
+    """带应用上下文的中断任务检查"""
+    with app.app_context():
+        return resume_jobs()
+
+def overdue_key_check_with_context(app):
+    """带应用上下文的逾期钥匙检查任务"""
+    with app.app_context():
+        return overdue_key_check()
+
+def verification_sweep_with_context(app):
+    """带应用上下文的验证令牌清理任务"""
+    with app.app_context():
+        return verification_sweep()
+
+def reservation_reminders_with_context(app, day=None):
+    """带应用上下文的预约提醒任务"""
+    with app.app_context():
+        return reservation_reminders(day)
+
+def weekly_hours_reconcile_with_context(app):
+    """带应用上下文的预约时长计数器核对任务"""
+    with app.app_context():
+        return weekly_hours_reconcile()
+
 if __name__ == '__main__':
     # 单独运行测试
     from app import app
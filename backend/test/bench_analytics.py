@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+使用统计接口基准测试
+生成多年的预约数据，测量 /api/admin/analytics 在不同日期范围下的耗时（不使用缓存），
+并与逐条 Python 循环计算的结果比对，确认热力图和未到率正确
+使用临时数据库，不影响现有数据
+"""
+
+import sys
+import os
+import random
+import tempfile
+import time
+
+# 添加父目录到路径以便导入模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DB_FILE = os.path.join(tempfile.mkdtemp(), 'analytics.db')
+os.environ.setdefault('DATABASE_URL', f'sqlite:///{DB_FILE}')
+
+from datetime import date, timedelta
+from flask_jwt_extended import create_access_token
+from app import app
+from analytics import analytics_cache
+from models import db, init_db, User, Reservation
+
+YEARS = 3
+RESERVATIONS_PER_DAY = 40  # 两个校区合计
+USER_COUNT = 500
+TIME_LIMIT = 1.0  # 秒
+
+SLOTS = [(8, 10), (8, 12), (10, 12), (13, 15), (15, 18), (13, 18), (19, 21), (19, 22), (20, 22)]
+
+def seed():
+    """生成 YEARS 年的预约数据"""
+    db.session.execute(db.insert(User), [
+        {'student_id': f'an{i:05d}', 'name': f'统计用户{i}', 'email': f'an{i:05d}@buaa.edu.cn',
+         'password_hash': '-'}
+        for i in range(USER_COUNT)
+    ])
+    user_ids = [u.id for u in User.query.filter(User.student_id.like('an%'))]
+
+    start = date.today() - timedelta(days=365 * YEARS)
+    rows = []
+    for offset in range(365 * YEARS + 7):
+        day = start + timedelta(days=offset)
+        for _ in range(RESERVATIONS_PER_DAY):
+            start_hour, end_hour = random.choice(SLOTS)
+            rows.append({
+                'user_id': random.choice(user_ids), 'campus_id': random.choice((1, 2)),
+                'date': day, 'start_hour': start_hour, 'end_hour': end_hour,
+                'status': random.choice(('active',) * 9 + ('cancelled',)),
+                'key_picked_up': random.random() < 0.8
+            })
+    db.session.execute(db.insert(Reservation), rows)
+    db.session.commit()
+    return len(rows)
+
+def naive(campus_id, start, end):
+    """逐条预约、逐小时循环计算热力图和未到率，用于校验"""
+    heatmap = [[0] * 14 for _ in range(7)]
+    past = no_shows = 0
+    for r in Reservation.query.filter(Reservation.campus_id == campus_id, Reservation.date >= start,
+                                      Reservation.date <= end, Reservation.status == 'active'):
+        weekday = (r.date.weekday() + 1) % 7
+        for hour in range(r.start_hour, r.end_hour):
+            heatmap[weekday][hour - 8] += 1
+        if r.date < date.today():
+            past += 1
+            no_shows += not r.key_picked_up
+    return heatmap, round(no_shows / past, 4) if past else None
+
+def main():
+    with app.app_context():
+        init_db()
+        print(f"生成 {YEARS} 年预约数据...")
+        total = seed()
+        admin = User.query.filter_by(is_admin=True).first()
+        headers = {'Authorization': f'Bearer {create_access_token(identity=str(admin.id))}'}
+
+    client = app.test_client()
+    today = date.today()
+
+    print("="*60)
+    print(f"预约总数: {total}")
+    print(f"{'日期范围':<24}{'耗时':>10}{'缓存命中':>12}")
+    print("="*60)
+    failed = False
+    for days in (30, 365, 365 * YEARS):
+        start = today - timedelta(days=days)
+        url = f'/api/admin/analytics?campus_id=1&start_date={start.isoformat()}&end_date={today.isoformat()}'
+
+        analytics_cache.clear()
+        began = time.perf_counter()
+        response = client.get(url, headers=headers)
+        elapsed = time.perf_counter() - began
+        assert response.status_code == 200, response.get_json()
+
+        began = time.perf_counter()
+        client.get(url, headers=headers)
+        cached = time.perf_counter() - began
+
+        print(f"{f'{days} 天':<24}{elapsed * 1000:>8.0f}ms{cached * 1000:>10.1f}ms")
+        failed |= elapsed > TIME_LIMIT
+
+        body = response.get_json()
+        with app.app_context():
+            heatmap, rate = naive(1, start, today)
+        assert body['heatmap']['booked_hours'] == heatmap, '热力图与逐条计算结果不一致'
+        assert body['no_show']['rate'] == rate, '未到率与逐条计算结果不一致'
+    print("="*60)
+
+    if failed:
+        print(f"✗ 存在超过 {TIME_LIMIT}s 的统计请求")
+        sys.exit(1)
+    print("✓ 统计结果正确，且均在时限内完成")
+
+if __name__ == '__main__':
+    main()
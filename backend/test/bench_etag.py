@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+ETag 条件请求基准测试
+对比轮询接口在三种情况下的吞吐量：
+  - 完整响应（缓存失效，每次查询并序列化）
+  - 完整响应（命中快照缓存）
+  - 304 响应（If-None-Match 命中）
+使用临时数据库，不影响现有数据
+"""
+
+import sys
+import os
+import random
+import tempfile
+import time
+
+# 添加父目录到路径以便导入模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DB_FILE = os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ.setdefault('DATABASE_URL', f'sqlite:///{DB_FILE}')
+
+from datetime import date, timedelta
+from app import app
+from cache import snapshot_cache
+from models import db, init_db, User, Reservation
+
+DURATION = 3  # 每种情况运行的秒数
+CAMPUS_ID = 1
+
+ENDPOINTS = [
+    '/api/reservation/weekly?campus_id=1',
+    f'/api/reservation/date/{date.today().isoformat()}?campus_id=1',
+    '/api/reservation/campuses',
+    '/api/key/pickups?campus_id=1',
+    '/api/admin/key-managers',
+]
+
+def seed():
+    """生成一周的预约数据"""
+    users = []
+    for i in range(30):
+        user = User(student_id=f'bench{i:03d}', name=f'基准用户{i}',
+                    email=f'bench{i:03d}@buaa.edu.cn', password_hash='-')
+        db.session.add(user)
+        users.append(user)
+    db.session.flush()
+
+    monday = date.today() - timedelta(days=date.today().weekday())
+    for offset in range(7):
+        for start_hour in range(8, 22):
+            if start_hour in (12, 18):
+                continue
+            db.session.add(Reservation(
+                user_id=random.choice(users).id, campus_id=CAMPUS_ID,
+                date=monday + timedelta(days=offset),
+                start_hour=start_hour, end_hour=start_hour + 1,
+                key_picked_up=random.random() > 0.5
+            ))
+    db.session.commit()
+
+def measure(client, url, headers=None, clear_cache=False):
+    """返回每秒请求数和最后一次响应的状态码"""
+    count = 0
+    status = None
+    deadline = time.perf_counter() + DURATION
+    while time.perf_counter() < deadline:
+        if clear_cache:
+            snapshot_cache.clear()
+        status = client.get(url, headers=headers).status_code
+        count += 1
+    return count / DURATION, status
+
+def main():
+    with app.app_context():
+        init_db()
+        seed()
+
+    client = app.test_client()
+
+    print("="*72)
+    print(f"{'接口':<44}{'无缓存':>9}{'缓存命中':>9}{'304':>9}")
+    print("="*72)
+    for url in ENDPOINTS:
+        uncached, _ = measure(client, url, clear_cache=True)
+        cached, _ = measure(client, url)
+        etag = client.get(url).headers['ETag']
+        not_modified, status = measure(client, url, headers={'If-None-Match': etag})
+        assert status == 304, f'{url} 未返回 304'
+        path = url.split('?')[0]
+        print(f"{path:<44}{uncached:>9.0f}{cached:>9.0f}{not_modified:>9.0f}")
+    print("="*72)
+    print("单位：请求/秒（单线程 Flask 测试客户端）")
+
+if __name__ == '__main__':
+    main()
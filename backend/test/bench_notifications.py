@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+预约提醒批量发送基准测试
+使用 aiosmtpd 在本地启动一个 SMTP 服务器（建立会话时模拟握手延迟），为次日的全部预约生成提醒：
+  - 一次定时任务写入全部提醒的耗时，重复执行不会重复写入
+  - 每封邮件单独建立 SMTP 连接（旧方式）与发件箱线程复用连接的发送速度对比
+使用临时数据库，不影响现有数据。需要安装 aiosmtpd：pip install aiosmtpd
+"""
+
+import sys
+import os
+import asyncio
+import logging
+import socket
+import tempfile
+import threading
+import time
+
+# 添加父目录到路径以便导入模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    from aiosmtpd.controller import Controller
+except ImportError:
+    print("✗ 需要安装 aiosmtpd：pip install aiosmtpd")
+    sys.exit(1)
+
+logging.getLogger('mail.log').setLevel(logging.WARNING)
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+SMTP_PORT = free_port()
+DB_FILE = os.path.join(tempfile.mkdtemp(), 'notifications.db')
+os.environ.setdefault('DATABASE_URL', f'sqlite:///{DB_FILE}')
+os.environ['RESERVATION_NOTIFICATIONS_ENABLED'] = 'true'
+os.environ['MAIL_SERVER'] = '127.0.0.1'
+os.environ['MAIL_PORT'] = str(SMTP_PORT)
+os.environ['MAIL_USE_TLS'] = 'false'
+os.environ['MAIL_DEFAULT_SENDER'] = 'noreply@buaa.edu.cn'
+
+from datetime import date, datetime, timedelta
+import mail_outbox
+from app import app
+from email_service import mail
+from models import db, init_db, User, Reservation, Campus, EmailOutbox
+from notifications import queue_reservation_reminders
+
+RESERVATIONS = 2000
+BASELINE_MESSAGES = 100   # 旧方式只发送部分邮件，按速度估算
+HANDSHAKE_DELAY = 0.02    # 模拟建立 SMTP 会话（TLS/认证）的耗时（秒）
+DELIVERY_TIMEOUT = 120
+
+class SinkHandler:
+    """记录收到的邮件和建立的会话数"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.recipients = []
+        self.sessions = set()
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        await asyncio.sleep(HANDSHAKE_DELAY)
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        with self.lock:
+            self.recipients.extend(envelope.rcpt_tos)
+            self.sessions.add(id(session))
+        return '250 OK'
+
+    def reset(self):
+        with self.lock:
+            self.recipients = []
+            self.sessions = set()
+
+def seed(day):
+    """生成 RESERVATIONS 个用户及其在 day 当天的预约（只写预约表，不占用时段）"""
+    campus_ids = [campus_id for (campus_id,) in db.session.query(Campus.id)]
+    db.session.execute(db.insert(User), [
+        {'student_id': f'nt{i:05d}', 'name': f'提醒用户{i}', 'email': f'nt{i:05d}@buaa.edu.cn',
+         'password_hash': '-', 'is_active': True}
+        for i in range(RESERVATIONS)
+    ])
+    user_ids = [user_id for (user_id,) in db.session.query(User.id).filter(User.student_id.like('nt%'))]
+    db.session.execute(db.insert(Reservation), [
+        {'user_id': user_id, 'campus_id': campus_ids[i % len(campus_ids)], 'date': day,
+         'start_hour': 8 + i % 13, 'end_hour': 9 + i % 13, 'status': 'active'}
+        for i, user_id in enumerate(user_ids)
+    ])
+    db.session.commit()
+
+def wait_until(predicate, timeout=DELIVERY_TIMEOUT):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return False
+
+def main():
+    tomorrow = date.today() + timedelta(days=1)
+    with app.app_context():
+        init_db()
+        seed(tomorrow)
+
+    handler = SinkHandler()
+    controller = Controller(handler, hostname='127.0.0.1', port=SMTP_PORT)
+    controller.start()
+    failed = False
+
+    print("="*60)
+    print(f"为 {tomorrow.isoformat()} 的 {RESERVATIONS} 个预约写入提醒")
+    with app.app_context():
+        began = time.perf_counter()
+        queued = queue_reservation_reminders(tomorrow)
+        elapsed = time.perf_counter() - began
+        began = time.perf_counter()
+        requeued = queue_reservation_reminders(tomorrow)
+        repeat_elapsed = time.perf_counter() - began
+        first_due = db.session.query(db.func.min(EmailOutbox.next_attempt_at)).scalar()
+    print(f"写入 {queued} 封，耗时 {elapsed * 1000:.0f}ms；重复执行写入 {requeued} 封，耗时 {repeat_elapsed * 1000:.0f}ms")
+    print(f"最早发送时间（UTC）: {first_due}")
+    if queued != RESERVATIONS or requeued != 0:
+        print("✗ 提醒数量不符合预期")
+        failed = True
+
+    print("="*60)
+    print(f"旧方式：每封邮件单独建立 SMTP 连接（发送 {BASELINE_MESSAGES} 封）")
+    with app.app_context():
+        emails = EmailOutbox.query.order_by(EmailOutbox.id).limit(BASELINE_MESSAGES).all()
+        began = time.perf_counter()
+        for email in emails:
+            mail.send(mail_outbox.to_message(email))
+        baseline_rate = len(emails) / (time.perf_counter() - began)
+    print(f"{baseline_rate:.0f} 封/秒，{len(handler.sessions)} 个 SMTP 会话")
+    handler.reset()
+
+    print("="*60)
+    print(f"发件箱：{mail_outbox.MAIL_WORKERS} 个线程复用连接（发送全部 {queued} 封）")
+    with app.app_context():
+        # 提前到期，立即发送
+        db.session.query(EmailOutbox).update({'next_attempt_at': datetime.utcnow()})
+        db.session.commit()
+    began = time.perf_counter()
+    mail_outbox.outbox_workers.notify()
+    delivered = wait_until(lambda: len(handler.recipients) >= queued)
+    outbox_rate = len(handler.recipients) / (time.perf_counter() - began)
+    controller.stop()
+    print(f"{outbox_rate:.0f} 封/秒，{len(handler.sessions)} 个 SMTP 会话，速度为旧方式的 {outbox_rate / baseline_rate:.1f} 倍")
+    if not delivered or len(set(handler.recipients)) != queued or len(handler.recipients) != queued:
+        print("✗ 提醒未全部送达或重复发送")
+        failed = True
+    max_sessions = mail_outbox.MAIL_WORKERS * (queued // mail_outbox.MAIL_MESSAGES_PER_CONNECTION + 2)
+    if len(handler.sessions) > max_sessions:
+        print("✗ 发送线程未复用 SMTP 连接")
+        failed = True
+    print("="*60)
+
+    if failed:
+        sys.exit(1)
+    print("✓ 提醒一次写入且不重复，发件箱复用连接批量送达")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+邮件发件箱测试
+使用 aiosmtpd 在本地启动一个较慢的 SMTP 服务器（每封邮件 1 秒），逐个注册用户：
+  - 注册接口只写入发件箱，耗时与 SMTP 服务器速度无关
+  - 全部验证邮件最终送达，且发送线程复用 SMTP 连接
+  - SMTP 服务器不可用期间邮件按退避重试，恢复后送达
+使用临时数据库，不影响现有数据。需要安装 aiosmtpd：pip install aiosmtpd
+"""
+
+import sys
+import os
+import logging
+import socket
+import tempfile
+import threading
+import time
+
+# 添加父目录到路径以便导入模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    from aiosmtpd.controller import Controller
+except ImportError:
+    print("✗ 需要安装 aiosmtpd：pip install aiosmtpd")
+    sys.exit(1)
+
+logging.getLogger('mail.log').setLevel(logging.WARNING)
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+SMTP_PORT = free_port()
+DB_FILE = os.path.join(tempfile.mkdtemp(), 'outbox.db')
+os.environ.setdefault('DATABASE_URL', f'sqlite:///{DB_FILE}')
+os.environ['EMAIL_VERIFICATION_ENABLED'] = 'true'
+os.environ['MAIL_SERVER'] = '127.0.0.1'
+os.environ['MAIL_PORT'] = str(SMTP_PORT)
+os.environ['MAIL_USE_TLS'] = 'false'
+os.environ['MAIL_DEFAULT_SENDER'] = 'noreply@buaa.edu.cn'
+
+import mail_outbox
+from app import app
+from models import db, init_db, EmailOutbox
+
+USERS = 20
+SMTP_DELAY = 1.0           # 模拟较慢的 SMTP 服务器（每封邮件的耗时，秒）
+REGISTER_TIME_LIMIT = 0.5  # 注册接口的最长耗时（秒，主要为密码哈希），同步发送时至少为 SMTP_DELAY
+DELIVERY_TIMEOUT = 60
+
+class SlowHandler:
+    """记录收到的邮件和建立的连接数"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.recipients = []
+        self.sessions = set()
+
+    async def handle_DATA(self, server, session, envelope):
+        time.sleep(SMTP_DELAY)
+        with self.lock:
+            self.recipients.extend(envelope.rcpt_tos)
+            self.sessions.add(id(session))
+        return '250 OK'
+
+def register(client, i):
+    began = time.perf_counter()
+    response = client.post('/api/auth/register', json={
+        'student_id': f'ob{i:05d}', 'name': f'发件箱{i}',
+        'email': f'ob{i:05d}@buaa.edu.cn', 'password': 'pw123456'
+    })
+    assert response.status_code == 201, response.get_json()
+    return time.perf_counter() - began
+
+def wait_until(predicate, timeout=DELIVERY_TIMEOUT):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.2)
+    return False
+
+def main():
+    with app.app_context():
+        init_db()
+    client = app.test_client()
+    handler = SlowHandler()
+    controller = Controller(handler, hostname='127.0.0.1', port=SMTP_PORT)
+    controller.start()
+    failed = False
+
+    print("="*60)
+    print(f"注册 {USERS} 个用户（SMTP 每封邮件耗时 {SMTP_DELAY}s）")
+    latencies = sorted(register(client, i) for i in range(USERS))
+    print(f"注册耗时: p50 {latencies[len(latencies) // 2] * 1000:.0f}ms, 最长 {latencies[-1] * 1000:.0f}ms")
+    if latencies[-1] > REGISTER_TIME_LIMIT:
+        print(f"✗ 注册耗时超过 {REGISTER_TIME_LIMIT}s")
+        failed = True
+
+    delivered = wait_until(lambda: len(handler.recipients) >= USERS)
+    print(f"已送达 {len(handler.recipients)}/{USERS} 封，使用 {len(handler.sessions)} 个 SMTP 连接")
+    if not delivered or len(set(handler.recipients)) != USERS:
+        print("✗ 验证邮件未全部送达或重复发送")
+        failed = True
+    if len(handler.sessions) > mail_outbox.MAIL_WORKERS * 2:
+        print("✗ 发送线程未复用 SMTP 连接")
+        failed = True
+
+    print("="*60)
+    print("SMTP 服务器停止期间注册用户，恢复后重试送达")
+    controller.stop()
+    mail_outbox.MAIL_RETRY_BASE = 1
+    register(client, USERS)
+    with app.app_context():
+        retried = wait_until(lambda: db.session.query(EmailOutbox.attempts).filter(
+            EmailOutbox.recipient == f'ob{USERS:05d}@buaa.edu.cn'
+        ).scalar() or 0, timeout=10)
+        db.session.remove()
+    controller = Controller(handler, hostname='127.0.0.1', port=SMTP_PORT)
+    controller.start()
+    recovered = wait_until(lambda: f'ob{USERS:05d}@buaa.edu.cn' in handler.recipients)
+    controller.stop()
+    print(f"发送失败后已安排重试: {bool(retried)}，恢复后送达: {recovered}")
+    if not (retried and recovered):
+        print("✗ 发送失败的邮件未重试送达")
+        failed = True
+    print("="*60)
+
+    if failed:
+        sys.exit(1)
+    print("✓ 注册不等待 SMTP，邮件全部送达并在失败后重试")
+
+if __name__ == '__main__':
+    main()
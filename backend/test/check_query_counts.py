@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+列表接口查询次数检查
+分别在少量和大量数据下请求各列表接口，读取 X-Query-Count 响应头，
+确认查询次数与返回行数无关（没有 N+1 查询）
+使用临时数据库，不影响现有数据
+"""
+
+import sys
+import os
+import tempfile
+
+# 添加父目录到路径以便导入模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DB_FILE = os.path.join(tempfile.mkdtemp(), 'query_count.db')
+os.environ.setdefault('DATABASE_URL', f'sqlite:///{DB_FILE}')
+os.environ['SQL_QUERY_COUNT_HEADER'] = 'true'
+
+from datetime import date, datetime
+from flask_jwt_extended import create_access_token
+from app import app
+from cache import snapshot_cache
+from unavailable_rules import rule_engine
+from models import (db, init_db, User, Reservation, UnavailableTime, KeyManager,
+                    Equipment, EquipmentBorrow)
+
+CAMPUS_ID = 1
+TODAY = date.today().isoformat()
+
+ENDPOINTS = [
+    '/api/reservation/my-reservations',
+    '/api/reservation/weekly?campus_id=1',
+    f'/api/reservation/date/{TODAY}?campus_id=1',
+    '/api/key/pickups?campus_id=1',
+    '/api/key/managers/1',
+    '/api/admin/unavailable-times',
+    '/api/admin/key-managers',
+    '/api/admin/reservations?page_size=100',
+    '/api/equipment/borrows',
+    '/api/equipment/my-borrows',
+    '/api/equipment/list',
+    '/api/equipment/my-equipment',
+]
+
+def seed(count, offset, admin):
+    """为 count 个不同用户各生成一组预约、设备、借用记录等数据，并为管理员生成同样数量的个人记录"""
+    for i in range(offset, offset + count):
+        user = User(student_id=f'qc{i:04d}', name=f'用户{i}',
+                    email=f'qc{i:04d}@buaa.edu.cn', password_hash='-')
+        db.session.add(user)
+        db.session.flush()
+        for owner_id in (user.id, admin.id):
+            db.session.add(Reservation(user_id=owner_id, campus_id=CAMPUS_ID, date=date.today(),
+                                       start_hour=8 + i % 14, end_hour=9 + i % 14,
+                                       key_picked_up=True, key_pickup_time=datetime.utcnow(),
+                                       key_overdue_at=datetime.utcnow()))
+            db.session.add(Equipment(user_id=owner_id, campus_id=CAMPUS_ID, equipment_type='吉他',
+                                     equipment_name=f'吉他{i}', location='排练室', contact='-'))
+            db.session.add(EquipmentBorrow(user_id=owner_id, equipment_name=f'吉他{i}'))
+        db.session.add(UnavailableTime(campus_id=CAMPUS_ID, start_hour=0, end_hour=1, reason=str(i)))
+        db.session.add(KeyManager(campus_id=CAMPUS_ID, name=f'管理员{i}', contact='-'))
+    db.session.commit()
+
+def collect(client, headers):
+    """返回每个接口的 (查询次数, 返回行数)"""
+    results = {}
+    for url in ENDPOINTS:
+        snapshot_cache.clear()
+        rule_engine.invalidate()
+        response = client.get(url, headers=headers)
+        assert response.status_code == 200, f'{url}: {response.status_code}'
+        body = response.get_json()
+        rows = body.get('reservations', body.get('data', body.get('overdue'))) if isinstance(body, dict) else body
+        results[url] = (int(response.headers['X-Query-Count']), len(rows))
+    return results
+
+def main():
+    client = app.test_client()
+
+    with app.app_context():
+        init_db()
+        admin = User.query.filter_by(is_admin=True).first()
+        headers = {'Authorization': f'Bearer {create_access_token(identity=str(admin.id))}'}
+        seed(5, 0, admin)
+
+    # 在应用上下文之外发请求，每个请求使用独立的数据库会话
+    small = collect(client, headers)
+
+    with app.app_context():
+        admin = User.query.filter_by(is_admin=True).first()
+        seed(45, 5, admin)
+
+    large = collect(client, headers)
+
+    print("="*72)
+    print(f"{'接口':<46}{'少量数据':>12}{'大量数据':>12}")
+    print("="*72)
+    failed = []
+    for url in ENDPOINTS:
+        (small_queries, small_rows), (large_queries, large_rows) = small[url], large[url]
+        print(f"{url.split('?')[0]:<46}{f'{small_queries}q/{small_rows}行':>12}{f'{large_queries}q/{large_rows}行':>12}")
+        if small_queries != large_queries:
+            failed.append(url)
+    print("="*72)
+
+    if failed:
+        print("✗ 查询次数随行数增长:", ', '.join(failed))
+        sys.exit(1)
+    print("✓ 所有列表接口查询次数恒定")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+预约事件推送（SSE）检查
+  - HEAD 请求和未读取响应体就关闭的连接不会遗留订阅者，反复请求后订阅数仍为 0
+  - 已建立的连接收到发布的事件，关闭后取消订阅
+  - 订阅数达到上限时返回 503，连接关闭后恢复
+使用临时数据库，不影响现有数据
+"""
+
+import sys
+import os
+import tempfile
+
+# 添加父目录到路径以便导入模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DB_FILE = os.path.join(tempfile.mkdtemp(), 'sse.db')
+os.environ.setdefault('DATABASE_URL', f'sqlite:///{DB_FILE}')
+
+from app import app
+from events import event_broker
+from models import init_db
+
+CAMPUS_ID = 1
+STREAM_URL = f'/api/reservation/stream?campus_id={CAMPUS_ID}'
+REQUESTS = 50
+
+def check(condition, message):
+    print(f"{'✓' if condition else '✗'} {message}")
+    return condition
+
+def main():
+    with app.app_context():
+        init_db()
+    client = app.test_client()
+    ok = True
+
+    print("="*60)
+    for _ in range(REQUESTS):
+        client.head(STREAM_URL).close()
+    ok &= check(event_broker._count == 0, f"{REQUESTS} 个 HEAD 请求后订阅数为 {event_broker._count}")
+
+    for _ in range(REQUESTS):
+        response = client.get(STREAM_URL, buffered=False)
+        response.close()
+    ok &= check(event_broker._count == 0, f"{REQUESTS} 个未读取即关闭的连接后订阅数为 {event_broker._count}")
+
+    response = client.get(STREAM_URL, buffered=False)
+    chunks = response.response
+    next(chunks)  # retry 指令
+    event_broker.publish(CAMPUS_ID, 'created', {'id': 1})
+    ok &= check('event: created' in next(chunks).decode(), "已建立的连接收到发布的事件")
+    response.close()
+    ok &= check(event_broker._count == 0, "读取事件后关闭连接，订阅已取消")
+
+    print("="*60)
+    max_subscribers = event_broker.max_subscribers
+    event_broker.max_subscribers = 2
+    try:
+        open_responses = [client.get(STREAM_URL, buffered=False) for _ in range(2)]
+        ok &= check(client.get(STREAM_URL).status_code == 503, "订阅数达到上限时返回 503")
+        for response in open_responses:
+            response.close()
+        response = client.get(STREAM_URL, buffered=False)
+        ok &= check(response.status_code == 200, "连接关闭后可重新订阅")
+        response.close()
+    finally:
+        event_broker.max_subscribers = max_subscribers
+    print("="*60)
+
+    if not ok:
+        sys.exit(1)
+    print("✓ 订阅随连接关闭释放")
+
+if __name__ == '__main__':
+    main()
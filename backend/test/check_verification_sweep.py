@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+邮箱验证令牌迁移和清理检查
+  - 从旧结构（users 表保存明文令牌）迁移：令牌转为摘要后仍可验证，明文清空，已有账户不带注册标记
+  - 清理任务只删除开启邮箱验证后注册、超过保留期仍未验证且没有任何记录的账户：
+    迁移前的未验证账户、被启用过的账户、有预约的账户和已验证的账户均保留
+  - 验证邮件发送后发件箱中不保留令牌明文，链接失效后的验证邮件被删除
+  - 分批删除直到全部清理完，被删除的邮箱可重新注册
+使用临时数据库，不影响现有数据。使用 aiosmtpd 在本地接收验证邮件，需要安装 aiosmtpd：pip install aiosmtpd
+"""
+
+import sys
+import os
+import email
+import logging
+import re
+import socket
+import tempfile
+import threading
+import time
+
+# 添加父目录到路径以便导入模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    from aiosmtpd.controller import Controller
+except ImportError:
+    print("✗ 需要安装 aiosmtpd：pip install aiosmtpd")
+    sys.exit(1)
+
+logging.getLogger('mail.log').setLevel(logging.WARNING)
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+SMTP_PORT = free_port()
+DB_FILE = os.path.join(tempfile.mkdtemp(), 'verification.db')
+os.environ.setdefault('DATABASE_URL', f'sqlite:///{DB_FILE}')
+os.environ['EMAIL_VERIFICATION_ENABLED'] = 'true'
+os.environ['MAIL_SERVER'] = '127.0.0.1'
+os.environ['MAIL_PORT'] = str(SMTP_PORT)
+os.environ['MAIL_USE_TLS'] = 'false'
+os.environ['MAIL_DEFAULT_SENDER'] = 'noreply@buaa.edu.cn'
+
+from datetime import date, datetime, timedelta
+import verification
+import migrate_add_verification_tokens
+from app import app
+from mail_outbox import REDACTED_BODY
+from models import db, init_db, User, Reservation, VerificationToken, EmailOutbox
+from verification import (find_verification_token, sweep_expired_tokens, purge_verification_mail,
+                          purge_stale_registrations, UNVERIFIED_RETENTION, VERIFICATION_SUBJECT,
+                          VERIFICATION_MAIL_PREFIX)
+
+STALE_REGISTRATIONS = 5
+PASSWORD = 'password123'
+DELIVERY_TIMEOUT = 30
+
+class TokenSink:
+    """按收件人记录验证邮件中的令牌"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tokens = {}
+
+    async def handle_DATA(self, server, session, envelope):
+        message = email.message_from_bytes(envelope.content)
+        text = ''.join(part.get_payload(decode=True).decode('utf-8')
+                       for part in message.walk() if not part.is_multipart())
+        match = re.search(r'token=([\w-]+)', text)
+        with self.lock:
+            for recipient in envelope.rcpt_tos:
+                self.tokens[recipient] = match.group(1) if match else None
+        return '250 OK'
+
+def wait_until(predicate, timeout=DELIVERY_TIMEOUT):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.1)
+    return False
+
+def all_verification_mail_sent():
+    """发送线程在独立会话中更新状态，每次查询前结束当前会话以读取最新数据"""
+    db.session.remove()
+    return db.session.query(EmailOutbox.id).filter(
+        EmailOutbox.notification_key.like(VERIFICATION_MAIL_PREFIX + '%'), EmailOutbox.status != 'sent'
+    ).first() is None
+
+def check(condition, message):
+    print(f"{'✓' if condition else '✗'} {message}")
+    return condition
+
+def add_legacy_users():
+    """迁移前的账户：很久以前注册的未启用成员、令牌早已过期的注册、令牌仍有效的注册"""
+    now = datetime.utcnow()
+    legacy = [
+        ('legacy-member', now - timedelta(days=400), None, None),
+        ('legacy-pending', now - timedelta(days=30), 'legacy-expired-token', now - timedelta(days=29)),
+        ('legacy-recent', now, 'legacy-valid-token', now + timedelta(minutes=30)),
+    ]
+    for name, created_at, _, _ in legacy:
+        user = User(student_id=name, name=name, email=f'{name}@buaa.edu.cn', is_active=False,
+                    email_verified=False, created_at=created_at)
+        user.set_password(PASSWORD)
+        db.session.add(user)
+    db.session.commit()
+    return legacy
+
+def downgrade_schema(legacy):
+    """还原为旧结构：没有 verification_tokens 表和注册标记，令牌明文保存在 users 表"""
+    db.session.remove()
+    with db.engine.begin() as conn:
+        conn.execute(db.text("DROP TABLE verification_tokens"))
+        conn.execute(db.text("ALTER TABLE users DROP COLUMN registered_via_verification"))
+        conn.execute(db.text("ALTER TABLE users ADD COLUMN verification_token VARCHAR(100)"))
+        conn.execute(db.text("ALTER TABLE users ADD COLUMN verification_token_expires DATETIME"))
+        for name, _, token, expires in legacy:
+            if token:
+                conn.execute(db.text(
+                    "UPDATE users SET verification_token = :token, verification_token_expires = :expires "
+                    "WHERE student_id = :name"
+                ), {'token': token, 'expires': expires, 'name': name})
+
+def register(client, name):
+    response = client.post('/api/auth/register', json={
+        'student_id': name, 'name': name, 'email': f'{name}@buaa.edu.cn', 'password': PASSWORD
+    })
+    return response.status_code == 201
+
+def user_by_name(name):
+    return User.query.filter_by(student_id=name).first()
+
+def main():
+    client = app.test_client()
+    sink = TokenSink()
+    controller = Controller(sink, hostname='127.0.0.1', port=SMTP_PORT)
+    controller.start()
+    ok = True
+
+    print("="*60)
+    print("从旧结构迁移")
+    with app.app_context():
+        init_db()
+        downgrade_schema(add_legacy_users())
+    ok &= check(migrate_add_verification_tokens.migrate(), "迁移脚本执行成功")
+    with app.app_context():
+        columns = [row[1] for row in db.session.execute(db.text("PRAGMA table_info(users)"))]
+        ok &= check('registered_via_verification' in columns and 'verification_token' not in columns,
+                    "已添加注册标记列，明文令牌列已删除")
+        ok &= check(VerificationToken.query.count() == 2, "两个明文令牌已转为摘要")
+        record = find_verification_token('legacy-valid-token')
+        ok &= check(record is not None and record.user.student_id == 'legacy-recent', "按原令牌可找到摘要记录")
+        ok &= check(User.query.filter(User.registered_via_verification.is_(True)).count() == 0,
+                    "迁移前的账户不带注册标记")
+    ok &= check(client.post('/api/auth/verify-email', json={'token': 'legacy-valid-token'}).status_code == 200,
+                "迁移前发出的验证链接仍然有效")
+    with app.app_context():
+        # 旧版本发送的验证邮件（没有去重键，正文含令牌明文）
+        db.session.add(EmailOutbox(recipient='legacy-pending@buaa.edu.cn', subject=VERIFICATION_SUBJECT,
+                                   body='token=legacy-expired-token', status='sent'))
+        db.session.commit()
+
+    print("="*60)
+    print("开启邮箱验证后注册")
+    names = ['fresh-verified', 'fresh-reserved', 'fresh-activated'] + \
+        [f'fresh-stale-{i}' for i in range(STALE_REGISTRATIONS)]
+    ok &= check(all(register(client, name) for name in names), f"注册 {len(names)} 个账户")
+    with app.app_context():
+        ok &= check(all(user_by_name(name).registered_via_verification for name in names), "新注册的账户带注册标记")
+    ok &= check(wait_until(lambda: len(sink.tokens) == len(names) and all(sink.tokens.values())),
+                f"收到 {len(sink.tokens)} 封带验证链接的邮件")
+    with app.app_context():
+        ok &= check(wait_until(all_verification_mail_sent), "验证邮件均已标记为已发送")
+        leaked = [token for token in sink.tokens.values() if EmailOutbox.query.filter(
+            db.or_(EmailOutbox.body.contains(token), EmailOutbox.html.contains(token))
+        ).first()]
+        redacted = EmailOutbox.query.filter(EmailOutbox.notification_key.like(VERIFICATION_MAIL_PREFIX + '%')).all()
+        ok &= check(not leaked and all(mail.body == REDACTED_BODY and mail.html is None for mail in redacted),
+                    "发送后发件箱中不保留令牌明文")
+    token = sink.tokens['fresh-verified@buaa.edu.cn']
+    ok &= check(client.post('/api/auth/verify-email', json={'token': token}).status_code == 200,
+                "一个账户按邮件中的链接完成验证")
+    with app.app_context():
+        # 一个账户有预约；一个账户被管理员启用后又在年度重置中停用
+        db.session.add(Reservation(user_id=user_by_name('fresh-reserved').id, campus_id=1,
+                                   date=date.today(), start_hour=8, end_hour=9, status='cancelled'))
+        activated = user_by_name('fresh-activated')
+        activated.auth_version += 2
+        db.session.commit()
+
+    print("="*60)
+    print(f"{UNVERIFIED_RETENTION.days} 天后执行清理（每批 2 个）")
+    verification.SWEEP_BATCH_SIZE = 2
+    later = datetime.utcnow() + UNVERIFIED_RETENTION + timedelta(days=1)
+    with app.app_context():
+        remaining_tokens = VerificationToken.query.count()
+        ok &= check(sweep_expired_tokens(later) == remaining_tokens and VerificationToken.query.count() == 0,
+                    f"删除 {remaining_tokens} 个过期令牌")
+        mails = purge_verification_mail(later)
+        ok &= check(mails == len(names) + 1 and EmailOutbox.query.count() == 0,
+                    f"删除 {mails} 封链接已失效的验证邮件（含旧版本写入的邮件）")
+        purged = purge_stale_registrations(later)
+        ok &= check(purged == STALE_REGISTRATIONS, f"删除 {purged} 个长期未验证的注册")
+        ok &= check(purge_stale_registrations(later) == 0, "重复执行不再删除")
+        kept = {user.student_id for user in User.query}
+        expected = {'legacy-member', 'legacy-pending', 'legacy-recent',
+                    'fresh-verified', 'fresh-reserved', 'fresh-activated'}
+        ok &= check(expected <= kept, "迁移前的账户、已验证、有预约和被启用过的账户均保留")
+        ok &= check(not any(name.startswith('fresh-stale') for name in kept), "长期未验证的注册已全部删除")
+    ok &= check(register(client, 'fresh-stale-0'), "被删除的邮箱和学号可重新注册")
+    controller.stop()
+    print("="*60)
+
+    if not ok:
+        sys.exit(1)
+    print("✓ 发件箱不保留令牌明文，清理任务只删除开启验证后注册且长期未验证的账户")
+
+if __name__ == '__main__':
+    main()
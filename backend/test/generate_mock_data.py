@@ -14,7 +14,7 @@ from datetime import datetime, timedelta, date
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app import app
-from models import db, User, Campus, Reservation, Equipment, KeyManager, EquipmentBorrow, UnavailableTime
+from models import db, User, Campus, Reservation, ReservationSlot, UserWeeklyHours, Equipment, KeyManager, EquipmentBorrow, UnavailableTime
 
 # 中文姓氏和名字用于生成随机姓名
 SURNAMES = [
@@ -82,6 +82,8 @@ def clear_database():
     print("清空现有数据...")
     EquipmentBorrow.query.delete()
     Equipment.query.delete()
+    ReservationSlot.query.delete()
+    UserWeeklyHours.query.delete()
     Reservation.query.delete()
     UnavailableTime.query.delete()
     KeyManager.query.delete()
@@ -331,6 +333,7 @@ def create_reservations(students, campuses, days_range=14):
                 key_pickup_time=key_pickup_time,
                 created_at=datetime.now() - timedelta(days=days_offset, hours=random.randint(1, 24))
             )
+            reservation.claim_slots()
             db.session.add(reservation)
             reservations.append(reservation)
     
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+登录限流压力测试
+  - 大量用户同时登录：同时计算的密码哈希数不超过线程池大小，排队已满的请求立即返回 429
+  - 同一邮箱连续输错密码：超过限额后返回 429 及 Retry-After
+  - 旧参数的密码哈希在登录成功后按新参数重新哈希
+使用临时数据库，不影响现有数据
+"""
+
+import sys
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+# 添加父目录到路径以便导入模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DB_FILE = os.path.join(tempfile.mkdtemp(), 'login.db')
+os.environ.setdefault('DATABASE_URL', f'sqlite:///{DB_FILE}')
+os.environ['PASSWORD_HASH_WORKERS'] = '2'
+os.environ['PASSWORD_HASH_QUEUE'] = '6'
+# 所有请求来自同一 IP，放宽 IP 限额以测试线程池
+os.environ['LOGIN_IP_BURST'] = '10000'
+
+from werkzeug.security import generate_password_hash
+import models
+from app import app
+from models import db, init_db, User, PASSWORD_HASH_METHOD
+from login_guard import PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE, LOGIN_EMAIL_BURST
+
+USER_COUNT = 64
+THREADS = 64
+PASSWORD = 'pw123456'
+REJECT_TIME_LIMIT = 0.1   # 429 响应的最长耗时（秒）
+
+# 统计同时计算的密码哈希数
+active = 0
+peak = 0
+counter_lock = threading.Lock()
+check_password_hash = models.check_password_hash
+
+def counting_check(pwhash, password):
+    global active, peak
+    with counter_lock:
+        active += 1
+        peak = max(peak, active)
+    try:
+        return check_password_hash(pwhash, password)
+    finally:
+        with counter_lock:
+            active -= 1
+
+models.check_password_hash = counting_check
+
+def create_users():
+    password_hash = generate_password_hash(PASSWORD, method=PASSWORD_HASH_METHOD)
+    db.session.execute(db.insert(User), [
+        {'student_id': f'lg{i:05d}', 'name': f'登录用户{i}', 'email': f'lg{i:05d}@buaa.edu.cn',
+         'password_hash': password_hash, 'is_active': True}
+        for i in range(USER_COUNT)
+    ])
+    # 旧参数（pbkdf2）哈希的用户
+    db.session.add(User(student_id='lgold', name='旧哈希用户', email='lgold@buaa.edu.cn', is_active=True,
+                        password_hash=generate_password_hash(PASSWORD, method='pbkdf2:sha256:100000')))
+    db.session.commit()
+
+def login(client, email, password=PASSWORD):
+    began = time.perf_counter()
+    response = client.post('/api/auth/login', json={'email': email, 'password': password})
+    return response.status_code, time.perf_counter() - began, response.headers.get('Retry-After')
+
+def main():
+    with app.app_context():
+        init_db()
+        create_users()
+    client = app.test_client()
+    failed = False
+
+    print("="*60)
+    print(f"{THREADS} 个用户同时登录（哈希线程 {PASSWORD_HASH_WORKERS}，排队上限 {PASSWORD_HASH_QUEUE}）")
+    with ThreadPoolExecutor(THREADS) as executor:
+        results = list(executor.map(lambda i: login(client, f'lg{i:05d}@buaa.edu.cn'), range(USER_COUNT)))
+    statuses = Counter(status for status, _, _ in results)
+    accepted = sorted(elapsed for status, elapsed, _ in results if status == 200)
+    rejected = sorted(elapsed for status, elapsed, _ in results if status == 429)
+    print(f"状态码: {dict(statuses)}，同时计算的哈希数峰值: {peak}")
+    if accepted:
+        print(f"成功登录耗时: p50 {accepted[len(accepted) // 2] * 1000:.0f}ms, 最长 {accepted[-1] * 1000:.0f}ms")
+    if rejected:
+        print(f"429 耗时: 最长 {rejected[-1] * 1000:.1f}ms")
+    if peak > PASSWORD_HASH_WORKERS:
+        print("✗ 同时计算的哈希数超过线程池大小")
+        failed = True
+    if set(statuses) - {200, 429} or not rejected or (rejected and rejected[-1] > REJECT_TIME_LIMIT):
+        print("✗ 排队已满时未立即返回 429")
+        failed = True
+
+    print("="*60)
+    print(f"同一邮箱连续输错密码 {LOGIN_EMAIL_BURST + 3} 次")
+    attempts = [login(client, 'nobody@buaa.edu.cn', 'wrong') for _ in range(LOGIN_EMAIL_BURST + 3)]
+    print(f"状态码: {[status for status, _, _ in attempts]}，Retry-After: {attempts[-1][2]}")
+    if [status for status, _, _ in attempts] != [401] * LOGIN_EMAIL_BURST + [429] * 3 or not attempts[-1][2]:
+        print("✗ 邮箱限流不符合预期")
+        failed = True
+
+    print("="*60)
+    status, _, _ = login(client, 'lgold@buaa.edu.cn')
+    with app.app_context():
+        method = User.query.filter_by(email='lgold@buaa.edu.cn').first().password_hash.split('$', 1)[0]
+    print(f"旧哈希用户登录: {status}，当前哈希参数: {method}")
+    if status != 200 or method != PASSWORD_HASH_METHOD:
+        print("✗ 未按新参数重新哈希")
+        failed = True
+    print("="*60)
+
+    if failed:
+        sys.exit(1)
+    print("✓ 密码哈希并发受限，超限请求快速拒绝，邮箱限流和重新哈希正常")
+
+if __name__ == '__main__':
+    main()
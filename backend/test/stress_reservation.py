@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+预约并发压力测试
+多线程并发请求同一校区同一天的时间段，验证不会出现重复预约
+使用临时数据库，不影响现有数据
+"""
+
+import sys
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+# 添加父目录到路径以便导入模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DB_FILE = os.path.join(tempfile.mkdtemp(), 'stress.db')
+os.environ.setdefault('DATABASE_URL', f'sqlite:///{DB_FILE}')
+
+from datetime import date
+from flask_jwt_extended import create_access_token
+from app import app
+from models import db, init_db, User, Reservation
+
+USER_COUNT = 60
+THREADS = 32
+REQUESTS = 2000
+CAMPUS_ID = 1
+
+# 可预约的时间段（与 validate_time_slot 一致）
+SLOTS = [(s, e) for lo, hi in [(8, 12), (13, 18), (19, 22)]
+         for s in range(lo, hi) for e in range(s + 1, min(s + 3, hi) + 1)]
+
+def create_users():
+    """创建测试用户并返回访问令牌"""
+    tokens = []
+    for i in range(USER_COUNT):
+        user = User(
+            student_id=f'stress{i:04d}',
+            name=f'压测用户{i}',
+            email=f'stress{i:04d}@buaa.edu.cn',
+            password_hash='-',
+            is_active=True
+        )
+        db.session.add(user)
+        db.session.flush()
+        tokens.append(create_access_token(identity=str(user.id)))
+    db.session.commit()
+    return tokens
+
+def find_double_bookings():
+    """查找重叠的有效预约"""
+    reservations = Reservation.query.filter_by(campus_id=CAMPUS_ID, status='active').all()
+    overlaps = []
+    for i, a in enumerate(reservations):
+        for b in reservations[i + 1:]:
+            if a.date == b.date and a.start_hour < b.end_hour and b.start_hour < a.end_hour:
+                overlaps.append((a.id, b.id))
+    return overlaps
+
+def main():
+    print("="*60)
+    print(f"预约并发压力测试：{THREADS} 线程，{REQUESTS} 次请求")
+    print("="*60)
+
+    with app.app_context():
+        init_db()
+        tokens = create_users()
+
+    target_date = date.today().isoformat()
+    statuses = Counter()
+    lock = threading.Lock()
+
+    def book(_):
+        start_hour, end_hour = random.choice(SLOTS)
+        client = app.test_client()
+        response = client.post(
+            '/api/reservation/create',
+            json={'campus_id': CAMPUS_ID, 'date': target_date,
+                  'start_hour': start_hour, 'end_hour': end_hour},
+            headers={'Authorization': f'Bearer {random.choice(tokens)}'}
+        )
+        with lock:
+            statuses[response.status_code] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=THREADS) as executor:
+        list(executor.map(book, range(REQUESTS)))
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        overlaps = find_double_bookings()
+        booked_hours = sum(
+            r.end_hour - r.start_hour
+            for r in Reservation.query.filter_by(campus_id=CAMPUS_ID, status='active')
+        )
+
+    print(f"\n耗时: {elapsed:.2f}s ({REQUESTS / elapsed:.0f} 请求/秒)")
+    for status, count in sorted(statuses.items()):
+        print(f"  - HTTP {status}: {count}")
+    print(f"已预约小时数: {booked_hours}")
+    print(f"重复预约: {len(overlaps)}")
+    print("="*60)
+
+    if overlaps:
+        print("✗ 发现重复预约:", overlaps[:10])
+        sys.exit(1)
+    print("✓ 无重复预约")
+
+if __name__ == '__main__':
+    main()
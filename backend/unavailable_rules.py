@@ -0,0 +1,119 @@
+"""
+不可预约时间规则引擎
+把每个校区的 UnavailableTime 规则编译为小时位图：
+  - 所有日期生效的位图
+  - 按周几（0=周日, ..., 6=周六）生效的 7 个位图
+  - 按特定日期生效的稀疏 {日期: 位图}
+某天被封锁的小时 = 三者按位或，预约校验和周视图都只需 O(1) 查表。
+管理员增删规则后调用 invalidate() 重新编译。
+"""
+
+import threading
+import time
+
+from sqlalchemy import cast, extract, func, Integer
+
+from models import db, UnavailableTime
+from occupancy import hour_mask
+
+# 编译结果的最长存活时间（秒），用于兜底多进程部署下其他进程的规则修改
+DEFAULT_TTL = 30
+
+
+def day_of_week_index(date):
+    """date.weekday()（0=周一）转换为规则使用的 0=周日, 1=周一, ..., 6=周六"""
+    return (date.weekday() + 1) % 7
+
+
+def day_of_week_expression(column):
+    """日期列在 SQL 中的星期几，与 day_of_week_index 一致（0=周日, ..., 6=周六）"""
+    if db.engine.dialect.name == 'sqlite':
+        return cast(func.strftime('%w', column), Integer)
+    return cast(extract('dow', column), Integer)
+
+
+class CampusRules:
+    """单个校区编译后的规则"""
+
+    def __init__(self, rules):
+        self.all_days_mask = 0
+        self.weekly_masks = [0] * 7
+        self.date_masks = {}
+        # 与位图对应的原始时间段，用于给出原因和展示
+        self._all_days = []
+        self._weekly = [[] for _ in range(7)]
+        self._dates = {}
+
+        for rule in rules:
+            block = (rule.start_hour, rule.end_hour, rule.reason)
+            mask = hour_mask(rule.start_hour, rule.end_hour)
+            if rule.date is None and rule.day_of_week is None:
+                self.all_days_mask |= mask
+                self._all_days.append(block)
+                continue
+            # 同时设置了日期和周几的规则，两者任一匹配即生效
+            if rule.date is not None:
+                self.date_masks[rule.date] = self.date_masks.get(rule.date, 0) | mask
+                self._dates.setdefault(rule.date, []).append(block)
+            if rule.day_of_week is not None:
+                self.weekly_masks[rule.day_of_week] |= mask
+                self._weekly[rule.day_of_week].append(block)
+
+    def mask_for(self, date):
+        """某天被封锁的小时位图"""
+        return (self.all_days_mask
+                | self.weekly_masks[day_of_week_index(date)]
+                | self.date_masks.get(date, 0))
+
+    def _blocks_for(self, date):
+        return self._dates.get(date, []) + self._weekly[day_of_week_index(date)] + self._all_days
+
+    def blocking_reason(self, date, start_hour, end_hour):
+        """时间段被封锁时返回原因，否则返回 None"""
+        if not self.mask_for(date) & hour_mask(start_hour, end_hour):
+            return None
+        for block_start, block_end, reason in self._blocks_for(date):
+            if block_start < end_hour and block_end > start_hour:
+                return reason or '该时间段不可预约'
+        return '该时间段不可预约'
+
+    def blocked_hours(self, date):
+        """某天被封锁的时间段列表"""
+        blocks = sorted(set(self._blocks_for(date)), key=lambda b: (b[0], b[1], b[2] or ''))
+        return [
+            {'start_hour': start_hour, 'end_hour': end_hour, 'reason': reason}
+            for start_hour, end_hour, reason in blocks
+        ]
+
+
+class RuleEngine:
+    """按校区懒加载编译规则"""
+
+    def __init__(self, ttl=DEFAULT_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._compiled = {}  # campus_id -> (CampusRules, compiled_at)
+
+    def for_campus(self, campus_id):
+        campus_id = int(campus_id)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._compiled.get(campus_id)
+            if entry and now - entry[1] < self.ttl:
+                return entry[0]
+
+        compiled = CampusRules(UnavailableTime.query.filter_by(campus_id=campus_id).all())
+        with self._lock:
+            self._compiled[campus_id] = (compiled, now)
+        return compiled
+
+    def invalidate(self, campus_id=None):
+        """规则变更后丢弃编译结果，campus_id 为空时丢弃全部"""
+        with self._lock:
+            if campus_id is None:
+                self._compiled.clear()
+            else:
+                self._compiled.pop(int(campus_id), None)
+
+
+rule_engine = RuleEngine()
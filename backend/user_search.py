@@ -0,0 +1,102 @@
+"""
+用户搜索索引
+SQLite 下使用 FTS5 trigram 全文索引（users_fts）覆盖姓名和学号，由触发器在用户增删改时同步，
+子串搜索无需全表扫描。trigram 至少需要 3 个字符，更短的关键词（如两个字的姓名）以及
+不支持 FTS5 的数据库回退到 LIKE 查询。
+"""
+
+import threading
+
+from sqlalchemy import column, text
+
+from models import db, User
+
+# trigram 分词的最短可检索长度
+MIN_TRIGRAM_LENGTH = 3
+
+USER_SEARCH_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(
+        name, student_id, content='users', content_rowid='id', tokenize='trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS users_fts_ai AFTER INSERT ON users BEGIN
+        INSERT INTO users_fts(rowid, name, student_id) VALUES (new.id, new.name, new.student_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS users_fts_ad AFTER DELETE ON users BEGIN
+        INSERT INTO users_fts(users_fts, rowid, name, student_id)
+        VALUES ('delete', old.id, old.name, old.student_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS users_fts_au AFTER UPDATE OF name, student_id ON users BEGIN
+        INSERT INTO users_fts(users_fts, rowid, name, student_id)
+        VALUES ('delete', old.id, old.name, old.student_id);
+        INSERT INTO users_fts(rowid, name, student_id) VALUES (new.id, new.name, new.student_id);
+    END
+    """,
+]
+
+_lock = threading.Lock()
+_available = {}  # 数据库地址 -> 是否已建立 users_fts
+
+
+def ensure_user_search_index():
+    """
+    创建 users_fts 及同步触发器，新建时按现有用户填充索引
+    返回是否可用（非 SQLite 或 SQLite 未编译 FTS5 trigram 时返回 False）
+    """
+    if db.engine.dialect.name != 'sqlite':
+        return False
+
+    try:
+        with db.engine.begin() as conn:
+            created = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'users_fts'")
+            ).first() is None
+            for statement in USER_SEARCH_DDL:
+                conn.execute(text(statement))
+            if created:
+                conn.execute(text("INSERT INTO users_fts(users_fts) VALUES ('rebuild')"))
+    except Exception as e:
+        print(f"Warning: User search index unavailable, falling back to LIKE: {e}")
+        return False
+
+    with _lock:
+        _available[str(db.engine.url)] = True
+    return True
+
+
+def user_search_index_available():
+    """当前数据库是否已建立 users_fts（结果按进程缓存）"""
+    if db.engine.dialect.name != 'sqlite':
+        return False
+
+    key = str(db.engine.url)
+    with _lock:
+        if key in _available:
+            return _available[key]
+
+    exists = db.session.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'users_fts'")
+    ).first() is not None
+    with _lock:
+        _available[key] = exists
+    return exists
+
+
+def filter_users_by_search(query, search):
+    """按姓名或学号子串筛选用户"""
+    if len(search) >= MIN_TRIGRAM_LENGTH and user_search_index_available():
+        # 加引号作为短语匹配，避免关键词被解析为 FTS5 查询语法
+        phrase = '"' + search.replace('"', '""') + '"'
+        matched_ids = text(
+            "SELECT rowid FROM users_fts WHERE users_fts MATCH :phrase"
+        ).bindparams(phrase=phrase).columns(column('rowid'))
+        return query.filter(User.id.in_(matched_ids))
+
+    pattern = f'%{search}%'
+    return query.filter(db.or_(User.name.like(pattern), User.student_id.like(pattern)))
@@ -0,0 +1,170 @@
+"""
+邮箱验证令牌
+令牌明文只出现在验证邮件中，数据库只保存其 SHA-256 摘要（定长、带唯一索引），
+数据库泄露也无法据此验证他人邮箱。令牌为 256 位随机值，无需加盐或慢哈希。
+验证邮件在发件箱中以 verification:<令牌摘要> 为 notification_key，发送后正文被清除（见 mail_outbox）。
+定时任务分批清理：
+  - 删除已过期的令牌
+  - 删除已发送或已放弃、创建超过 VERIFICATION_TOKEN_TTL 的验证邮件
+  - 删除开启邮箱验证时注册、超过 UNVERIFIED_RETENTION 仍未验证、未被启用且没有任何业务记录的账户
+    （registered_via_verification 标记；迁移前已有的账户和关闭验证时注册的账户不会被删除）
+"""
+
+import hashlib
+import secrets
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, delete, exists, or_, select
+
+from auth_claims import auth_versions, user_profiles
+from models import (db, User, VerificationToken, Reservation, UserWeeklyHours, Equipment, EquipmentBorrow, Job,
+                    EmailOutbox)
+
+# 验证令牌有效期
+VERIFICATION_TOKEN_TTL = timedelta(minutes=30)
+# 未验证的注册保留时间，超过后删除账户（邮箱和学号可重新注册）
+UNVERIFIED_RETENTION = timedelta(days=7)
+# 每批删除的行数，避免长时间持有写锁
+SWEEP_BATCH_SIZE = 500
+# 验证邮件的主题和发件箱去重键前缀
+VERIFICATION_SUBJECT = "音协预约 - 邮箱验证"
+VERIFICATION_MAIL_PREFIX = 'verification:'
+
+
+def hash_token(token):
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def verification_mail_key(token):
+    return VERIFICATION_MAIL_PREFIX + hash_token(token)
+
+
+def issue_verification_token(user):
+    """为用户生成新的验证令牌并使旧令牌失效（随当前事务提交），返回令牌明文"""
+    if user.id is not None:
+        VerificationToken.query.filter_by(user_id=user.id).delete(synchronize_session=False)
+    token = secrets.token_urlsafe(32)
+    db.session.add(VerificationToken(
+        user=user,
+        token_hash=hash_token(token),
+        expires_at=datetime.utcnow() + VERIFICATION_TOKEN_TTL
+    ))
+    return token
+
+
+def find_verification_token(token):
+    """按明文查找令牌记录，不存在时返回 None（过期与否由调用方判断）"""
+    return VerificationToken.query.filter_by(token_hash=hash_token(token)).first()
+
+
+def revoke_verification_tokens(user_id):
+    """删除用户的全部验证令牌（随当前事务提交）"""
+    VerificationToken.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+
+
+def _delete_in_batches(select_ids, delete_batch, after_commit=None):
+    """反复选出一批 ID 并删除，直到没有剩余，返回删除的总数"""
+    total = 0
+    while True:
+        ids = select_ids()
+        # 结束读事务，写事务以 DELETE 开始
+        db.session.rollback()
+        if not ids:
+            return total
+        deleted = delete_batch(ids)
+        db.session.commit()
+        if after_commit:
+            after_commit(ids)
+        total += deleted
+        if len(ids) < SWEEP_BATCH_SIZE:
+            return total
+
+
+def sweep_expired_tokens(now=None):
+    """分批删除已过期的验证令牌，返回删除数"""
+    now = now or datetime.utcnow()
+
+    def select_ids():
+        return [token_id for (token_id,) in db.session.query(VerificationToken.id).filter(
+            VerificationToken.expires_at < now
+        ).order_by(VerificationToken.expires_at).limit(SWEEP_BATCH_SIZE)]
+
+    def delete_batch(ids):
+        return db.session.execute(delete(VerificationToken).where(
+            VerificationToken.id.in_(ids), VerificationToken.expires_at < now
+        )).rowcount
+
+    return _delete_in_batches(select_ids, delete_batch)
+
+
+def _verification_mail_condition(now):
+    """已发送或已放弃、创建超过 VERIFICATION_TOKEN_TTL 的验证邮件（旧版本写入的验证邮件没有去重键，按主题匹配）"""
+    return [
+        EmailOutbox.status.in_(('sent', 'failed')),
+        EmailOutbox.created_at < now - VERIFICATION_TOKEN_TTL,
+        or_(
+            EmailOutbox.notification_key.like(VERIFICATION_MAIL_PREFIX + '%'),
+            and_(EmailOutbox.notification_key.is_(None), EmailOutbox.subject == VERIFICATION_SUBJECT)
+        )
+    ]
+
+
+def purge_verification_mail(now=None):
+    """分批删除链接已失效的验证邮件，返回删除数"""
+    now = now or datetime.utcnow()
+
+    def select_ids():
+        return [email_id for (email_id,) in db.session.query(EmailOutbox.id).filter(
+            *_verification_mail_condition(now)
+        ).order_by(EmailOutbox.id).limit(SWEEP_BATCH_SIZE)]
+
+    def delete_batch(ids):
+        return db.session.execute(delete(EmailOutbox).where(
+            EmailOutbox.id.in_(ids), *_verification_mail_condition(now)
+        )).rowcount
+
+    return _delete_in_batches(select_ids, delete_batch)
+
+
+def _stale_registration_condition(now):
+    """
+    开启邮箱验证时注册、超过 UNVERIFIED_RETENTION 仍未验证、未启用且没有任何业务记录的普通用户
+    未验证、未启用本身不能说明账户无人使用：关闭验证时注册的账户同样未验证，每年重置后普通用户均为未启用
+    """
+    conditions = [
+        User.registered_via_verification.is_(True),
+        User.created_at < now - UNVERIFIED_RETENTION,
+        User.email_verified.isnot(True),
+        User.is_active.isnot(True),
+        User.is_admin.isnot(True),
+        # 排除被管理员启用过或修改过权限的账户
+        User.auth_version == 0,
+        # 仍有有效令牌的用户刚刚重新发送过验证邮件
+        ~exists().where(VerificationToken.user_id == User.id, VerificationToken.expires_at >= now),
+    ]
+    for column in (Reservation.user_id, UserWeeklyHours.user_id, Equipment.user_id,
+                   EquipmentBorrow.user_id, Job.created_by):
+        conditions.append(~exists().where(column == User.id))
+    return conditions
+
+
+def purge_stale_registrations(now=None):
+    """分批删除长期未验证的注册，返回删除的用户数"""
+    now = now or datetime.utcnow()
+
+    def select_ids():
+        return [user_id for (user_id,) in db.session.query(User.id).filter(
+            *_stale_registration_condition(now)
+        ).order_by(User.id).limit(SWEEP_BATCH_SIZE)]
+
+    def delete_batch(ids):
+        # 删除时重新检查条件：选出后被启用或产生了记录的用户保留
+        stale_ids = select(User.id).where(User.id.in_(ids), *_stale_registration_condition(now))
+        db.session.execute(delete(VerificationToken).where(VerificationToken.user_id.in_(stale_ids)))
+        return db.session.execute(delete(User).where(User.id.in_(stale_ids))).rowcount
+
+    def after_commit(ids):
+        auth_versions.invalidate(ids)
+        user_profiles.invalidate(ids)
+
+    return _delete_in_batches(select_ids, delete_batch, after_commit)
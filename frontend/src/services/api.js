@@ -28,6 +28,11 @@ export const reservationService = {
     return api.post('/reservation/create', data)
   },
 
+  // 批量创建预约（全部成功或全部失败）
+  createReservationsBatch(reservations) {
+    return api.post('/reservation/batch', { reservations })
+  },
+
   // 获取我的预约
   getMyReservations() {
     return api.get('/reservation/my-reservations')
@@ -43,6 +48,11 @@ export const reservationService = {
     return api.get(`/reservation/date/${date}`, { params: { campus_id: campusId } })
   },
 
+  // 订阅校区预约变更事件（SSE），断线后浏览器自动携带 Last-Event-ID 重连
+  subscribeCampusEvents(campusId) {
+    return new EventSource(`${api.defaults.baseURL}/reservation/stream?campus_id=${campusId}`)
+  },
+
   // 取消预约
   cancelReservation(reservationId) {
     return api.delete(`/reservation/${reservationId}`)
@@ -179,8 +189,23 @@ export const adminService = {
     return api.post('/admin/users/batch-activate', { user_ids: userIds })
   },
 
+  // 管理后台概览计数
+  getSummary() {
+    return api.get('/admin/summary')
+  },
+
+  // 获取后台任务进度（年度重置、批量激活在后台分批执行）
+  getJob(jobId) {
+    return api.get(`/admin/jobs/${jobId}`)
+  },
+
   // 获取历史预约记录
   getReservationHistory(params) {
     return api.get('/admin/reservations', { params })
+  },
+
+  // 导出数据（type: reservations | borrows | users），数据量大时耗时较长，不设超时
+  exportData(type, params) {
+    return api.get(`/admin/export/${type}`, { params, responseType: 'blob', timeout: 0 })
   }
 }